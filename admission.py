@@ -0,0 +1,271 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import metrics
+
+# Agent runs / insights requests executing at once across all users (0 disables admission control).
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "8"))
+
+# In-flight plus queued requests allowed per user; more are rejected right away.
+ADMISSION_PER_USER = int(os.getenv("ADMISSION_PER_USER", "2"))
+
+# Requests allowed to wait for a free slot; beyond this new requests get a 429.
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+
+# Seconds a queued request waits for a slot before it is rejected.
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+# Priority classes; lower values are admitted first.
+INTERACTIVE = 0  # /chat
+BATCH = 1  # /api/insights, /api/insights/batch
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+class Rejected(Exception):
+    """The request was not admitted; retry after `retry_after` seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server busy ({reason}); retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's slot; release it when the work is done.
+
+    `slot` tells whether it holds one of the global in-flight slots and
+    `charge_user` whether it counts against its user's limit.
+    """
+
+    def __init__(self, controller, user, priority, waited, slot=True, charge_user=True):
+        self._controller = controller
+        self.user = user
+        self.priority = priority
+        self.waited = waited
+        self.slot = slot
+        self.charge_user = charge_user
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        """Frees the slot; safe to call more than once."""
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class _Waiter:
+    def __init__(self, user, priority, wake, charge_user):
+        self.user = user
+        self.priority = priority
+        self.charge_user = charge_user
+        self.enqueued = time.monotonic()
+        self.wake = wake
+        self.granted = False
+        self.ticket = None
+
+
+class AdmissionController:
+    """Caps concurrent agent work globally and per user, with a bounded priority queue.
+
+    Requests that can't start right away wait in a queue ordered by priority
+    class (then arrival) for at most `max_wait` seconds. When the queue is full
+    or a user already has `per_user` requests in the system, `acquire` fails
+    immediately with `Rejected`, whose `retry_after` estimates when capacity
+    frees up, so overload turns into fast 429s instead of unbounded latency.
+    """
+
+    def __init__(self, max_inflight=ADMISSION_MAX_INFLIGHT, per_user=ADMISSION_PER_USER,
+                 max_queue=ADMISSION_MAX_QUEUE, max_wait=ADMISSION_MAX_WAIT):
+        self.max_inflight = max_inflight
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._by_user = {}
+        self._queue = []
+        self._queued = {p: 0 for p in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        # Moving average of how long admitted work holds its slot, for Retry-After
+        self._avg_hold = 5.0
+        self._admitted = 0
+        self._rejected = {}
+
+    @property
+    def enabled(self):
+        return self.max_inflight > 0
+
+    def _retry_after(self):
+        # Time until the queue ahead drains at the observed rate, at least a second
+        waves = (len(self._queue) + 1) / max(self.max_inflight, 1)
+        return max(1, math.ceil(self._avg_hold * waves))
+
+    def _reject(self, reason):
+        self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        metrics.ADMISSION_REJECTED.inc(reason=reason)
+        return Rejected(reason, self._retry_after())
+
+    def _charge(self, user, delta):
+        count = self._by_user.get(user, 0) + delta
+        if count:
+            self._by_user[user] = count
+        else:
+            self._by_user.pop(user, None)
+
+    def _grant(self, user, priority, waited, charge_user=True):
+        self._inflight += 1
+        if charge_user:
+            self._charge(user, 1)
+        self._admitted += 1
+        metrics.ADMISSION_INFLIGHT.set(self._inflight)
+        metrics.ADMISSION_WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES[priority])
+        return Ticket(self, user, priority, waited, charge_user=charge_user)
+
+    def _set_queued(self, priority, delta):
+        self._queued[priority] += delta
+        metrics.ADMISSION_QUEUED.set(self._queued[priority], priority=PRIORITY_NAMES[priority])
+
+    def _enter(self, user, priority, wake, slot=True, charge_user=True):
+        # Returns a Ticket, or the queued _Waiter; caller holds the lock
+        if charge_user and self.per_user > 0 and self._by_user.get(user, 0) >= self.per_user:
+            raise self._reject("user_limit")
+        if not slot:
+            self._charge(user, 1)
+            return Ticket(self, user, priority, 0.0, slot=False)
+        if self._inflight < self.max_inflight and not self._queue:
+            return self._grant(user, priority, 0.0, charge_user)
+        if len(self._queue) >= self.max_queue:
+            raise self._reject("queue_full")
+        waiter = _Waiter(user, priority, wake, charge_user)
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._set_queued(priority, 1)
+        # Queued requests count against their user's limit too
+        if charge_user:
+            self._charge(user, 1)
+        return waiter
+
+    def _dispatch(self):
+        # Hands free slots to the highest-priority waiters; caller holds the lock
+        while self._queue and self._inflight < self.max_inflight:
+            _, _, waiter = heapq.heappop(self._queue)
+            self._set_queued(waiter.priority, -1)
+            waiter.granted = True
+            if waiter.charge_user:
+                self._charge(waiter.user, -1)
+            waiter.ticket = self._grant(waiter.user, waiter.priority, time.monotonic() - waiter.enqueued,
+                                        waiter.charge_user)
+            waiter.wake()
+
+    def _cancel(self, waiter):
+        # Takes a queued request out of the queue; returns its ticket if it was granted meanwhile
+        with self._lock:
+            if waiter.granted:
+                return waiter.ticket
+            self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+            heapq.heapify(self._queue)
+            self._set_queued(waiter.priority, -1)
+            if waiter.charge_user:
+                self._charge(waiter.user, -1)
+            return None
+
+    def _timed_out(self, waiter):
+        ticket = self._cancel(waiter)
+        if ticket is not None:
+            return ticket
+        with self._lock:
+            raise self._reject("timeout")
+
+    def _release(self, ticket):
+        with self._lock:
+            if ticket.charge_user:
+                self._charge(ticket.user, -1)
+            if not ticket.slot:
+                return
+            self._inflight -= 1
+            held = time.monotonic() - ticket.started
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            metrics.ADMISSION_INFLIGHT.set(self._inflight)
+            self._dispatch()
+
+    def acquire(self, user, priority=INTERACTIVE, slot=True, charge_user=True):
+        """Blocks until `user` may start work of the given priority; returns a Ticket.
+
+        A batch takes a ticket with `slot=False` (it only counts against its
+        user's limit, never waits) and one with `charge_user=False` per CA
+        API stream it fans out to, so each stream occupies a global slot.
+
+        Raises:
+            Rejected: If the user is at their limit, the queue is full, or no
+                slot freed up within `max_wait` seconds.
+        """
+        if not self.enabled:
+            return Ticket(_NoController, user, priority, 0.0)
+        event = threading.Event()
+        with self._lock:
+            entered = self._enter(user, priority, event.set, slot, charge_user)
+        if isinstance(entered, Ticket):
+            return entered
+        if event.wait(self.max_wait):
+            return entered.ticket
+        return self._timed_out(entered)
+
+    async def acquire_async(self, user, priority=INTERACTIVE, slot=True, charge_user=True):
+        """`acquire` for callers on an event loop; waits without blocking the loop."""
+        if not self.enabled:
+            return Ticket(_NoController, user, priority, 0.0)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            entered = self._enter(user, priority, wake, slot, charge_user)
+        if isinstance(entered, Ticket):
+            return entered
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            return self._timed_out(entered)
+        except asyncio.CancelledError:
+            # The client went away while queued; don't leak a slot granted meanwhile
+            ticket = self._cancel(entered)
+            if ticket is not None:
+                ticket.release()
+            raise
+        return entered.ticket
+
+    def load(self):
+        """Returns the (in-flight, queued) request counts."""
+        with self._lock:
+            return self._inflight, len(self._queue)
+
+    def stats(self):
+        """Returns in-flight and queued counts, limits and rejections."""
+        with self._lock:
+            oldest = min((w.enqueued for _, _, w in self._queue), default=None)
+            return {
+                "enabled": self.enabled,
+                "inflight": self._inflight,
+                "max_inflight": self.max_inflight,
+                "per_user": self.per_user,
+                "queued": {PRIORITY_NAMES[p]: n for p, n in self._queued.items()},
+                "max_queue": self.max_queue,
+                "oldest_wait_s": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                "avg_hold_s": round(self._avg_hold, 3),
+                "admitted": self._admitted,
+                "rejected": dict(self._rejected),
+            }
+
+
+class _NoController:
+    """Stands in for the controller behind tickets issued while admission control is disabled."""
+
+    @staticmethod
+    def _release(ticket):
+        pass
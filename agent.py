@@ -1,108 +1,128 @@
 import os
-import json
+import time
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
+import hashlib
 import threading
-from google.cloud import geminidataanalytics
-from google.adk.agents import Agent
-from google.adk.tools import agent_tool
-import google.auth
-import google.auth.transport.requests
-import vertexai
-from vertexai.preview import reasoning_engines
+import contextvars
+import ca_client
+import looker_auth
+import result_cache
+import events
+import log_utils
+import charts
+import results
+import result_store
+import metrics
+import explore_index
+import compaction
+import model_router
+import state
 
 # Configuration - In a real app, use environment variables
 LOOKER_CLIENT_ID = os.getenv("LOOKER_CLIENT_ID")
 LOOKER_CLIENT_SECRET = os.getenv("LOOKER_CLIENT_SECRET")
 LOOKER_INSTANCE_URI = os.getenv("LOOKER_INSTANCE_URI")
+# Default explore; EXPLORES (see explore_index.py) lists all explores questions can be routed to
 LOOKML_MODEL = os.getenv("LOOKML_MODEL", "gaming")
 EXPLORE = os.getenv("EXPLORE", "events")
 PROJECT_ID = os.getenv("PROJECT_ID", "aragosalooker")
 LOCATION = os.getenv("LOCATION", "us-central1")
 
-import queue
-thought_queue = None
+log_utils.configure_logging()
 
-def log_debug(message):
-    """Logs a debug message to Cloud Logging only."""
-    print(f"DEBUG: {message}")
+# Results with more rows than this are handed to the model as a summary
+# (schema, row count, column stats and the first SAMPLE_ROWS rows); the full
+# data is fetched by the frontend via its result_id. 0 disables the handoff.
+HANDOFF_ROWS = int(os.getenv("INSIGHTS_HANDOFF_ROWS", "100"))
+SAMPLE_ROWS = int(os.getenv("INSIGHTS_SAMPLE_ROWS", "20"))
 
-def log_thought(message):
-    """Logs a thought to the queue for the frontend to consume."""
-    print(f"Logging thought: {message}")
-    if thought_queue:
-        thought_queue.put(message)
+# Rows streamed to the frontend as a live preview while the agent is still
+# working, sent in batches of PREVIEW_BATCH_ROWS. 0 disables the preview.
+PREVIEW_ROWS = int(os.getenv("STREAM_PREVIEW_ROWS", "500"))
+PREVIEW_BATCH_ROWS = int(os.getenv("STREAM_PREVIEW_BATCH_ROWS", "100"))
 
-# Thread-local storage for request-scoped data (like user tokens)
-_thread_local = threading.local()
+logger = log_utils.get_logger("agent")
 
-def set_access_token(token):
-    """Sets the Looker access token for the current thread."""
-    _thread_local.access_token = token
+def log_debug(message, *args):
+    """Logs a debug message to Cloud Logging only.
 
-def get_access_token():
-    """Gets the Looker access token for the current thread."""
-    return getattr(_thread_local, 'access_token', None)
+    Arguments are %-formatted lazily, so nothing is formatted unless DEBUG is enabled.
+    """
+    logger.debug(message, *args)
 
-def get_insights(question: str):
-    """Queries the Conversational Analytics API using a question as input.
+def log_thought(message):
+    """Publishes a thought to the current request's event bus for the frontend to consume."""
+    logger.info("Thought: %s", message)
+    events.publish("thought", message)
 
-    Use this tool to generate the data for data insights.
+# Request-scoped data (like user tokens). These are context variables rather
+# than thread-locals because ADK executes tools on its own runner thread, which
+# inherits a copy of the caller's context but not its thread-local storage.
+_access_token = contextvars.ContextVar("access_token", default=None)
+_access_token_expires_at = contextvars.ContextVar("access_token_expires_at", default=None)
 
-    Args:
-        question: The question to post to the API.
+def set_access_token(token, expires_at=None):
+    """Sets the Looker access token (and its expiry, if known) for the current request."""
+    _access_token.set(token)
+    _access_token_expires_at.set(expires_at)
 
-    Returns:
-        A dictionary containing the status of the operation and the insights from
-        the API, categorized by type (e.g., text_insights, data_insights) to make
-        the output easier for an LLM to understand and process.
-    """
+def get_access_token():
+    """Gets the Looker access token for the current request."""
+    return _access_token.get()
 
-    data_chat_client = geminidataanalytics.DataChatServiceClient()
+def get_access_token_expiry():
+    """Gets the expiry (epoch seconds) of the current request's access token, if known."""
+    return _access_token_expires_at.get()
 
-    # Check for user-specific access token
-    user_token = get_access_token()
+SYSTEM_INSTRUCTION = """You are a specialized AI data analyst for a mobile gaming company. Your primary function is to answer natural language questions from a user by constructing and executing precise queries against a Looker instance.
     
+    When you generate a response with data, you MUST include a JSON block with type `json-metadata` containing the query details (filters, sorts, fields) AND the generated SQL query in a field named `sql`.
+    """
+
+def build_credentials(user_token=None):
+    """Builds the Looker credentials for a user token, or the service account if None."""
+    from google.cloud import geminidataanalytics
     if user_token:
-        log_debug("Using user-specific Looker access token.")
-        credentials = geminidataanalytics.Credentials(
+        return geminidataanalytics.Credentials(
             oauth=geminidataanalytics.OAuthCredentials(
                 token=geminidataanalytics.OAuthCredentials.TokenBased(
                     access_token=user_token
                 )
             )
         )
-    else:
-        log_debug("Using service account Looker credentials.")
-        credentials = geminidataanalytics.Credentials(
-            oauth=geminidataanalytics.OAuthCredentials(
-                secret=geminidataanalytics.OAuthCredentials.SecretBased(
-                    client_id=LOOKER_CLIENT_ID, client_secret=LOOKER_CLIENT_SECRET
-                ),
-            )
+    return geminidataanalytics.Credentials(
+        oauth=geminidataanalytics.OAuthCredentials(
+            secret=geminidataanalytics.OAuthCredentials.SecretBased(
+                client_id=LOOKER_CLIENT_ID, client_secret=LOOKER_CLIENT_SECRET
+            ),
         )
-
-    looker_explore_reference = geminidataanalytics.LookerExploreReference(
-        looker_instance_uri=LOOKER_INSTANCE_URI, lookml_model=LOOKML_MODEL, explore=EXPLORE
     )
 
+def build_inline_context(user_token=None, explores=None):
+    """Builds the inline Context (datasource references and options) for a set of credentials and explores."""
+    from google.cloud import geminidataanalytics
+    explores = explores or explore_index.get_index().default
+    looker_explore_references = [
+        geminidataanalytics.LookerExploreReference(
+            looker_instance_uri=LOOKER_INSTANCE_URI, lookml_model=e.model, explore=e.explore
+        )
+        for e in explores
+    ]
+
     # Connect to your Looker datasource
     datasource_references = geminidataanalytics.DatasourceReferences(
         looker=geminidataanalytics.LookerExploreReferences(
-            explore_references=[looker_explore_reference],
-            credentials=credentials 
+            explore_references=looker_explore_references,
+            credentials=build_credentials(user_token)
         ),
     )
 
-    system_instruction = """You are a specialized AI data analyst for a mobile gaming company. Your primary function is to answer natural language questions from a user by constructing and executing precise queries against a Looker instance.
-    
-    When you generate a response with data, you MUST include a JSON block with type `json-metadata` containing the query details (filters, sorts, fields) AND the generated SQL query in a field named `sql`.
-    """
-
     # Context set-up for 'Chat using Inline Context'
-    inline_context = geminidataanalytics.Context(
-        system_instruction=system_instruction,
+    return geminidataanalytics.Context(
+        system_instruction=SYSTEM_INSTRUCTION,
         datasource_references=datasource_references,
         options=geminidataanalytics.ConversationOptions(
             analysis=geminidataanalytics.AnalysisOptions(
@@ -113,6 +133,126 @@ def get_insights(question: str):
         ),
     )
 
+def forward_insight(payload):
+    """Streams a partial insight (text, schema, SQL, rows) to the current request as soon as it is parsed."""
+    events.publish("insight", payload)
+
+def forward_rows(result):
+    """Streams a result's columns and its first PREVIEW_ROWS rows in batches."""
+    if events.get_current_bus() is None or PREVIEW_ROWS <= 0:
+        return
+    labels = result.labels()
+    names = list(result.columns)
+    forward_insight({"type": "columns", "columns": [{"name": n, "label": labels[n]} for n in names]})
+    cols = [result.columns[n] for n in names]
+    limit = min(result.num_rows, PREVIEW_ROWS)
+    for start in range(0, limit, PREVIEW_BATCH_ROWS):
+        stop = min(start + PREVIEW_BATCH_ROWS, limit)
+        rows = [[c[i] for c in cols] for i in range(start, stop)]
+        forward_insight({"type": "rows", "offset": start, "rows": rows, "total_rows": result.num_rows})
+
+# Process-wide cache of get_insights results (see result_cache.py for settings)
+insights_cache = result_cache.ResultCache()
+
+def get_insights(question: str):
+    """Queries the Conversational Analytics API using a question as input.
+
+    Use this tool to generate the data for data insights.
+
+    Args:
+        question: The question to post to the API.
+
+    Returns:
+        A dictionary containing the status of the operation and the insights from
+        the API, categorized by type (e.g., text_insights, data_insights) to make
+        the output easier for an LLM to understand and process.
+    """
+    # The model tabulates the rows as they are, so they carry display labels
+    return query_insights(question, handoff_rows=HANDOFF_ROWS, labeled=True)
+
+def query_insights(question, columnar=False, handoff_rows=0, labeled=False):
+    """Answers a question through the result cache, in row or columnar form.
+
+    Args:
+        question: The question to post to the API.
+        columnar: If True, results are returned as per-column arrays
+            (`columns`, `num_rows`) instead of a list of row dictionaries.
+        handoff_rows: If > 0, results with more rows are summarized (schema,
+            row count, stats, first rows) and referenced by `result_id`.
+        labeled: Key rows by field label instead of field name.
+    """
+    # Only the explores relevant to the question are attached to the request
+    explores = explore_index.get_index().route(question)
+    key = result_cache.make_key(
+        question,
+        ",".join(e.model for e in explores),
+        ",".join(e.explore for e in explores),
+        looker_auth.owner_key(get_access_token()),
+    )
+    with metrics.span("insights"):
+        response, source = insights_cache.get_or_compute(
+            key,
+            lambda: _fetch_shared(key, question, explores),
+            should_cache=lambda r: bool(r.get("data_insights") or r.get("text_insights")),
+        )
+    metrics.CACHE.inc(result=source)
+    if source == "hit":
+        log_thought(f"Using cached result for: {question}")
+    elif source == "coalesced":
+        log_thought(f"Reused result of an identical in-flight query: {question}")
+    # The cache holds the compact columnar form; rows are only built on the way out
+    return results.materialize(response, columnar=columnar, handoff_rows=handoff_rows, sample_rows=SAMPLE_ROWS,
+                               labeled=labeled)
+
+def _fetch_shared(key, question, explores):
+    """`_fetch_insights` through the shared store when STATE_BACKEND is shared.
+
+    The local insights_cache still coalesces and serves this worker's repeats;
+    the shared copy lets other workers (e.g. the one a prefetched question's
+    user lands on next) skip the CA API too.
+    """
+    if not state.is_shared() or result_cache.CACHE_TTL <= 0:
+        return _fetch_insights(question, explores)
+    store = state.get_store()
+    store_key = state.key("insights", hashlib.sha256(repr(key).encode("utf-8")).hexdigest())
+    raw = store.get(store_key)
+    if raw is not None:
+        log_debug("Shared insights cache hit for: %s", question)
+        return results.loads_response(raw)
+    response = _fetch_insights(question, explores)
+    if response.get("data_insights") or response.get("text_insights"):
+        store.set(store_key, results.dumps_response(response), result_cache.CACHE_TTL)
+    return response
+
+def _fetch_insights(question, explores):
+    """Runs a question through the Conversational Analytics API (uncached) against `explores`."""
+    # Imported here so module import stays cheap (see get_app)
+    from google.cloud import geminidataanalytics
+    from google.api_core import exceptions as google_exceptions
+
+    data_chat_client = ca_client.get_client()
+
+    # Check for user-specific access token
+    user_token = get_access_token()
+    
+    if user_token:
+        log_debug("Using user-specific Looker access token.")
+    else:
+        log_debug("Using service account Looker credentials.")
+
+    # The inline context only depends on the caller's credentials and the
+    # explores, so it is built once per token and explore set and reused
+    # until the token expires.
+    credential_key = ca_client.credential_key(user_token)
+    inline_context = ca_client.get_context(
+        credential_key,
+        lambda: build_inline_context(user_token, explores),
+        expires_at=get_access_token_expiry(),
+        variant=tuple(e.key for e in explores),
+    )
+    if len(explores) > 1 or explores != explore_index.get_index().default:
+        log_debug("Routed to explores: %s", [e.key for e in explores])
+
     messages = [geminidataanalytics.Message()]
     messages[0].user_message.text = question
 
@@ -127,9 +267,13 @@ def get_insights(question: str):
     # Make the request
     try:
         log_thought("Querying Looker data...")
+        request_started = time.perf_counter()
         stream = data_chat_client.chat(request=request)
     except Exception as e:
         log_thought(f"Error querying data: {e}")
+        if isinstance(e, (google_exceptions.Unauthenticated, google_exceptions.PermissionDenied)):
+            # Don't keep handing out a context built from rejected credentials
+            ca_client.evict_context(credential_key)
         raise e
 
     # Categorize insights from the stream for a more descriptive output
@@ -138,152 +282,120 @@ def get_insights(question: str):
     data_insights = []
 
     log_thought("Processing results...")
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     
     # Iterate through the stream
+    stream_started = None
     for i, item in enumerate(stream):
+        if stream_started is None:
+            stream_started = time.perf_counter()
+            metrics.record("ca_first_chunk", stream_started - request_started)
         kind = item._pb.WhichOneof("kind")
-        log_debug(f"Stream Chunk {i} Kind: {kind}")
+        log_chunk = debug_enabled and log_utils.should_log_chunk(i)
+        if log_chunk:
+            log_debug("Stream Chunk %d Kind: %s", i, kind)
         
         if kind == "system_message":
-            message_dict = geminidataanalytics.SystemMessage.to_dict(
-                item.system_message
-            )
-            log_debug(f"Chunk {i} Content Keys: {list(message_dict.keys())}")
+            message_kind = item._pb.system_message.WhichOneof("kind")
+            if log_chunk:
+                log_debug("Chunk %d Content Kind: %s", i, message_kind)
             
-            if "text" in message_dict:
-                log_debug(f"Chunk {i} Text: {message_dict['text']}")
-                text_insights.append(message_dict["text"])
-            elif "schema" in message_dict:
-                log_debug(f"Chunk {i} Schema: {message_dict['schema']}")
-                schema_insights.append(message_dict["schema"])
-            elif "data" in message_dict:
-                log_debug(f"Chunk {i} Data: {message_dict['data']}")
-                data_insights.append(message_dict["data"])
+            if message_kind == "text":
+                text = geminidataanalytics.TextMessage.to_dict(item.system_message.text)
+                if log_chunk:
+                    log_debug("Chunk %d Text: %s", i, log_utils.truncate(text))
+                text_insights.append(text)
+                forward_insight({"type": "text", "text": "".join(text.get("parts", []))})
+            elif message_kind == "schema":
+                schema = geminidataanalytics.SchemaMessage.to_dict(item.system_message.schema)
+                if log_chunk:
+                    log_debug("Chunk %d Schema: %s", i, log_utils.truncate(schema))
+                schema_insights.append(schema)
+                forward_insight({"type": "schema", "schema": schema})
+            elif message_kind == "data":
+                # Result rows are read straight into columns, without an
+                # intermediate list of row dictionaries
+                data = results.data_message_to_dict(item.system_message.data)
+                if log_chunk:
+                    log_debug("Chunk %d Data Keys: %s", i, list(data.keys()))
+                data_insights.append(data)
                 
                 # Extract and log the SQL query if available
-                result_data = message_dict['data'].get('result', {})
-                if 'sql' in result_data:
-                     log_debug(f"Generated SQL: {result_data['sql']}")
+                if 'generated_sql' in data:
+                     log_debug("Generated SQL: %s", log_utils.truncate(data['generated_sql']))
+                     forward_insight({"type": "sql", "sql": data['generated_sql']})
                 
-                # Check for Explore URL
-                if 'explore_url' in result_data:
-                    url = result_data['explore_url']
-                else:
-                    try:
-                        # Fallback: Generate URL from schema fields
-                        fields = [f['name'] for f in result_data.get('schema', {}).get('fields', []) if 'name' in f]
-                        
-                        if fields:
-                            fields_str = ",".join(fields)
-                            base_uri = LOOKER_INSTANCE_URI.rstrip('/')
-                            fallback_url = f"{base_uri}/explore/{LOOKML_MODEL}/{EXPLORE}?fields={fields_str}&toggle=dat,pik,vis"
-                            
-                            # Inject into result_data
-                            result_data['explore_url'] = fallback_url
-                    except Exception as e:
-                        log_debug(f"Error generating fallback URL: {e}")
-                        pass
+                result_data = data.get('result')
+                if result_data is not None:
+                    log_debug("Chunk %d Data: %d rows, columns %s", i, result_data.num_rows, log_utils.truncate(list(result_data.columns)))
+                    index = explore_index.get_index()
+                    # Labels the CA API left out come from the explore index
+                    index.label_fields(result_data.fields)
+                    # Fallback: Generate URL from schema fields
+                    if 'explore_url' not in result_data.extras:
+                        fields = [f['name'] for f in result_data.fields if f.get('name')]
+                        explore_url = index.explore_url(fields, explores)
+                        if explore_url:
+                            result_data.extras['explore_url'] = explore_url
+                    forward_rows(result_data)
         elif kind == "tool_use":
-             log_debug(f"Chunk {i} Tool Use: {item.tool_use}")
+             if log_chunk:
+                 log_debug("Chunk %d Tool Use: %s", i, log_utils.truncate(item.tool_use))
              pass
         elif kind == "tool_output":
-             log_debug(f"Chunk {i} Tool Output: {item.tool_output}")
+             if log_chunk:
+                 log_debug("Chunk %d Tool Output: %s", i, log_utils.truncate(item.tool_output))
              pass
     
     # Wait for stream to complete
+    if stream_started is not None:
+        metrics.record("ca_stream", time.perf_counter() - stream_started)
     log_thought("Stream processing complete.")
-    log_debug(f"Data Insights Chunks: {len(data_insights)}")
+    log_debug("Data Insights Chunks: %d", len(data_insights))
 
-    # Post-process data_insights to merge chunks
+    # Merge data chunks (query, generated SQL, result) into one insight
     merged_data = {}
-    try:
-        for d in data_insights:
-            for k, v in d.items():
-                merged_data[k] = v
-        
-        # Robust serialization
-        def json_default(obj):
-            if hasattr(obj, 'to_dict'):
-                return obj.to_dict()
-            return str(obj)
-            
-        merged_data = json.loads(json.dumps(merged_data, default=json_default))
-        log_debug("Merged data serialization successful.")
-        
-        # Rename keys in rows using field labels for better formatting
-        if 'result' in merged_data and 'schema' in merged_data['result'] and 'rows' in merged_data['result']:
-            try:
-                fields = merged_data['result']['schema'].get('fields', [])
-                field_map = {}
-                for f in fields:
-                    # Prefer label, then title, then name
-                    # Looker API usually provides 'title' or 'label_short' or 'label'
-                    label = f.get('label_short') or f.get('label') or f.get('title') or f.get('name')
-                    if 'name' in f:
-                        field_map[f['name']] = label
-                
-                if field_map:
-                    new_rows = []
-                    for row in merged_data['result']['rows']:
-                        new_row = {}
-                        for k, v in row.items():
-                            new_row[field_map.get(k, k)] = v
-                        new_rows.append(new_row)
-                    merged_data['result']['rows'] = new_rows
-                    log_debug("Renamed row keys using field labels.")
-            except Exception as e:
-                log_debug(f"Error renaming keys: {e}")
-        
-    except Exception as e:
-        log_thought(f"Error merging/serializing data: {e}")
-        merged_data = {} 
+    for d in data_insights:
+        merged_data.update(d)
+
+    # Keep the full result server-side so it can be fetched by ID
+    if merged_data.get('result') is not None:
+        owner = looker_auth.owner_key(user_token)
+        merged_data['result'].extras['result_id'] = result_store.put(merged_data['result'], owner)
 
     # Build a descriptive response dictionary
     response = {"status": "success"}
-    
-    # Helper for other insights
-    def make_serializable(obj):
-        if isinstance(obj, dict):
-            return {k: make_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [make_serializable(v) for v in obj]
-        elif hasattr(obj, 'to_dict'):
-            return make_serializable(obj.to_dict())
-        elif hasattr(obj, '__dict__'):
-            return make_serializable(obj.__dict__)
-        else:
-            return obj
 
     if text_insights:
-        response["text_insights"] = make_serializable(text_insights)
+        response["text_insights"] = text_insights
     if schema_insights:
-        response["schema_insights"] = make_serializable(schema_insights)
+        response["schema_insights"] = schema_insights
     if merged_data:
         response["data_insights"] = [merged_data]
+        result_data = merged_data.get('result')
+
+        # Most charts follow directly from the result schema; only fall back
+        # to the VisualizationAgent when the rules can't decide.
+        if charts.RULE_BASED_CHARTS and result_data is not None and result_data.num_rows > 1:
+            try:
+                chart = charts.build_chart(result_data)
+                if chart:
+                    response["chart"] = chart
+                    log_debug("Built %s chart from schema.", chart['type'])
+            except Exception as e:
+                log_debug("Error building chart: %s", e)
         
         # Log summary of the data
-        try:
-            data_keys = list(merged_data.keys())
-            log_debug(f"Final Merged Data Keys: {data_keys}")
-            if 'result' in merged_data:
-                result_keys = list(merged_data['result'].keys())
-                log_debug(f"Result Keys: {result_keys}")
-                if 'data' in merged_data['result']:
-                    data_len = len(merged_data['result']['data'])
-                    log_thought(f"Data Rows Count: {data_len}")
-                    if data_len > 0:
-                        log_debug(f"First Row Sample: {merged_data['result']['data'][0]}")
-        except Exception as e:
-            log_debug(f"Error logging summary: {e}")
+        log_debug("Final Merged Data Keys: %s", list(merged_data.keys()))
+        if result_data is not None:
+            metrics.ROWS.inc(result_data.num_rows)
+            log_thought(f"Data Rows Count: {result_data.num_rows}")
+            if debug_enabled and result_data.num_rows > 0:
+                log_debug("First Row Sample: %s", log_utils.truncate(next(result_data.rows())))
 
     return response
 
-# Agent to get data insights
-data_agent = Agent(
-    model="gemini-2.5-pro",
-    name="DataAgent",
-    description="Retrieves raw data from Looker based on user questions.",
-    instruction="""You are an agent that retrieves raw data. The tool 'get_insights' queries a governed semantic layer.
+DATA_AGENT_INSTRUCTION = """You are an agent that retrieves raw data. The tool 'get_insights' queries a governed semantic layer.
     Your task is to call the 'get_insights' tool with the user's question.
     
     The tool returns a dictionary. You need to extract three things:
@@ -313,16 +425,9 @@ data_agent = Agent(
     }
     
     Do not add any other text. Just the raw JSON string.
-    """,
-    tools=[get_insights],
-)
-
-# Visualization Agent
-visualization_agent = Agent(
-    model="gemini-2.5-pro",
-    name="VisualizationAgent",
-    description="Tool that generates the specific JSON configuration required for rendering charts. Use this whenever the user asks for a visualization or the data represents a trend.",
-    instruction="""You are a data visualization expert. Your task is to take raw data (in JSON format) and a user question, and generate a JSON configuration for a Recharts chart.
+    """
+
+VISUALIZATION_AGENT_INSTRUCTION = """You are a data visualization expert. Your task is to take raw data (in JSON format) and a user question, and generate a JSON configuration for a Recharts chart.
     
     The output must be a valid JSON object with the following structure:
     {
@@ -346,18 +451,13 @@ visualization_agent = Agent(
     2. Map the `xAxisKey` and `dataKey` exactly to the keys present in the `data` array.
     3. Return ONLY the JSON string. Do not add markdown formatting or explanations.
     """
-)
-
-# ... (rest of the file)
 
-root_agent = Agent(
-    model="gemini-2.5-pro",
-    name="CA_API",
-    instruction="""You are a helpful mobile gaming data analyst.
+ROOT_AGENT_INSTRUCTION = """You are a helpful mobile gaming data analyst.
     
     Your goal is to answer user questions about their game data.
     
     1.  **Use the `get_insights` tool** to retrieve data from Looker.
+        -   Pass the user's question **verbatim** as `question`; do not rephrase it. Suggested follow-ups are answered ahead of time under their exact wording, so a rephrased question misses the cache and queries Looker again.
     2.  **Analyze the tool output**:
         -   Look for `data_insights` which contains the actual query results.
         -   Look for `text_insights` for any additional context or SQL queries.
@@ -367,9 +467,11 @@ root_agent = Agent(
         -   **Step 2**: **ALWAYS** output the `insight['result']['data']` list as a Markdown table.
             -   If it's a single value, make a one-row table.
             -   If it's multiple rows, make a full table.
-        -   **Step 3**: If the `data` list has multiple rows (e.g. time series, categories), **YOU MUST CALL** the `VisualizationAgent` tool.
+            -   If `insight['result']['truncated']` is true, `data` only holds the first rows of `row_count` rows. Tabulate those rows, then output `insight['result']['result_id']` on a new line prefixed with `RESULT: ` so the full result can be loaded. Base any totals or comparisons on `insight['result']['stats']`, not on the sample.
+        -   **Step 3**: If the tool output contains a `chart` object, output it exactly as given in a code block with the language `json-chart` and do NOT call `VisualizationAgent`.
+        -   **Step 4**: Otherwise, if the `data` list has multiple rows (e.g. time series, categories), **YOU MUST CALL** the `VisualizationAgent` tool.
             -   Pass ONLY the `data` list (not the full object) to `VisualizationAgent` and wait for its response.
-        -   **Step 4**: Output the JSON returned by `VisualizationAgent` in a code block with the language `json-chart`.
+            -   Output the JSON returned by `VisualizationAgent` in a code block with the language `json-chart`.
         -   **Step 5**: **CRITICAL**: Check for the `explore_url` in `insight['result']`. 
             -   If found, output it on a new line prefixed with `LINK: `.
             -   Example: `LINK: https://looker.example.com/...`
@@ -392,10 +494,11 @@ root_agent = Agent(
         -   **CRITICAL**: For charts, use the `json-chart` language tag.
         -   **CRITICAL**: For metadata, use the `json-metadata` language tag.
         -   **CRITICAL**: You MUST output the `LINK:` line if an explore_url exists.
+        -   **CRITICAL**: You MUST output the `RESULT:` line if the result is truncated.
         -   **CRITICAL**: For suggestions, use the format: `SUGGESTION: What is...`
           Example:
           ```json-chart
-          { ... json from VisualizationAgent ... }
+          { ... the tool's `chart`, or the json from VisualizationAgent ... }
           ```
           LINK: https://looker.example.com/explore/...
           SUGGESTION: Break this down by country?
@@ -403,20 +506,98 @@ root_agent = Agent(
     
     5.  **Important**:
         -   Do NOT hallucinate data. Use ONLY what is returned by the tools.
-        -   If the user asks for a chart, you MUST use the `VisualizationAgent`.
-    """,
-    tools=[
-        get_insights, 
-        # Wrap the sub-agent as a tool
-        agent_tool.AgentTool(agent=visualization_agent)
-    ],
-)
+        -   If the user asks for a chart and the tool output has no `chart`, you MUST use the `VisualizationAgent`.
+    """
+
+# The agent graph and the AdkApp are built on first use rather than at import,
+# so importing this module (and server.py) doesn't pay for ADK / Vertex AI.
+_agents = None
+_agents_lock = threading.Lock()
+_app = None
+_app_lock = threading.Lock()
+
+def _build_agents():
+    """Builds the root agent and its sub-agents."""
+    from google.adk.agents import Agent
+    from google.adk.tools import agent_tool
+
+    # Simple turns run on model_router.FAST_MODEL (see model_router.py). Routing
+    # comes before compaction, which sizes the history for the routed model.
+    route = model_router.routing_callback()
+
+    # Agent to get data insights
+    data_agent = Agent(
+        model=model_router.DATA_AGENT_MODEL,
+        name="DataAgent",
+        description="Retrieves raw data from Looker based on user questions.",
+        instruction=DATA_AGENT_INSTRUCTION,
+        tools=[get_insights],
+        before_model_callback=[route, compaction.before_model_callback, metrics.before_model_callback],
+        after_model_callback=metrics.after_model_callback,
+        on_model_error_callback=metrics.on_model_error_callback,
+    )
+
+    # Visualization Agent (whole runs are timed as the "visualization" stage)
+    visualization_span = metrics.agent_span_callbacks("visualization")
+    visualization_agent = Agent(
+        model=model_router.VISUALIZATION_AGENT_MODEL,
+        name="VisualizationAgent",
+        description="Tool that generates the specific JSON configuration required for rendering charts. Use this whenever the user asks for a visualization or the data represents a trend.",
+        instruction=VISUALIZATION_AGENT_INSTRUCTION,
+        before_model_callback=[model_router.routing_callback("formatting"), compaction.before_model_callback, metrics.before_model_callback],
+        after_model_callback=metrics.after_model_callback,
+        on_model_error_callback=metrics.on_model_error_callback,
+        before_agent_callback=visualization_span[0],
+        after_agent_callback=visualization_span[1],
+    )
+
+    root_agent = Agent(
+        model=model_router.ROOT_AGENT_MODEL,
+        name="CA_API",
+        instruction=ROOT_AGENT_INSTRUCTION,
+        tools=[
+            get_insights, 
+            # Wrap the sub-agent as a tool
+            agent_tool.AgentTool(agent=visualization_agent)
+        ],
+        before_model_callback=[route, compaction.before_model_callback, metrics.before_model_callback],
+        after_model_callback=metrics.after_model_callback,
+        on_model_error_callback=metrics.on_model_error_callback,
+    )
+    return {"data_agent": data_agent, "visualization_agent": visualization_agent, "root_agent": root_agent}
+
+def get_agents():
+    """Returns the agents by name ("root_agent", "data_agent", "visualization_agent")."""
+    global _agents
+    if _agents is None:
+        with _agents_lock:
+            if _agents is None:
+                _agents = _build_agents()
+    return _agents
 
 # vertexai.init is moved to the entry point (chat.py or deploy.py)
 # to avoid hardcoding the staging bucket in the remote environment.
 
-# Create the App
-app = reasoning_engines.AdkApp(
-    agent=root_agent,
-    enable_tracing=False,
-)
+def get_app():
+    """Returns the AdkApp, creating it (and the agents) on first use."""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                from vertexai.preview import reasoning_engines
+                # Create the App
+                _app = reasoning_engines.AdkApp(
+                    agent=get_agents()["root_agent"],
+                    enable_tracing=False,
+                    # Sessions live in the shared store when STATE_BACKEND is set (see state.py)
+                    session_service_builder=state.session_service_builder(),
+                )
+    return _app
+
+def __getattr__(name):
+    # `agent.app` / `from agent import app` keep working, building on first access
+    if name == "app":
+        return get_app()
+    if name in ("root_agent", "data_agent", "visualization_agent"):
+        return get_agents()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
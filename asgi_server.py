@@ -0,0 +1,433 @@
+"""Asyncio (ASGI) entry point serving /chat over Server-Sent Events.
+
+Each open /chat stream costs a coroutine instead of a WSGI thread; the
+blocking ADK and Conversational Analytics calls run on a bounded executor.
+
+Run with:
+    uvicorn asgi_server:app --host 0.0.0.0 --port 8080
+"""
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse, Response
+from starlette.routing import Route
+from starlette.concurrency import iterate_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+import agent
+import events
+import metrics
+import server
+import batch
+import looker_auth
+import json
+import log_utils
+import admission
+import prefetch
+import result_export
+
+logger = log_utils.get_logger("asgi_server")
+
+# Upper bound on concurrently executing agent runs / get_insights calls.
+# Streams beyond this wait for a free worker instead of spawning threads.
+AGENT_WORKERS = int(os.getenv("ASGI_AGENT_WORKERS", "64"))
+
+executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="agent")
+
+
+def get_bearer_token(request):
+    """Returns the Looker access token from the Authorization header, if any."""
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header.split(" ")[1]
+    return None
+
+
+def get_looker_token(request):
+    """Returns (access_token, expires_at, response headers) for the caller.
+
+    A tracked token close to expiry is renewed; the renewed token is returned
+    to the client in the X-Looker-Access-Token header.
+    """
+    sent = get_bearer_token(request)
+    try:
+        expires_at = float(request.headers.get("X-Access-Token-Expires-At") or 0) or None
+    except ValueError:
+        expires_at = None
+    access_token, expires_at = looker_auth.resolve(sent, expires_at)
+    headers = {server.RENEWED_TOKEN_HEADER: access_token} if access_token != sent else {}
+    return access_token, expires_at, headers
+
+
+async def token_expired(request, exc):
+    return JSONResponse({"error": str(exc), "reauth": True}, status_code=401)
+
+
+async def admission_rejected(request, exc):
+    return JSONResponse({"error": str(exc), "reason": exc.reason, "retry_after": exc.retry_after},
+                        status_code=429, headers={"Retry-After": str(exc.retry_after)})
+
+
+async def admit(request, access_token, priority, slot=True):
+    """Waits (without blocking the loop) for an admission slot; raises admission.Rejected when saturated.
+
+    With slot=False only the caller's per-user limit is checked and charged.
+    """
+    user = server.admission_user(access_token, request.headers.get("X-Forwarded-For"),
+                                 request.client.host if request.client else None)
+    return await server.admission_controller.acquire_async(user, priority, slot=slot)
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls `release` once it is done, however it ends.
+
+    A generator's `finally` doesn't run if the client goes away before the
+    first chunk, and background tasks are skipped on some disconnects.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+async def chat(request):
+    data = await request.json()
+    user_input = data.get("message")
+    user_id = data.get("user_id", "web_user")
+    session_id = data.get("session_id", "default_session")
+
+    if not user_input:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    metrics.REQUESTS.inc(route="chat")
+    timings = metrics.start_request()
+    send_timing = metrics.STREAM_TIMING or bool(data.get("timing"))
+    prefetch_suggestions = prefetch.PREFETCH_SUGGESTIONS or bool(data.get("prefetch"))
+
+    loop = asyncio.get_running_loop()
+    # Resolved before the turn starts, so an expired token fails fast with a 401
+    access_token, expires_at, token_headers = await loop.run_in_executor(executor, get_looker_token, request)
+    # Suggestions from the previous turn that the user didn't pick are stale now
+    prefetch_key = (looker_auth.owner_key(access_token), session_id)
+    server.prefetcher.cancel(prefetch_key, keep=user_input)
+    ticket = await admit(request, access_token, admission.INTERACTIVE)
+    # Numbered, replayable events; a dropped client resumes via /chat/runs/{run_id}
+    bus = server.chat_runs.start(looker_auth.owner_key(access_token))
+
+    def run_agent():
+        # Executor threads don't inherit the request's context, so bind it here
+        agent.set_access_token(access_token, expires_at)
+        events.set_current_bus(bus)
+        metrics.bind_request(timings)
+        try:
+            # Unknown sessions are created here, after the response has started
+            with metrics.span("session"):
+                server.ensure_session(user_id, session_id)
+            texts = []
+            with metrics.span("chat"):
+                stream = server.get_agent_app().stream_query(message=user_input, user_id=user_id, session_id=session_id)
+                for chunk in stream:
+                    bus.publish("chunk", chunk)
+                    if prefetch_suggestions:
+                        texts.extend(events.chunk_texts(chunk))
+            if prefetch_suggestions:
+                server.prefetcher.submit(prefetch_key, prefetch.parse_suggestions("\n".join(texts)),
+                                         access_token, expires_at)
+        except Exception as e:
+            metrics.ERRORS.inc(route="chat")
+            server.forget_session_on_error(user_id, session_id, e)
+            bus.publish("error", e)
+        finally:
+            ticket.release()
+            if send_timing:
+                bus.publish("timing", timings.summary())
+            bus.close()
+
+    loop.run_in_executor(executor, run_agent)
+
+    return stream_run(bus, "chat", headers=token_headers)
+
+
+def stream_run(run, route, last_id=0, headers=None):
+    """Streams a run's events after `last_id` as SSE frames carrying event IDs."""
+    async def generate():
+        sent = 0
+        try:
+            async for event_id, type_, payload in run.afollow(last_id):
+                for frame in events.to_sse(type_, payload, event_id):
+                    sent += len(frame.encode())
+                    yield frame
+                if type_ == "error":
+                    break
+        finally:
+            metrics.STREAM_BYTES.inc(sent, route=route)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                 server.RUN_ID_HEADER: run.run_id, **(headers or {})},
+    )
+
+
+async def resume_chat(request):
+    """Resumes a /chat stream after the event in Last-Event-ID, without re-running the agent."""
+    access_token, _, token_headers = await asyncio.get_running_loop().run_in_executor(
+        executor, get_looker_token, request
+    )
+    run = server.chat_runs.get(request.path_params["run_id"], looker_auth.owner_key(access_token))
+    if run is None:
+        return JSONResponse({"error": "Run not found or expired"}, status_code=404)
+    metrics.REQUESTS.inc(route="chat_resume")
+    last_id = server.parse_last_event_id(
+        request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    )
+    return stream_run(run, "chat_resume", last_id=last_id, headers=token_headers)
+
+
+async def create_session(request):
+    """Creates (or confirms) a chat session ahead of its first message."""
+    data = await request.json()
+    session_id = data.get("session_id")
+    if not session_id:
+        return JSONResponse({"error": "No session_id provided"}, status_code=400)
+    user_id = data.get("user_id", "web_user")
+    try:
+        status = await asyncio.get_running_loop().run_in_executor(
+            executor, server.ensure_session, user_id, session_id
+        )
+        return JSONResponse({"session_id": session_id, "user_id": user_id, "status": status})
+    except Exception as e:
+        logger.error("Session Error: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def insights(request):
+    """Direct API endpoint for the get_insights tool."""
+    data = await request.json()
+    question = data.get("question")
+    if not question:
+        return JSONResponse({"error": "No question provided"}, status_code=400)
+
+    metrics.REQUESTS.inc(route="insights")
+    loop = asyncio.get_running_loop()
+    access_token, expires_at, token_headers = await loop.run_in_executor(executor, get_looker_token, request)
+    ticket = await admit(request, access_token, admission.BATCH)
+
+    def run():
+        agent.set_access_token(access_token, expires_at)
+        return agent.query_insights(question, columnar=data.get("format") == "columnar")
+
+    try:
+        result = await loop.run_in_executor(executor, run)
+        return JSONResponse(result, headers=token_headers)
+    except Exception as e:
+        metrics.ERRORS.inc(route="insights")
+        logger.error("Insights Error: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        ticket.release()
+
+
+async def insights_batch(request):
+    """Answers several questions concurrently, streaming NDJSON items in completion order."""
+    data = await request.json()
+    questions, error = batch.validate(data)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+
+    metrics.REQUESTS.inc(route="insights_batch")
+    access_token, expires_at, token_headers = await asyncio.get_running_loop().run_in_executor(
+        executor, get_looker_token, request
+    )
+    # The batch counts once against the caller's limit; each of its CA API
+    # streams then takes its own global slot in run_batch
+    ticket = await admit(request, access_token, admission.BATCH, slot=False)
+
+    async def generate():
+        items = batch.run_batch(
+            questions,
+            access_token=access_token,
+            expires_at=expires_at,
+            columnar=data.get("format") == "columnar",
+            deadline=data.get("deadline"),
+            controller=server.admission_controller,
+            user=ticket.user,
+        )
+        # run_batch blocks between completions, so iterate it off the event loop
+        async for item in iterate_in_threadpool(items):
+            if item["status"] != "ok":
+                metrics.ERRORS.inc(route="insights_batch")
+            yield json.dumps(item, default=str) + "\n"
+
+    return ReleasingStreamingResponse(generate(), ticket.release, media_type="application/x-ndjson",
+                                      headers=token_headers)
+
+
+async def get_result(request):
+    """Returns a stored query result (columnar) by the ID handed out by get_insights."""
+    access_token, _, _ = await asyncio.get_running_loop().run_in_executor(executor, get_looker_token, request)
+    owner = looker_auth.owner_key(access_token)
+    result = agent.result_store.get(request.path_params["result_id"], owner)
+    if result is None:
+        return JSONResponse({"error": "Result not found or expired"}, status_code=404)
+    return JSONResponse(result.to_columnar_dict())
+
+
+async def get_result_chart(request):
+    """Returns the rule-based chart of a stored result, whose series the model only saw without its data."""
+    access_token, _, _ = await asyncio.get_running_loop().run_in_executor(executor, get_looker_token, request)
+    result = agent.result_store.get(request.path_params["result_id"], looker_auth.owner_key(access_token))
+    if result is None:
+        return JSONResponse({"error": "Result not found or expired"}, status_code=404)
+    # Downsampling a long series is CPU work; keep it off the event loop
+    chart = await asyncio.get_running_loop().run_in_executor(executor, agent.charts.build_chart, result)
+    if chart is None:
+        return JSONResponse({"error": "No chart for this result"}, status_code=404)
+    return JSONResponse(chart)
+
+
+async def get_result_rows(request):
+    """Pages through a stored result, or streams it as CSV / Arrow IPC with `format`."""
+    access_token, _, _ = await asyncio.get_running_loop().run_in_executor(executor, get_looker_token, request)
+    result_id = request.path_params["result_id"]
+    result = agent.result_store.get(result_id, looker_auth.owner_key(access_token))
+    if result is None:
+        return JSONResponse({"error": "Result not found or expired"}, status_code=404)
+    start, limit, error = result_export.parse_page(request.query_params)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+
+    fmt = request.query_params.get("format", "json")
+    metrics.REQUESTS.inc(route="result_rows")
+    # Serialization runs chunk by chunk in the threadpool, off the event loop
+    if fmt == "csv":
+        return StreamingResponse(result_export.iter_csv(result, start), media_type=result_export.CSV_CONTENT_TYPE,
+                                 headers={"Content-Disposition": f'attachment; filename="{result_id}.csv"'})
+    if fmt == "arrow":
+        if not result_export.arrow_available():
+            return JSONResponse({"error": "Arrow export requires pyarrow on the server"}, status_code=501)
+        return StreamingResponse(result_export.iter_arrow(result, start), media_type=result_export.ARROW_CONTENT_TYPE,
+                                 headers={"Content-Disposition": f'attachment; filename="{result_id}.arrows"'})
+    if fmt not in ("json", "columnar"):
+        return JSONResponse({"error": "format must be json, columnar, csv or arrow"}, status_code=400)
+    return JSONResponse(result_export.page(result, start, limit, columnar=fmt == "columnar"))
+
+
+async def admission_stats(request):
+    """Returns in-flight and queued requests, limits and rejection counts."""
+    return JSONResponse(dict(server.admission_controller.stats(), prefetch=server.prefetcher.stats()))
+
+
+async def insights_cache_stats(request):
+    """Returns hit/miss counters for the get_insights result cache."""
+    return JSONResponse(agent.insights_cache.stats())
+
+
+async def metrics_endpoint(request):
+    """Prometheus scrape endpoint (stage latencies, LLM turns, request/error/cache counters)."""
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def healthz(request):
+    """Health probe that answers immediately, also while the agent is still warming up.
+
+    With `?ready=1` it returns 503 until the agent has been built.
+    """
+    ready = server.agent_app is not None
+    body = {
+        "status": "ok",
+        "ready": ready,
+        "warmup": server.warmup_status,
+        "uptime_s": round(time.monotonic() - server.started_at, 3),
+    }
+    status_code = 503 if request.query_params.get("ready") and not ready else 200
+    return JSONResponse(body, status_code=status_code)
+
+
+async def serve_static(request):
+    # Served straight from the in-memory manifest on the event loop, no threadpool hop
+    entry = server.static_manifest.lookup(request.path_params.get("path", ""))
+    if entry is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    status, headers, body = entry.respond(request.headers.get("accept-encoding", ""),
+                                          request.headers.get("if-none-match", ""))
+    return Response(body, status_code=status, headers=headers)
+
+
+async def login_url(request):
+    """Returns the Looker OAuth authorization URL."""
+    redirect_uri = request.query_params.get("redirect_uri", server.DEFAULT_REDIRECT_URI)
+    return JSONResponse({"url": server.build_login_url(redirect_uri)})
+
+
+async def exchange_token(request):
+    """Exchanges authorization code for access token."""
+    data = await request.json()
+    code = data.get("code")
+    if not code:
+        return JSONResponse({"error": "No code provided"}, status_code=400)
+    redirect_uri = data.get("redirect_uri", server.DEFAULT_REDIRECT_URI)
+    try:
+        # Tracked by looker_auth like under WSGI, so it is renewed before it expires
+        token = await asyncio.get_running_loop().run_in_executor(
+            executor, looker_auth.exchange_code, code, redirect_uri
+        )
+        return JSONResponse(token)
+    except Exception as e:
+        server.log_exchange_error(e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def logout(request):
+    """Stops tracking the caller's token, so it is no longer renewed."""
+    looker_auth.forget(get_bearer_token(request))
+    return JSONResponse({"status": "logged out"})
+
+
+async def reauth(request):
+    try:
+        server.start_reauth()
+        return JSONResponse({"status": "Authentication process started. Please check your browser."})
+    except Exception as e:
+        logger.error("Reauth Error: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/runs/{run_id}", resume_chat, methods=["GET"]),
+        Route("/sessions", create_session, methods=["POST"]),
+        Route("/api/insights", insights, methods=["POST"]),
+        Route("/api/insights/batch", insights_batch, methods=["POST"]),
+        Route("/api/insights/cache", insights_cache_stats, methods=["GET"]),
+        Route("/api/results/{result_id}", get_result, methods=["GET"]),
+        Route("/api/results/{result_id}/chart", get_result_chart, methods=["GET"]),
+        Route("/api/results/{result_id}/rows", get_result_rows, methods=["GET"]),
+        Route("/api/admission", admission_stats, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/auth/login_url", login_url, methods=["GET"]),
+        Route("/auth/exchange", exchange_token, methods=["POST"]),
+        Route("/auth/logout", logout, methods=["POST"]),
+        Route("/reauth", reauth, methods=["POST"]),
+        Route("/", serve_static, methods=["GET"]),
+        Route("/{path:path}", serve_static, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                           expose_headers=[server.RENEWED_TOKEN_HEADER, server.RUN_ID_HEADER])],
+    exception_handlers={looker_auth.TokenExpired: token_expired, admission.Rejected: admission_rejected},
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, port=int(os.getenv("PORT", "5001")))
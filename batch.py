@@ -0,0 +1,97 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import agent
+import admission
+
+# Worker threads shared by all batch requests; bounds the number of CA API
+# streams a batch endpoint can have open at once.
+BATCH_WORKERS = int(os.getenv("INSIGHTS_BATCH_WORKERS", "8"))
+
+# Largest number of questions accepted in one batch.
+BATCH_MAX_QUESTIONS = int(os.getenv("INSIGHTS_BATCH_MAX_QUESTIONS", "50"))
+
+# Default (and maximum) overall deadline of a batch, in seconds.
+BATCH_DEADLINE = float(os.getenv("INSIGHTS_BATCH_DEADLINE", "120"))
+
+executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+
+def _answer(question, access_token, expires_at, columnar, controller, user):
+    # Each CA API stream takes its own global slot; the batch already counts
+    # once against the user's limit
+    ticket = controller.acquire(user, admission.BATCH, charge_user=False) if controller else None
+    try:
+        # Pool threads are reused across callers, so always bind this caller's token
+        agent.set_access_token(access_token, expires_at)
+        return agent.query_insights(question, columnar=columnar)
+    finally:
+        if ticket:
+            ticket.release()
+
+
+def run_batch(questions, access_token=None, columnar=False, deadline=None, expires_at=None,
+              controller=None, user=None):
+    """Answers `questions` concurrently, yielding one item per question as it completes.
+
+    Items are `{"index", "question", "status", ...}` where status is "ok"
+    (with `result`), "error" (with `error`) or "timeout" for questions still
+    unanswered when the deadline passes. Identical questions in a batch share
+    a single CA API call through the result cache.
+
+    Args:
+        questions: List of question strings.
+        access_token: The caller's Looker access token, if any.
+        columnar: Return results in the columnar shape.
+        deadline: Seconds the whole batch may take (capped at BATCH_DEADLINE).
+        expires_at: Expiry of `access_token` in epoch seconds, if known.
+        controller: AdmissionController each question's CA API stream is
+            admitted through, if any.
+        user: The caller's admission identity.
+    """
+    started = time.monotonic()
+    deadline = min(deadline or BATCH_DEADLINE, BATCH_DEADLINE)
+    futures = {
+        executor.submit(_answer, question, access_token, expires_at, columnar, controller, user): (i, question)
+        for i, question in enumerate(questions)
+    }
+    pending = set(futures)
+    while pending:
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, question = futures[future]
+            item = {"index": index, "question": question}
+            error = future.exception()
+            if error is None:
+                item.update(status="ok", result=future.result())
+            else:
+                item.update(status="error", error=str(error))
+                if isinstance(error, admission.Rejected):
+                    item["retry_after"] = error.retry_after
+            yield item
+
+    for future in sorted(pending, key=lambda f: futures[f][0]):
+        # Not-yet-started questions are dropped; running ones finish in the
+        # background and still fill the result cache
+        future.cancel()
+        index, question = futures[future]
+        yield {"index": index, "question": question, "status": "timeout",
+               "error": f"Deadline of {deadline:g}s exceeded"}
+
+
+def validate(data):
+    """Returns (questions, error message) for a batch request body."""
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        return None, "No questions provided"
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return None, f"At most {BATCH_MAX_QUESTIONS} questions per batch"
+    if not all(isinstance(q, str) and q.strip() for q in questions):
+        return None, "Questions must be non-empty strings"
+    deadline = data.get("deadline")
+    if deadline is not None and (isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or deadline <= 0):
+        return None, "deadline must be a positive number of seconds"
+    return questions, None
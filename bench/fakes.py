@@ -0,0 +1,182 @@
+"""Offline stand-ins for the Conversational Analytics API and the ADK app.
+
+`FakeDataChatClient` returns real `geminidataanalytics.Message` protos, so the
+result-processing path in agent.py runs unchanged. `FakeAgentApp` plays the
+root agent: it calls the real `agent.get_insights` tool and streams an answer
+in ADK's `stream_query` event shape.
+"""
+import os
+import time
+import uuid
+import random
+from google.api_core import exceptions as google_exceptions
+from google.cloud import geminidataanalytics
+from google.protobuf import struct_pb2
+
+
+class StreamProfile:
+    """Shape of a fake stream.
+
+    Args:
+        rows: Result rows in the data message.
+        chunks: Text chunks emitted before (CA API) or as (agent) the answer.
+        delay: Seconds to sleep between chunks.
+        first_chunk_delay: Seconds to sleep before the first chunk.
+        error_rate: Probability that a stream fails part-way through.
+    """
+
+    def __init__(self, rows=100, chunks=5, delay=0.0, first_chunk_delay=0.0, error_rate=0.0):
+        self.rows = rows
+        self.chunks = chunks
+        self.delay = delay
+        self.first_chunk_delay = first_chunk_delay
+        self.error_rate = error_rate
+
+
+def build_messages(question, rows, chunks):
+    """Builds the CA API messages for a question: text chunks, SQL, then the result."""
+    messages = []
+    for i in range(chunks):
+        m = geminidataanalytics.Message()
+        m.system_message.text.parts.append(f"Step {i + 1} for: {question}")
+        messages.append(m)
+
+    m = geminidataanalytics.Message()
+    m.system_message.data.generated_sql = "SELECT event_date, country, SUM(revenue) FROM events GROUP BY 1, 2"
+    messages.append(m)
+
+    m = geminidataanalytics.Message()
+    result = m.system_message.data.result
+    result.name = "bench_result"
+    result.schema.fields.append(geminidataanalytics.Field(name="events.event_date", type_="DATE", display_name="Event Date"))
+    result.schema.fields.append(geminidataanalytics.Field(name="events.country", type_="STRING", display_name="Country"))
+    result.schema.fields.append(
+        geminidataanalytics.Field(name="events.revenue", type_="FLOAT", category="MEASURE", display_name="Revenue")
+    )
+    countries = ["US", "DE", "JP", "BR", "IN", "GB", "FR", "KR"]
+    for i in range(rows):
+        row = struct_pb2.Struct()
+        row.update({
+            "events.event_date": f"2024-{1 + (i // 28) % 12:02d}-{1 + i % 28:02d}",
+            "events.country": countries[i % len(countries)],
+            "events.revenue": round((i * 7919) % 10000 / 3.0, 2),
+        })
+        result._pb.data.append(row)
+    messages.append(m)
+    return messages
+
+
+class FakeDataChatClient:
+    """Replacement for `DataChatServiceClient` whose `chat` streams canned messages."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.calls = 0
+
+    def chat(self, request):
+        self.calls += 1
+        question = request.messages[0].user_message.text
+        messages = build_messages(question, self.profile.rows, self.profile.chunks)
+        fail_at = None
+        if random.random() < self.profile.error_rate:
+            fail_at = random.randrange(len(messages) + 1)
+            if fail_at == 0:
+                raise google_exceptions.ServiceUnavailable("injected CA API failure")
+        return self._stream(messages, fail_at)
+
+    def _stream(self, messages, fail_at):
+        if self.profile.first_chunk_delay:
+            time.sleep(self.profile.first_chunk_delay)
+        for i, message in enumerate(messages):
+            if i == fail_at:
+                raise google_exceptions.ServiceUnavailable("injected CA API stream failure")
+            if i and self.profile.delay:
+                time.sleep(self.profile.delay)
+            yield message
+
+
+def _event(text, author="CA_API"):
+    return {
+        "content": {"parts": [{"text": text}], "role": "model"},
+        "author": author,
+        "id": uuid.uuid4().hex,
+        "timestamp": time.time(),
+    }
+
+
+class FakeAgentApp:
+    """Replacement for the AdkApp used by server.py.
+
+    `stream_query` calls the real get_insights tool (through the cache, event
+    bus and result store), then streams a table of the returned rows in
+    `profile.chunks` pieces.
+    """
+
+    def __init__(self, profile, get_insights):
+        self.profile = profile
+        self.get_insights = get_insights
+        self.sessions = set()
+
+    def create_session(self, user_id, session_id=None, **kwargs):
+        self.sessions.add((user_id, session_id))
+        return {"id": session_id, "user_id": user_id}
+
+    def get_session(self, user_id, session_id, **kwargs):
+        return {"id": session_id, "user_id": user_id} if (user_id, session_id) in self.sessions else None
+
+    def stream_query(self, message, user_id, session_id=None, **kwargs):
+        if self.profile.first_chunk_delay:
+            time.sleep(self.profile.first_chunk_delay)
+        response = self.get_insights(message)
+
+        lines = []
+        for insight in response.get("data_insights", []):
+            result = insight.get("result") or {}
+            rows = result.get("data") or []
+            if rows:
+                keys = list(rows[0])
+                lines.append("| " + " | ".join(keys) + " |")
+                lines.append("|" + "---|" * len(keys))
+                lines.extend("| " + " | ".join(str(r.get(k)) for k in keys) + " |" for r in rows)
+            if result.get("truncated"):
+                lines.append(f"RESULT: {result.get('result_id')}")
+        if "chart" in response:
+            lines.append("```json-chart")
+            lines.append(str(response["chart"]))
+            lines.append("```")
+        lines.append("SUGGESTION: Break this down by country?")
+
+        chunks = max(1, self.profile.chunks)
+        per_chunk = max(1, -(-len(lines) // chunks))
+        fail_at = random.randrange(chunks) if random.random() < self.profile.error_rate else None
+        for i, start in enumerate(range(0, len(lines), per_chunk)):
+            if i == fail_at:
+                raise RuntimeError("injected agent failure")
+            if i and self.profile.delay:
+                time.sleep(self.profile.delay)
+            yield _event("\n".join(lines[start:start + per_chunk]) + "\n")
+
+
+def install(ca_profile, agent_profile):
+    """Points agent.py and server.py at the fakes. Returns (fake_client, fake_app).
+
+    Imports server (and therefore agent) as a side effect; call this before
+    starting a server in-process.
+    """
+    # The fake app replaces the real one, so don't build the real one in the background
+    os.environ["WARMUP"] = "0"
+
+    import agent
+    import ca_client
+    import server
+
+    fake_client = FakeDataChatClient(ca_profile)
+    ca_client.get_client = lambda: fake_client
+    # The fake client ignores datasource credentials, so no Looker secrets are needed
+    agent.build_inline_context = lambda user_token=None, explores=None: geminidataanalytics.Context(
+        system_instruction=agent.SYSTEM_INSTRUCTION
+    )
+
+    fake_app = FakeAgentApp(agent_profile, agent.get_insights)
+    server.agent_app = fake_app
+    return fake_client, fake_app
@@ -0,0 +1,211 @@
+"""Offline load test for /chat and /api/insights.
+
+Starts server.py (or asgi_server.py) in-process against the fakes in
+bench/fakes.py and drives it over HTTP at a fixed concurrency.
+
+Usage:
+    python -m bench.load --requests 200 --concurrency 16 --rows 5000
+    python -m bench.load --endpoint insights --rows 50000 --json report.json
+    python -m bench.load --server asgi --delay 0.01 --error-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import fakes  # noqa: E402
+
+QUESTIONS = [
+    "What is the total revenue for the last 30 days?",
+    "Show me a trend of daily active users for the last week.",
+    "What are the top 3 games by revenue?",
+    "Break down the number of sessions by device platform.",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (server included) in MB."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, port):
+    """Starts the Flask (wsgi) or Starlette (asgi) app on a background thread."""
+    if kind == "asgi":
+        import uvicorn
+        import asgi_server
+
+        config = uvicorn.Config(asgi_server.app, host="127.0.0.1", port=port, log_level="warning")
+        httpd = uvicorn.Server(config)
+        thread = threading.Thread(target=httpd.run, daemon=True)
+        thread.start()
+        while not httpd.started:
+            time.sleep(0.05)
+        return lambda: setattr(httpd, "should_exit", True)
+
+    import logging
+    from werkzeug.serving import make_server
+    import server
+
+    # Per-request access logs would dominate the run
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    httpd = make_server("127.0.0.1", port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.shutdown
+
+
+def run_one(base_url, endpoint, index, repeat_questions):
+    """Sends one request and returns its timings."""
+    question = QUESTIONS[index % len(QUESTIONS)]
+    if not repeat_questions:
+        # Distinct questions so every request misses the result cache
+        question = f"{question} (run {index})"
+
+    if endpoint == "chat":
+        url, body = f"{base_url}/chat", {"message": question, "session_id": f"bench_{index % 64}"}
+    else:
+        url, body = f"{base_url}/api/insights", {"question": question}
+
+    started = time.perf_counter()
+    ttfb = None
+    size = 0
+    error = None
+    try:
+        with requests.post(url, json=body, stream=True, timeout=300) as response:
+            for block in response.iter_content(chunk_size=None):
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                size += len(block)
+                if endpoint == "chat" and b"ERROR: " in block:
+                    error = "stream error"
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+    except requests.RequestException as e:
+        error = str(e)
+    latency = time.perf_counter() - started
+    return {"endpoint": endpoint, "latency": latency, "ttfb": ttfb if ttfb is not None else latency,
+            "bytes": size, "error": error}
+
+
+def run_load(base_url, endpoints, total, concurrency, repeat_questions, offset=0):
+    """Issues `total` requests across `endpoints` with `concurrency` workers."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_one, base_url, endpoints[i % len(endpoints)], offset + i, repeat_questions)
+            for i in range(total)
+        ]
+        samples = [f.result() for f in futures]
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """Aggregates request samples into throughput, latency and TTFB percentiles."""
+    report = {}
+    for endpoint in sorted({s["endpoint"] for s in samples}):
+        subset = [s for s in samples if s["endpoint"] == endpoint]
+        ok = [s for s in subset if not s["error"]]
+        latencies = [s["latency"] for s in ok]
+        ttfbs = [s["ttfb"] for s in ok]
+        report[endpoint] = {
+            "requests": len(subset),
+            "errors": len(subset) - len(ok),
+            "throughput_rps": round(len(subset) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {p: round(percentile(latencies, int(p[1:])) * 1000, 1) for p in ("p50", "p95", "p99")},
+            "ttfb_ms": {p: round(percentile(ttfbs, int(p[1:])) * 1000, 1) for p in ("p50", "p95", "p99")},
+            "bytes": sum(s["bytes"] for s in subset),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the CA API server.")
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--endpoint", choices=["chat", "insights", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests to send.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=4, help="Requests sent (and discarded) before measuring.")
+    parser.add_argument("--rows", type=int, default=100, help="Rows in each fake CA API result.")
+    parser.add_argument("--chunks", type=int, default=5, help="Text chunks per fake stream.")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds between fake chunks.")
+    parser.add_argument("--first-chunk-delay", type=float, default=0.0, help="Seconds before the first CA API chunk.")
+    parser.add_argument("--agent-delay", type=float, default=0.0, help="Seconds between fake agent chunks.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability a fake stream fails.")
+    parser.add_argument("--repeat-questions", action="store_true", help="Reuse questions so the result cache is hit.")
+    parser.add_argument("--per-user-limits", action="store_true",
+                        help="Keep ADMISSION_PER_USER; all simulated clients share one address.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file.")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    if not args.per_user_limits:
+        # Read when server.py is imported by fakes.install
+        os.environ.setdefault("ADMISSION_PER_USER", "0")
+    ca_profile = fakes.StreamProfile(rows=args.rows, chunks=args.chunks, delay=args.delay,
+                                     first_chunk_delay=args.first_chunk_delay, error_rate=args.error_rate)
+    agent_profile = fakes.StreamProfile(chunks=args.chunks, delay=args.agent_delay)
+    fakes.install(ca_profile, agent_profile)
+
+    port = _free_port()
+    stop = start_server(args.server, port)
+    base_url = f"http://127.0.0.1:{port}"
+    endpoints = ["chat", "insights"] if args.endpoint == "both" else [args.endpoint]
+    try:
+        if args.warmup:
+            run_load(base_url, endpoints, args.warmup, min(args.warmup, args.concurrency), args.repeat_questions,
+                     offset=args.requests)
+        samples, elapsed = run_load(base_url, endpoints, args.requests, args.concurrency, args.repeat_questions)
+    finally:
+        stop()
+
+    report = {
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "endpoints": summarize(samples, elapsed),
+    }
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.server} server: "
+          f"{report['throughput_rps']} req/s, peak RSS {report['peak_rss_mb']} MB")
+    for endpoint, stats in report["endpoints"].items():
+        lat, ttfb = stats["latency_ms"], stats["ttfb_ms"]
+        print(f"  {endpoint:9s} {stats['requests']} req, {stats['errors']} errors, {stats['throughput_rps']} req/s | "
+              f"latency p50 {lat['p50']} / p95 {lat['p95']} / p99 {lat['p99']} ms | "
+              f"TTFB p50 {ttfb['p50']} / p95 {ttfb['p95']} / p99 {ttfb['p99']} ms")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Startup cost benchmark.
+
+Measures, each in a fresh interpreter:
+  - the wall time of `import server` (what a cold start pays before it can
+    answer /healthz), with the heaviest modules from `python -X importtime`;
+  - the time to build the agent afterwards (`server.get_agent_app()`), which
+    the warm-up thread normally does in the background.
+
+Usage:
+    python -m bench.startup
+    python -m bench.startup --runs 5 --budget-ms 1500 --json startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import server
+print(f"IMPORT_MS {(time.perf_counter() - started) * 1000:.1f}")
+"""
+
+BUILD_SNIPPET = """
+import time
+import server
+started = time.perf_counter()
+server.get_agent_app()
+print(f"BUILD_MS {(time.perf_counter() - started) * 1000:.1f}")
+"""
+
+
+def _run(snippet, marker, extra_args=()):
+    env = dict(os.environ, WARMUP="0", LOG_LEVEL="WARNING")
+    proc = subprocess.run(
+        [sys.executable, *extra_args, "-c", snippet],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith(marker):
+            return float(line.split()[1]), proc.stderr
+    raise RuntimeError(f"benchmark subprocess failed:\n{proc.stderr[-2000:]}")
+
+
+def top_imports(importtime_output, limit):
+    """Parses `-X importtime` output into the `limit` modules with the largest cumulative time."""
+    entries = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time:  <self us> | <cumulative us> | <indented module name>
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    entries.sort(key=lambda e: e["cumulative_ms"], reverse=True)
+    return entries[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the startup cost of server.py.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement.")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest imports to list.")
+    parser.add_argument("--skip-build", action="store_true", help="Don't measure building the agent.")
+    parser.add_argument("--budget-ms", type=float, help="Exit non-zero if the median import time exceeds this.")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file.")
+    args = parser.parse_args(argv)
+
+    import_ms = [_run(IMPORT_SNIPPET, "IMPORT_MS")[0] for _ in range(args.runs)]
+    _, importtime = _run(IMPORT_SNIPPET, "IMPORT_MS", extra_args=("-X", "importtime"))
+    report = {
+        "import_server_ms": {"median": statistics.median(import_ms), "min": min(import_ms), "max": max(import_ms)},
+        "top_imports": top_imports(importtime, args.top),
+    }
+    if not args.skip_build:
+        build_ms = [_run(BUILD_SNIPPET, "BUILD_MS")[0] for _ in range(args.runs)]
+        report["build_agent_ms"] = {"median": statistics.median(build_ms), "min": min(build_ms), "max": max(build_ms)}
+
+    print(f"import server: median {report['import_server_ms']['median']:.0f} ms over {args.runs} runs")
+    if "build_agent_ms" in report:
+        print(f"build agent (warm-up): median {report['build_agent_ms']['median']:.0f} ms")
+    print("heaviest imports (cumulative ms):")
+    for entry in report["top_imports"]:
+        print(f"  {entry['cumulative_ms']:8.1f}  {entry['module']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.budget_ms is not None and report["import_server_ms"]["median"] > args.budget_ms:
+        print(f"FAIL: import time exceeds the {args.budget_ms:.0f} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+import time
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+
+# Number of DataChatServiceClient instances (and therefore gRPC channels) to
+# spread concurrent chat streams across (at least one).
+CLIENT_POOL_SIZE = max(1, int(os.getenv("CA_CLIENT_POOL_SIZE", "4")))
+
+# Looker access tokens are valid for an hour by default. Contexts built for a
+# user token with no known expiry are dropped after this many seconds.
+DEFAULT_TOKEN_TTL = int(os.getenv("CA_CONTEXT_TOKEN_TTL", "3600"))
+
+# Upper bound on the number of prebuilt contexts kept in memory.
+CONTEXT_CACHE_SIZE = int(os.getenv("CA_CONTEXT_CACHE_SIZE", "1024"))
+
+SERVICE_ACCOUNT_KEY = ("service_account",)
+
+_client_lock = threading.Lock()
+_clients = []
+_client_counter = itertools.count()
+
+_context_lock = threading.Lock()
+_contexts = OrderedDict()  # (credential key, variant) -> (context, expires_at)
+
+
+def get_client():
+    """Returns a pooled DataChatServiceClient, creating the pool on first use.
+
+    Clients are handed out round-robin so concurrent streams are spread across
+    several channels instead of opening a new one per question.
+    """
+    if len(_clients) < CLIENT_POOL_SIZE:
+        # The client library is imported on first use to keep startup fast
+        from google.cloud import geminidataanalytics
+
+        with _client_lock:
+            if len(_clients) < CLIENT_POOL_SIZE:
+                _clients.append(geminidataanalytics.DataChatServiceClient())
+                return _clients[-1]
+    return _clients[next(_client_counter) % len(_clients)]
+
+
+def credential_key(access_token=None):
+    """Returns the cache key identifying a set of Looker credentials.
+
+    User tokens are hashed so raw tokens are never kept as dictionary keys.
+    """
+    if not access_token:
+        return SERVICE_ACCOUNT_KEY
+    return ("user", hashlib.sha256(access_token.encode("utf-8")).hexdigest())
+
+
+def get_context(key, builder, expires_at=None, variant=None):
+    """Returns the prebuilt inline Context for `key`, building it if needed.
+
+    Args:
+        key: Credential identity from `credential_key`.
+        builder: Zero-argument callable that builds the Context.
+        expires_at: Epoch seconds after which the cached Context must not be
+            reused. Defaults to `DEFAULT_TOKEN_TTL` from now for user tokens
+            and never for the service account.
+        variant: Anything else the Context depends on (e.g. the explores it
+            references); each variant is cached separately.
+    """
+    cache_key = (key, variant)
+    now = time.time()
+    with _context_lock:
+        entry = _contexts.get(cache_key)
+        if entry is not None:
+            context, entry_expires_at = entry
+            if entry_expires_at is None or entry_expires_at > now:
+                _contexts.move_to_end(cache_key)
+                return context
+            del _contexts[cache_key]
+
+    context = builder()
+    if expires_at is None and key != SERVICE_ACCOUNT_KEY:
+        expires_at = now + DEFAULT_TOKEN_TTL
+
+    with _context_lock:
+        # Misses are rare, so they also sweep out contexts of expired tokens
+        _purge_expired_locked(now)
+        _contexts[cache_key] = (context, expires_at)
+        _contexts.move_to_end(cache_key)
+        while len(_contexts) > CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+    return context
+
+
+def evict_context(key):
+    """Drops every cached Context for `key`, e.g. after the token was rejected."""
+    with _context_lock:
+        for cache_key in [k for k in _contexts if k[0] == key]:
+            del _contexts[cache_key]
+
+
+def _purge_expired_locked(now):
+    expired = [k for k, (_, exp) in _contexts.items() if exp is not None and exp <= now]
+    for k in expired:
+        del _contexts[k]
+    return len(expired)
+
+
+def purge_expired_contexts():
+    """Removes every cached Context whose token has expired; `get_context` also does this on each miss."""
+    with _context_lock:
+        return _purge_expired_locked(time.time())
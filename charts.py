@@ -0,0 +1,191 @@
+import os
+import results
+
+# Rule-based chart configs are built from the result schema so the root agent
+# can skip the VisualizationAgent round trip. Set RULE_BASED_CHARTS=0 to always
+# defer to the LLM.
+RULE_BASED_CHARTS = os.getenv("RULE_BASED_CHARTS", "1") != "0"
+
+# Maximum points kept in a chart's data array; longer series are downsampled.
+MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "200"))
+# Maximum bars kept in a categorical chart (largest values first).
+MAX_BAR_CATEGORIES = int(os.getenv("CHART_MAX_BAR_CATEGORIES", "25"))
+# Maximum slices for which a single-measure breakdown is drawn as a pie.
+MAX_PIE_SLICES = int(os.getenv("CHART_MAX_PIE_SLICES", "6"))
+
+PALETTE = ["#8884d8", "#82ca9d", "#ffc658", "#ff7f50", "#a4de6c", "#d0ed57", "#8dd1e1", "#83a6ed"]
+
+TIME_TYPES = {"DATE", "DATETIME", "TIMESTAMP", "TIME"}
+NUMERIC_TYPES = {"INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC", "BIGNUMERIC", "DOUBLE", "NUMBER"}
+TIME_SUFFIXES = ("_date", "_time", "_week", "_month", "_quarter", "_year", "_day", "_hour", "_minute")
+
+
+def classify_field(field):
+    """Classifies a schema field as "time", "measure" or "dimension"."""
+    name = (field.get('name') or '').lower()
+    type_ = (field.get('type') or field.get('type_') or '').upper()
+    category = (field.get('category') or '').upper()
+    if category == "MEASURE":
+        return "measure"
+    if type_ in TIME_TYPES or name.endswith(TIME_SUFFIXES):
+        return "time"
+    if category == "DIMENSION":
+        return "dimension"
+    if type_ in NUMERIC_TYPES:
+        return "measure"
+    return "dimension"
+
+
+def _to_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def lttb_indices(ys, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps of the series `ys`.
+
+    The x axis is treated as evenly spaced (points must already be in x order).
+    """
+    n = len(ys)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    sampled = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best, best_area = start, -1.0
+        for j in range(start, min(end, n - 1)):
+            area = abs((a - avg_x) * (ys[j] - ys[a]) - (a - j) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(best)
+        a = best
+    sampled.append(n - 1)
+    return sampled
+
+
+def lttb(rows, y_key, threshold):
+    """Downsamples rows with Largest-Triangle-Three-Buckets, keeping the series' shape."""
+    ys = [_to_number(r.get(y_key)) or 0.0 for r in rows]
+    return [rows[i] for i in lttb_indices(ys, threshold)]
+
+
+def _numeric_rows(rows, keys):
+    """Copies rows with measure values coerced to numbers for the chart renderer."""
+    out = []
+    for row in rows:
+        new_row = dict(row)
+        for k in keys:
+            number = _to_number(row.get(k))
+            if number is not None:
+                new_row[k] = number
+        out.append(new_row)
+    return out
+
+
+def build_chart(result):
+    """Builds a Recharts `json-chart` config from a get_insights result.
+
+    A time dimension plus measures gives a line chart, a single categorical
+    dimension with few rows and one measure gives a pie, and other single
+    dimension breakdowns give a bar chart.
+
+    Args:
+        result: A ColumnarResult, or the `result` dictionary of a CA API data
+            message with `schema.fields` and `data` rows. Columnar results
+            are charted without building rows beyond the ones plotted.
+
+    Returns:
+        The chart config, or None if the rules can't decide (or there is
+        nothing worth charting), in which case the VisualizationAgent is used.
+    """
+    if isinstance(result, results.ColumnarResult):
+        fields, columns, n = result.fields, result.columns, result.num_rows
+
+        def column(key):
+            return columns.get(key) or [None] * n
+
+        def make_rows(indices):
+            return [{k: col[i] for k, col in columns.items()} for i in indices]
+    else:
+        fields = result.get('schema', {}).get('fields', [])
+        rows = result.get('data') or []
+        n = len(rows)
+
+        def column(key):
+            return [r.get(key) for r in rows]
+
+        def make_rows(indices):
+            return [rows[i] for i in indices]
+    if n < 2 or not fields:
+        return None
+
+    by_kind = {"time": [], "measure": [], "dimension": []}
+    for f in fields:
+        if 'name' in f:
+            by_kind[classify_field(f)].append(f)
+    times, measures, dims = by_kind["time"], by_kind["measure"], by_kind["dimension"]
+    if not measures:
+        return None
+
+    measure_keys = [m['name'] for m in measures]
+    measure_names = ", ".join(results.field_label(m) for m in measures)
+    series = [
+        {"dataKey": m['name'], "name": results.field_label(m), "fill": PALETTE[i % len(PALETTE)]}
+        for i, m in enumerate(measures)
+    ]
+
+    if len(times) == 1 and not dims:
+        x = times[0]['name']
+        xs = column(x)
+        order = sorted(range(n), key=lambda i: str(xs[i]))
+        ys = column(measure_keys[0])
+        picked = lttb_indices([_to_number(ys[i]) or 0.0 for i in order], MAX_POINTS)
+        return {
+            "type": "line",
+            "title": f"{measure_names} over {results.field_label(times[0])}",
+            "xAxisKey": x,
+            "data": _numeric_rows(make_rows([order[i] for i in picked]), measure_keys),
+            "series": series,
+        }
+
+    if len(dims) == 1 and not times:
+        x = dims[0]['name']
+        indices = range(n)
+        if len(measures) == 1 and n <= MAX_PIE_SLICES:
+            values = [_to_number(v) for v in column(measure_keys[0])]
+            if all(v is not None and v >= 0 for v in values):
+                return {
+                    "type": "pie",
+                    "title": f"{measure_names} by {results.field_label(dims[0])}",
+                    "xAxisKey": x,
+                    "data": _numeric_rows(make_rows(indices), measure_keys),
+                    "series": series,
+                }
+        if n > MAX_BAR_CATEGORIES:
+            ys = column(measure_keys[0])
+            indices = sorted(indices, key=lambda i: _to_number(ys[i]) or 0, reverse=True)[:MAX_BAR_CATEGORIES]
+        return {
+            "type": "bar",
+            "title": f"{measure_names} by {results.field_label(dims[0])}",
+            "xAxisKey": x,
+            "data": _numeric_rows(make_rows(indices), measure_keys),
+            "series": series,
+        }
+
+    # Pivots, multiple dimensions etc. are left to the VisualizationAgent
+    return None
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import metrics
+import results
+import model_router
+
+# Compact earlier turns of the conversation before each LLM call.
+HISTORY_COMPACTION = os.getenv("HISTORY_COMPACTION", "1") == "1"
+
+# Approximate token budget for the history before the current turn. Past
+# tool outputs are always summarized; turns that don't fit have their long
+# texts cut, and the oldest turns beyond the budget are dropped.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+
+# Per-model budgets as "model:tokens" pairs, e.g. "gemini-2.5-flash:4000".
+# Each call gets the budget of the model it was routed to (see model_router),
+# HISTORY_TOKEN_BUDGET for models not listed. By default turns on the fast
+# model carry half the history.
+HISTORY_TOKEN_BUDGETS = os.getenv(
+    "HISTORY_TOKEN_BUDGETS",
+    f"{model_router.FAST_MODEL}:{HISTORY_TOKEN_BUDGET // 2}" if model_router.FAST_MODEL else "",
+)
+
+# Longest text part kept verbatim from an earlier turn once over budget.
+HISTORY_TEXT_CHARS = int(os.getenv("HISTORY_TEXT_CHARS", "1500"))
+
+# Rows of a past result kept in its summary.
+HISTORY_SAMPLE_ROWS = int(os.getenv("HISTORY_SAMPLE_ROWS", "3"))
+
+# Rough characters per token, for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+INSIGHTS_TOOL = "get_insights"
+
+
+def _parse_budgets(spec):
+    budgets = {}
+    for entry in spec.split(","):
+        model, _, tokens = entry.strip().rpartition(":")
+        if model and tokens.strip().isdigit():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+_budgets = _parse_budgets(HISTORY_TOKEN_BUDGETS)
+
+
+def budget_for(model):
+    """Returns the history token budget for an LLM call to `model`."""
+    if isinstance(model, str):
+        # Full resource names resolve like their short model ID
+        for name in (model, model.rsplit("/", 1)[-1]):
+            if name in _budgets:
+                return _budgets[name]
+    return HISTORY_TOKEN_BUDGET
+
+
+def _truncate(text, limit):
+    if text is None or len(text) <= limit:
+        return text
+    return text[:limit] + f"... [{len(text) - limit} chars omitted]"
+
+
+def _compact_stats(stats):
+    out = {}
+    for name, entry in (stats or {}).items():
+        if "mean" in entry:
+            out[name] = {k: entry[k] for k in ("min", "max", "sum", "mean") if k in entry}
+        else:
+            # [value, count] lists rather than tuples, so the summary is the same after a JSON round trip
+            out[name] = {"distinct_count": entry.get("distinct_count"),
+                         "top_values": [list(v) for v in (entry.get("top_values") or [])[:3]]}
+    return out
+
+
+def summarize_insights(response):
+    """Compact stand-in for a past get_insights output: schema, row count, key stats and result ID."""
+    if not isinstance(response, dict):
+        return response
+    out = {"status": response.get("status"), "compacted": True}
+    texts = []
+    for text in response.get("text_insights") or []:
+        parts = text.get("parts") if isinstance(text, dict) else None
+        texts.append("".join(parts) if parts else str(text))
+    if texts:
+        out["text"] = _truncate(" ".join(texts), 500)
+    summaries = []
+    for insight in response.get("data_insights") or []:
+        result = insight.get("result") if isinstance(insight, dict) else None
+        if not isinstance(result, dict):
+            continue
+        fields = (result.get("schema") or {}).get("fields") or []
+        data = result.get("data") or []
+        summary = {
+            "fields": [{"name": f.get("name"), "label": f.get("label")} for f in fields],
+            "row_count": result.get("row_count", len(data)),
+            "sample": data[:HISTORY_SAMPLE_ROWS],
+        }
+        stats = result.get("stats")
+        if stats is None and len(data) > HISTORY_SAMPLE_ROWS:
+            # Rows may be keyed by label rather than field name; stats follow the row keys
+            stats = results.ColumnarResult.from_rows([], data).column_stats(top_values=3)
+        if stats:
+            summary["stats"] = _compact_stats(stats)
+        if insight.get("generated_sql"):
+            summary["sql"] = _truncate(insight["generated_sql"], 500)
+        for key in ("result_id", "explore_url"):
+            if result.get(key):
+                summary[key] = result[key]
+        summaries.append(summary)
+    if summaries:
+        out["results"] = summaries
+    if "error" in response:
+        out["error"] = _truncate(str(response["error"]), 300)
+    return out
+
+
+def _summarize_tool_output(name, response):
+    if name == INSIGHTS_TOOL:
+        return summarize_insights(response)
+    # Sub-agent tools (e.g. the chart JSON of VisualizationAgent) only matter in their own turn
+    text = json.dumps(response, default=str)
+    if len(text) <= HISTORY_TEXT_CHARS:
+        return response
+    return {"compacted": True, "summary": _truncate(text, 200)}
+
+
+def _compact_part(part, types):
+    # Returns a compacted copy of a history part, or the part itself
+    call, response = part.function_call, part.function_response
+    if response is not None:
+        summary = _summarize_tool_output(response.name, response.response)
+        if summary is not response.response:
+            metrics.HISTORY_COMPACTED.inc(kind="tool_output")
+            return types.Part(function_response=types.FunctionResponse(
+                id=response.id, name=response.name, response=summary,
+            ))
+    elif call is not None and call.args:
+        # e.g. the data rows passed to VisualizationAgent
+        args = {}
+        for k, v in call.args.items():
+            text = v if isinstance(v, str) else json.dumps(v, default=str)
+            args[k] = _truncate(text, HISTORY_TEXT_CHARS) if len(text) > HISTORY_TEXT_CHARS else v
+        if any(args[k] is not v for k, v in call.args.items()):
+            metrics.HISTORY_COMPACTED.inc(kind="tool_call")
+            return types.Part(function_call=types.FunctionCall(id=call.id, name=call.name, args=args))
+    return part
+
+
+def estimate_tokens(content):
+    """Approximate token count of a Content from the size of its parts."""
+    chars = 0
+    for part in content.parts or ():
+        if part.text:
+            chars += len(part.text)
+        elif part.function_response is not None:
+            chars += len(json.dumps(part.function_response.response, default=str))
+        elif part.function_call is not None:
+            chars += len(json.dumps(part.function_call.args, default=str))
+        else:
+            chars += 256
+    return chars // CHARS_PER_TOKEN + 1
+
+
+def _is_user_message(content):
+    # A user turn starts with text; tool results come back as user contents too
+    return content.role == "user" and any(p.text for p in content.parts or ())
+
+
+def _replace_parts(content, parts, types):
+    if all(new is old for new, old in zip(parts, content.parts or ())):
+        return content
+    return types.Content(role=content.role, parts=parts)
+
+
+def _compact_content(content, types):
+    return _replace_parts(content, [p if p.text else _compact_part(p, types) for p in content.parts or ()], types)
+
+
+def _truncate_texts(content, types):
+    parts = []
+    for part in content.parts or ():
+        if part.text and len(part.text) > HISTORY_TEXT_CHARS:
+            metrics.HISTORY_COMPACTED.inc(kind="text")
+            part = types.Part(text=_truncate(part.text, HISTORY_TEXT_CHARS))
+        parts.append(part)
+    return _replace_parts(content, parts, types)
+
+
+def compact_history(contents, budget=None):
+    """Returns `contents` with earlier turns compacted to fit the token budget.
+
+    The current turn (from the latest user message on) is never changed, so
+    the model still sees this turn's tool results in full. Earlier turns are
+    walked newest first: their tool outputs are summarized, long texts are
+    cut if the turn doesn't fit otherwise, and once a turn doesn't fit at all
+    it and everything before it is dropped. Only kept turns are processed,
+    so the cost stays flat however long the session gets.
+    """
+    from google.genai import types
+
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+    starts = [i for i, content in enumerate(contents) if _is_user_message(content)]
+    if len(starts) < 2:
+        return contents
+    current = starts[-1]
+    # Anything before the first user message belongs to the first turn
+    bounds = list(zip([0] + starts[1:-1], starts[1:]))
+    kept = []
+    kept_turns = 0
+    total = 0
+    for begin, end in reversed(bounds):
+        turn = [_compact_content(c, types) for c in contents[begin:end]]
+        size = sum(estimate_tokens(c) for c in turn)
+        if total + size > budget:
+            turn = [_truncate_texts(c, types) for c in turn]
+            size = sum(estimate_tokens(c) for c in turn)
+        if total + size > budget:
+            metrics.HISTORY_COMPACTED.inc(len(bounds) - kept_turns, kind="turn")
+            break
+        kept[:0] = turn
+        kept_turns += 1
+        total += size
+    return kept + list(contents[current:])
+
+
+def before_model_callback(callback_context, llm_request):
+    """ADK callback compacting the conversation history of an LLM request in place.
+
+    Runs after the routing callback, so the budget is the routed model's.
+    """
+    if not HISTORY_COMPACTION or not llm_request.contents:
+        return None
+    started = time.perf_counter()
+    llm_request.contents = compact_history(llm_request.contents, budget_for(llm_request.model))
+    metrics.record("compaction", time.perf_counter() - started)
+    return None
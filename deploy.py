@@ -20,6 +20,20 @@ remote_app = reasoning_engines.ReasoningEngine.create(
     ],
     extra_packages=[
         "./agent.py",
+        "./ca_client.py",
+        "./looker_auth.py",
+        "./result_cache.py",
+        "./events.py",
+        "./charts.py",
+        "./results.py",
+        "./result_store.py",
+        "./log_utils.py",
+        "./metrics.py",
+        "./explore_index.py",
+        "./compaction.py",
+        "./model_router.py",
+        "./state.py",
+        "./session_store.py",
     ],
     display_name="CA_API",
 )
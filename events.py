@@ -0,0 +1,106 @@
+import json
+import queue
+import contextvars
+
+# The bus of the request currently being served. ADK runs tools on its own
+# thread but copies the caller's contextvars, so tools see the bus of the run
+# that invoked them.
+_current_bus = contextvars.ContextVar("event_bus", default=None)
+
+_CLOSED = object()
+
+
+class EventBus:
+    """Request-scoped channel carrying thoughts and agent chunks to one stream.
+
+    Producers call `publish`; the consumer iterates the bus and blocks until
+    the next event arrives, so there is no polling between events.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def publish(self, kind, payload=None):
+        """Publishes an event, e.g. ("thought", "Querying...") or ("chunk", {...})."""
+        self._queue.put((kind, payload))
+
+    def close(self):
+        """Marks the end of the stream; iteration stops once it is reached."""
+        self._queue.put(_CLOSED)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _CLOSED:
+                return
+            yield item
+
+
+def set_current_bus(bus):
+    """Binds `bus` to the current context (thread or task)."""
+    _current_bus.set(bus)
+
+
+def get_current_bus():
+    """Returns the bus bound to the current context, if any."""
+    return _current_bus.get()
+
+
+def publish(kind, payload=None):
+    """Publishes to the current context's bus; a no-op outside a streamed request."""
+    bus = _current_bus.get()
+    if bus is not None:
+        bus.publish(kind, payload)
+
+
+def chunk_texts(chunk):
+    """Yields the text parts of an ADK stream_query chunk."""
+    if isinstance(chunk, dict) and "content" in chunk:
+        content = chunk["content"]
+        if "parts" in content:
+            for part in content["parts"]:
+                if "text" in part:
+                    yield part["text"]
+
+
+def _render(kind, payload):
+    if kind == "thought":
+        yield f"THOUGHT: {payload}\n"
+    elif kind == "chunk":
+        for text in chunk_texts(payload):
+            yield f"DATA: {text}\n"
+    elif kind == "insight":
+        yield f"INSIGHT: {json.dumps(payload, default=str)}\n"
+    elif kind == "error":
+        yield f"ERROR: {str(payload)}\n"
+    elif kind == "timing":
+        yield f"TIMING: {json.dumps(payload)}\n"
+
+
+def to_lines(kind, payload, event_id=None):
+    """Renders an event in the /chat line protocol (THOUGHT:/DATA:/INSIGHT:/ERROR:/TIMING: prefixes).
+
+    With `event_id`, an `ID: <n>` line follows the event so clients know
+    the event arrived whole and where to resume from after a dropped
+    connection.
+    """
+    rendered = False
+    for line in _render(kind, payload):
+        rendered = True
+        yield line
+    if rendered and event_id is not None:
+        yield f"ID: {event_id}\n"
+
+
+def to_sse(kind, payload, event_id=None):
+    """Renders an event as Server-Sent Events frames.
+
+    Each frame's data is the same text as the line protocol, split across
+    `data:` fields so multi-line chunks survive SSE framing. The event ID is
+    carried in the `id:` field of the event's last frame.
+    """
+    lines = list(_render(kind, payload))
+    for i, line in enumerate(lines):
+        data = "\n".join(f"data: {l}" for l in line[:-1].split("\n"))
+        id_field = f"id: {event_id}\n" if event_id is not None and i == len(lines) - 1 else ""
+        yield f"event: {kind}\n{id_field}{data}\n\n"
@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import time
+import threading
+import requests
+from dotenv import load_dotenv
+import log_utils
+
+load_dotenv()
+
+LOOKER_CLIENT_ID = os.getenv("LOOKER_CLIENT_ID")
+LOOKER_CLIENT_SECRET = os.getenv("LOOKER_CLIENT_SECRET")
+LOOKER_INSTANCE_URI = os.getenv("LOOKER_INSTANCE_URI")
+
+# Explores questions can be routed to, as comma-separated `model:explore`
+# pairs. Defaults to the single LOOKML_MODEL / EXPLORE pair.
+EXPLORES = os.getenv("EXPLORES") or f"{os.getenv('LOOKML_MODEL', 'gaming')}:{os.getenv('EXPLORE', 'events')}"
+
+# JSON dump of the index (see `python -m explore_index --dump`), used instead
+# of the Looker API when set, e.g. for offline development.
+INDEX_PATH = os.getenv("EXPLORE_INDEX_PATH")
+
+# Seconds between index rebuilds; 0 builds it once.
+REFRESH_INTERVAL = float(os.getenv("EXPLORE_INDEX_REFRESH", "3600"))
+
+# At most this many explores are attached to one question; explores scoring
+# below ROUTE_RATIO of the best match are left out.
+ROUTE_MAX = int(os.getenv("EXPLORE_ROUTE_MAX", "2"))
+ROUTE_RATIO = float(os.getenv("EXPLORE_ROUTE_RATIO", "0.5"))
+
+HTTP_TIMEOUT = float(os.getenv("LOOKER_HTTP_TIMEOUT", "30"))
+
+logger = log_utils.get_logger("explore_index")
+
+_word = re.compile(r"[a-z0-9]+")
+
+# Words that say nothing about which explore a question is about
+STOP_WORDS = frozenset("""
+a an and are as at be by count did do does for from how i in is it me much my of on or per show the this
+to top total was what when where which who whose why with
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased words of `text` with a naive plural strip, minus stop words."""
+    tokens = set()
+    for word in _word.findall((text or "").lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.add(word)
+    return tokens
+
+
+def parse_explores(spec):
+    """Parses `model:explore,model:explore` into a list of (model, explore) pairs."""
+    pairs = []
+    for item in spec.split(","):
+        model, _, explore = item.strip().partition(":")
+        if model and explore:
+            pairs.append((model, explore))
+    return pairs
+
+
+class Explore:
+    """One explore of the index: its fields and the prefix of its explore URLs."""
+
+    def __init__(self, model, explore, label="", description="", fields=None):
+        self.model = model
+        self.explore = explore
+        self.key = f"{model}/{explore}"
+        self.label = label or explore
+        self.description = description or ""
+        # field name -> {"label": ..., "description": ...}
+        self.fields = fields or {}
+        base_uri = (LOOKER_INSTANCE_URI or "").rstrip("/")
+        self.url_prefix = f"{base_uri}/explore/{model}/{explore}?fields="
+
+    def to_dict(self):
+        return {
+            "model": self.model, "explore": self.explore, "label": self.label, "description": self.description,
+            "fields": [dict(name=name, **info) for name, info in self.fields.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        fields = {
+            f["name"]: {"label": f.get("label") or f["name"], "description": f.get("description") or ""}
+            for f in data.get("fields", []) if f.get("name")
+        }
+        return cls(data["model"], data["explore"], data.get("label", ""), data.get("description", ""), fields)
+
+
+class ExploreIndex:
+    """Inverted index from words to the explores whose fields mention them.
+
+    Everything a question needs (token weights, field labels, field owners,
+    URL prefixes) is precomputed, so routing is a few dictionary lookups.
+    """
+
+    def __init__(self, explores, built_at=None, source=""):
+        self.explores = explores
+        self.built_at = built_at or time.time()
+        self.source = source
+        self.default = explores[:1]
+        # field name -> label / owning explore, across all explores
+        self.field_labels = {}
+        self.field_explores = {}
+        # token -> {explore index: weight}
+        self._postings = {}
+        for i, explore in enumerate(explores):
+            weights = {}
+            for token in tokenize(explore.label) | tokenize(explore.explore):
+                weights[token] = weights.get(token, 0) + 2.0
+            for name, info in explore.fields.items():
+                self.field_labels.setdefault(name, info["label"])
+                self.field_explores.setdefault(name, explore)
+                for token in tokenize(name.replace(".", " ").replace("_", " ")) | tokenize(info["label"]):
+                    weights[token] = weights.get(token, 0) + 1.0
+                for token in tokenize(info["description"]):
+                    weights[token] = weights.get(token, 0) + 0.25
+            for token, weight in weights.items():
+                self._postings.setdefault(token, {})[i] = weight
+        # Words found in many explores say little about any one of them
+        for token, postings in self._postings.items():
+            if len(postings) > 1:
+                idf = 1.0 / len(postings)
+                for i in postings:
+                    postings[i] *= idf
+
+    def route(self, question):
+        """Returns the smallest list of explores likely to answer `question` (best first)."""
+        if len(self.explores) <= 1:
+            return self.explores
+        scores = {}
+        for token in tokenize(question):
+            for i, weight in self._postings.get(token, {}).items():
+                scores[i] = scores.get(i, 0.0) + weight
+        if not scores:
+            return self.default
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        best = ranked[0][1]
+        return [self.explores[i] for i, score in ranked[:ROUTE_MAX] if score >= best * ROUTE_RATIO]
+
+    def label_fields(self, fields):
+        """Fills in labels of schema fields that only carry their name."""
+        for f in fields:
+            name = f.get("name")
+            if name and f.get("label") in (None, name):
+                f["label"] = self.field_labels.get(name, name)
+
+    def explore_url(self, field_names, explores):
+        """Builds an explore URL for a result's fields, in the explore owning most of them."""
+        if not field_names:
+            return None
+        target = explores[0] if explores else self.default[0]
+        if len(explores) > 1:
+            # By key: `explores` may come from an index that has since been refreshed
+            owners = [owner.key for owner in map(self.field_explores.get, field_names) if owner is not None]
+            target = max(explores, key=lambda e: owners.count(e.key))
+        return f"{target.url_prefix}{','.join(field_names)}&toggle=dat,pik,vis"
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "built_at": self.built_at,
+            "explores": {e.key: len(e.fields) for e in self.explores},
+            "tokens": len(self._postings),
+        }
+
+
+def load_dump(path):
+    """Loads the explores of a JSON dump written by `dump`."""
+    with open(path) as f:
+        data = json.load(f)
+    return [Explore.from_dict(e) for e in data.get("explores", [])]
+
+
+def dump(explores, path):
+    """Writes explores to a JSON dump loadable with `load_dump`."""
+    with open(path, "w") as f:
+        json.dump({"explores": [e.to_dict() for e in explores]}, f, indent=1)
+
+
+def _api_login(session):
+    response = session.post(f"{LOOKER_INSTANCE_URI.rstrip('/')}/api/4.0/login", data={
+        "client_id": LOOKER_CLIENT_ID, "client_secret": LOOKER_CLIENT_SECRET,
+    }, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def fetch_explores(pairs):
+    """Reads the fields of each (model, explore) from the Looker API with the service account."""
+    session = requests.Session()
+    session.headers["Authorization"] = f"token {_api_login(session)}"
+    base_uri = LOOKER_INSTANCE_URI.rstrip("/")
+    explores = []
+    for model, name in pairs:
+        response = session.get(
+            f"{base_uri}/api/4.0/lookml_models/{model}/explores/{name}",
+            params={"fields": "name,label,description,fields"}, timeout=HTTP_TIMEOUT,
+        )
+        response.raise_for_status()
+        data = response.json()
+        fields = {}
+        for kind in ("dimensions", "measures"):
+            for f in (data.get("fields") or {}).get(kind) or []:
+                if f.get("hidden") or not f.get("name"):
+                    continue
+                fields[f["name"]] = {
+                    "label": f.get("label_short") or f.get("label") or f["name"],
+                    "description": f.get("description") or "",
+                }
+        explores.append(Explore(model, name, data.get("label", ""), data.get("description", ""), fields))
+    return explores
+
+
+def build():
+    """Builds the index from EXPLORE_INDEX_PATH or the Looker API.
+
+    If neither is available, the configured explores are indexed without
+    fields: routing then always picks the first explore.
+    """
+    pairs = parse_explores(EXPLORES)
+    if INDEX_PATH:
+        explores = load_dump(INDEX_PATH)
+        wanted = set(pairs)
+        # The dump may hold more explores than this deployment routes to
+        explores = [e for e in explores if (e.model, e.explore) in wanted] or explores
+        return ExploreIndex(explores, source=INDEX_PATH)
+    if LOOKER_INSTANCE_URI and LOOKER_CLIENT_ID and LOOKER_CLIENT_SECRET:
+        return ExploreIndex(fetch_explores(pairs), source="looker_api")
+    return ExploreIndex([Explore(m, e) for m, e in pairs], source="config")
+
+
+_lock = threading.Lock()
+_index = None
+_refresher = None
+
+
+def _refresh_loop():
+    global _index
+    while True:
+        time.sleep(REFRESH_INTERVAL)
+        try:
+            index = build()
+            with _lock:
+                _index = index
+            logger.info("Explore index refreshed: %s", index.stats()["explores"])
+        except Exception as e:
+            # Keep serving the previous index
+            logger.warning("Explore index refresh failed: %s", e)
+
+
+def get_index():
+    """Returns the current index, building it (and starting the refresher) on first use."""
+    global _index, _refresher
+    if _index is None:
+        with _lock:
+            if _index is None:
+                try:
+                    _index = build()
+                except Exception as e:
+                    logger.warning("Could not build the explore index, routing to the first explore: %s", e)
+                    _index = ExploreIndex([Explore(m, e) for m, e in parse_explores(EXPLORES)], source="config")
+                logger.info("Explore index built from %s: %s", _index.source, _index.stats()["explores"])
+                if REFRESH_INTERVAL > 0 and _refresher is None:
+                    _refresher = threading.Thread(target=_refresh_loop, name="explore-index", daemon=True)
+                    _refresher.start()
+    return _index
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the explore index or write it to a JSON dump.")
+    parser.add_argument("--dump", help="Write the index fetched from the Looker API to this file.")
+    parser.add_argument("--route", help="Print the explores a question is routed to.")
+    args = parser.parse_args()
+    if args.dump:
+        dump(fetch_explores(parse_explores(EXPLORES)), args.dump)
+        print(f"Wrote {args.dump}")
+    index = get_index()
+    print(json.dumps(index.stats(), indent=2))
+    if args.route:
+        print([e.key for e in index.route(args.route)])
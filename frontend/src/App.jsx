@@ -1,4 +1,4 @@
-import { useState, useRef, useEffect } from 'react'
+import { useState, useRef, useEffect, useCallback } from 'react'
 import { useGoogleLogin } from '@react-oauth/google'
 import { Send, Bot, User, Loader2, Code, X, ExternalLink, ChevronDown, ChevronUp } from 'lucide-react'
 import ReactMarkdown from 'react-markdown'
@@ -19,6 +19,8 @@ ChartJS.register(
 );
 import './App.css'
 
+const API_BASE_URL = import.meta.env.DEV ? 'http://127.0.0.1:5001' : '';
+
 const ChartRenderer = ({ config }) => {
   if (!config || !config.data) return null;
 
@@ -75,6 +77,29 @@ const ChartRenderer = ({ config }) => {
   );
 };
 
+// Chart of a large stored result: the model only passes on its config, the
+// series is loaded from the server by result_id
+const StoredChart = ({ config }) => {
+  const [chart, setChart] = useState(null);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    // Read at fetch time so a token renewed during the stream is used
+    const token = localStorage.getItem('looker_access_token')
+    fetch(`${API_BASE_URL}/api/results/${config.result_id}/chart`, {
+      headers: token ? { 'Authorization': `Bearer ${token}` } : {}
+    }).then(async response => {
+      const data = await response.json()
+      if (!response.ok) throw new Error(data.error || 'Failed to load chart')
+      setChart(data)
+    }).catch(e => setError(e.message));
+  }, [config.result_id]);
+
+  if (error) return <div className="result-error">{error}</div>;
+  if (!chart) return <Loader2 className="animate-spin" size={16} />;
+  return <ChartRenderer config={chart} />;
+};
+
 const ContentAccordion = ({ children, title }) => {
   const [isOpen, setIsOpen] = useState(false);
 
@@ -93,6 +118,102 @@ const ContentAccordion = ({ children, title }) => {
   )
 }
 
+// Rows fetched per page of a stored result
+const RESULT_PAGE_SIZE = 200;
+
+// Reconnect attempts when a /chat stream drops before the run finishes
+const MAX_STREAM_RESUMES = 3;
+
+// Pages through a query result stored server-side (referenced by a RESULT: line)
+const ResultRows = ({ resultId, apiBaseUrl, accessToken }) => {
+  const [page, setPage] = useState(null);
+  const [error, setError] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+
+  const loadPage = useCallback((cursor) => {
+    const params = new URLSearchParams({ limit: String(RESULT_PAGE_SIZE), ...(cursor ? { cursor } : {}) })
+    return fetch(`${apiBaseUrl}/api/results/${resultId}/rows?${params}`, {
+      headers: accessToken ? { 'Authorization': `Bearer ${accessToken}` } : {}
+    }).then(async response => {
+      const data = await response.json()
+      if (!response.ok) throw new Error(data.error || 'Failed to load result')
+      return data
+    })
+  }, [resultId, apiBaseUrl, accessToken]);
+
+  useEffect(() => {
+    loadPage(null)
+      .then(data => setPage(data))
+      .catch(e => setError(e.message));
+  }, [loadPage]);
+
+  const loadMore = () => {
+    setIsLoadingMore(true)
+    loadPage(page.next_cursor)
+      .then(data => setPage(prev => ({ ...prev, rows: [...prev.rows, ...data.rows], next_cursor: data.next_cursor })))
+      .catch(e => setError(e.message))
+      .finally(() => setIsLoadingMore(false));
+  };
+
+  if (error) return <div className="result-error">{error}</div>;
+  if (!page) return <Loader2 className="animate-spin" size={16} />;
+
+  const fields = page.schema.fields || [];
+  const names = page.rows.length ? Object.keys(page.rows[0]) : fields.map(f => f.name);
+  const labels = Object.fromEntries(fields.map(f => [f.name, f.label || f.name]));
+
+  return (
+    <div>
+      {page.next_cursor && (
+        <div className="result-note">Showing {page.rows.length} of {page.num_rows} rows</div>
+      )}
+      <table>
+        <thead>
+          <tr>{names.map(n => <th key={n}>{labels[n] || n}</th>)}</tr>
+        </thead>
+        <tbody>
+          {page.rows.map((row, i) => (
+            <tr key={i}>{names.map(n => <td key={n}>{String(row[n] ?? '')}</td>)}</tr>
+          ))}
+        </tbody>
+      </table>
+      {page.next_cursor && (
+        <button className="result-more" onClick={loadMore} disabled={isLoadingMore}>
+          {isLoadingMore ? 'Loading...' : `Load ${Math.min(RESULT_PAGE_SIZE, page.num_rows - page.rows.length)} more rows`}
+        </button>
+      )}
+    </div>
+  );
+};
+
+// Live view of the SQL and first rows streamed by get_insights
+const PreviewPanel = ({ preview }) => {
+  return (
+    <div className="chart-accordion">
+      <div className="chart-content">
+        {preview.sql && <pre className="sql-code">{preview.sql}</pre>}
+        {preview.columns.length > 0 && (
+          <div>
+            <div className="result-note">
+              Preview: {preview.rows.length}{preview.totalRows ? ` of ${preview.totalRows}` : ''} rows
+            </div>
+            <table>
+              <thead>
+                <tr>{preview.columns.map(c => <th key={c.name}>{c.label || c.name}</th>)}</tr>
+              </thead>
+              <tbody>
+                {preview.rows.map((row, i) => (
+                  <tr key={i}>{row.map((v, j) => <td key={j}>{String(v ?? '')}</td>)}</tr>
+                ))}
+              </tbody>
+            </table>
+          </div>
+        )}
+      </div>
+    </div>
+  );
+};
+
 const MetadataAccordion = ({ metadata }) => {
   const [isOpen, setIsOpen] = useState(false);
 
@@ -206,6 +327,8 @@ function App() {
     { role: 'agent', content: 'Hello! I am your mobile gaming data analyst. How can I help you today?' }
   ])
   const [accessToken, setAccessToken] = useState(localStorage.getItem('looker_access_token'))
+  // Epoch seconds at which the access token expires, so the server can reject it up front
+  const [tokenExpiresAt, setTokenExpiresAt] = useState(localStorage.getItem('looker_token_expires_at'))
   const [input, setInput] = useState('')
   const [isLoading, setIsLoading] = useState(false)
   const [showPayload, setShowPayload] = useState(false)
@@ -235,13 +358,26 @@ function App() {
   }, [messages])
 
   // Determine API base URL: localhost for dev, relative path for production
-  const API_BASE_URL = import.meta.env.DEV ? 'http://127.0.0.1:5001' : '';
+
+  // Create the chat session up front so the first message doesn't wait for it
+  useEffect(() => {
+    fetch(`${API_BASE_URL}/sessions`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ session_id: sessionId }),
+    }).catch(e => console.log('Session bootstrap failed:', e))
+  }, [sessionId])
 
   const login = useGoogleLogin({
     onSuccess: tokenResponse => {
       console.log(tokenResponse);
       setAccessToken(tokenResponse.access_token);
       localStorage.setItem('looker_access_token', tokenResponse.access_token);
+      if (tokenResponse.expires_in) {
+        const expiresAt = String(Math.floor(Date.now() / 1000) + Number(tokenResponse.expires_in));
+        setTokenExpiresAt(expiresAt);
+        localStorage.setItem('looker_token_expires_at', expiresAt);
+      }
     },
     onError: error => console.log('Login Failed:', error),
     scope: 'https://www.googleapis.com/auth/cloud-platform'
@@ -271,13 +407,25 @@ function App() {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          ...(accessToken ? { 'Authorization': `Bearer ${accessToken}` } : {})
+          ...(accessToken ? { 'Authorization': `Bearer ${accessToken}` } : {}),
+          ...(accessToken && tokenExpiresAt ? { 'X-Access-Token-Expires-At': tokenExpiresAt } : {})
         },
         body: JSON.stringify(requestPayload),
       })
 
+      // The server renews tokens that are about to expire; use the new one from now on
+      const renewedToken = response.headers.get('X-Looker-Access-Token')
+      if (renewedToken) {
+        setAccessToken(renewedToken)
+        localStorage.setItem('looker_access_token', renewedToken)
+      }
+
       if (!response.ok) {
         const data = await response.json()
+        if (response.status === 401 && data.reauth) {
+          // Expired token: back to the login screen instead of failing mid-turn
+          logout()
+        }
         throw new Error(data.error || 'Failed to fetch')
       }
       // Initialize empty agent message
@@ -285,99 +433,255 @@ function App() {
       setMessages(prev => [...prev, { role: 'agent', content: '', thoughts: [] }])
       // setIsLoading(false) // Moved to end of stream
 
-      const reader = response.body.getReader()
-      const decoder = new TextDecoder()
+      // Dropped streams are resumed from the last event seen, without re-running the agent
+      const runId = response.headers.get('X-Run-Id')
+      let lastEventId = 0
       let fullResponse = ''
-      let buffer = ''
 
       // Debug: Track parsed chunks
       const parsedChunks = []
 
-      while (true) {
-        const { done, value } = await reader.read()
-        if (done) break
-
-        buffer += decoder.decode(value, { stream: true })
-
-        // Process buffer line by line
-        const lines = buffer.split('\n')
-        // Keep the last partial line in the buffer
-        buffer = lines.pop() || ''
-
-        for (const line of lines) {
-          // Don't skip empty lines as they might be important for markdown formatting (e.g. paragraph breaks)
-          // if (!line.trim()) continue 
-
-          parsedChunks.push(line) // Log raw line
-
-          if (line.startsWith('THOUGHT: ')) {
-            const thought = line.substring(9)
-            setMessages(prev => {
-              const newMessages = [...prev]
-              const lastMsg = newMessages[newMessages.length - 1]
-              if (lastMsg.role === 'agent') {
-                const currentThoughts = lastMsg.thoughts || []
-                if (!currentThoughts.includes(thought)) {
-                  const updatedThoughts = [...currentThoughts, thought]
-                  lastMsg.thoughts = updatedThoughts
-                }
+      // Handles one line of the THOUGHT:/DATA:/INSIGHT:/ERROR:/LINK:/RESULT:/TIMING:/SUGGESTION: protocol
+      const handleLine = (line) => {
+        // Don't skip empty lines as they might be important for markdown formatting (e.g. paragraph breaks)
+        // if (!line.trim()) return
+
+        parsedChunks.push(line) // Log raw line
+
+        if (line.startsWith('THOUGHT: ')) {
+          const thought = line.substring(9)
+          setMessages(prev => {
+            const newMessages = [...prev]
+            const lastMsg = newMessages[newMessages.length - 1]
+            if (lastMsg.role === 'agent') {
+              const currentThoughts = lastMsg.thoughts || []
+              if (!currentThoughts.includes(thought)) {
+                const updatedThoughts = [...currentThoughts, thought]
+                lastMsg.thoughts = updatedThoughts
               }
-              return newMessages
-            })
-          } else if (line.startsWith('ERROR: ')) {
-            const errorMsg = line.substring(7)
-            fullResponse += `\n\n*Error: ${errorMsg}*`
-            setMessages(prev => {
-              const newMessages = [...prev]
-              const lastMsg = newMessages[newMessages.length - 1]
-              if (lastMsg.role === 'agent') {
-                lastMsg.content = fullResponse
+            }
+            return newMessages
+          })
+        } else if (line.startsWith('ERROR: ')) {
+          const errorMsg = line.substring(7)
+          fullResponse += `\n\n*Error: ${errorMsg}*`
+          setMessages(prev => {
+            const newMessages = [...prev]
+            const lastMsg = newMessages[newMessages.length - 1]
+            if (lastMsg.role === 'agent') {
+              lastMsg.content = fullResponse
+            }
+            return newMessages
+          })
+        } else if (line.startsWith('LINK: ')) {
+          const link = line.substring(6)
+          setMessages(prev => {
+            const newMessages = [...prev]
+            const lastMsg = newMessages[newMessages.length - 1]
+            if (lastMsg.role === 'agent') {
+              lastMsg.link = link
+            }
+            return newMessages
+          })
+        } else if (line.startsWith('INSIGHT: ')) {
+          // Partial CA API output streamed before the agent's answer is ready
+          let insight
+          try {
+            insight = JSON.parse(line.substring(9))
+          } catch (e) {
+            return
+          }
+          setMessages(prev => {
+            const newMessages = [...prev]
+            const lastMsg = newMessages[newMessages.length - 1]
+            if (lastMsg.role !== 'agent') return newMessages
+            const preview = { ...(lastMsg.preview || { columns: [], rows: [] }) }
+            if (insight.type === 'text' && insight.text) {
+              const currentThoughts = lastMsg.thoughts || []
+              if (!currentThoughts.includes(insight.text)) {
+                lastMsg.thoughts = [...currentThoughts, insight.text]
               }
-              return newMessages
-            })
-          } else if (line.startsWith('LINK: ')) {
-            const link = line.substring(6)
+            } else if (insight.type === 'sql') {
+              preview.sql = insight.sql
+            } else if (insight.type === 'columns') {
+              preview.columns = insight.columns
+              preview.rows = []
+            } else if (insight.type === 'rows') {
+              preview.rows = [...preview.rows, ...insight.rows]
+              preview.totalRows = insight.total_rows
+            }
+            lastMsg.preview = preview
+            return newMessages
+          })
+        } else if (line.startsWith('RESULT: ')) {
+          const resultId = line.substring(8).trim()
+          setMessages(prev => {
+            const newMessages = [...prev]
+            const lastMsg = newMessages[newMessages.length - 1]
+            if (lastMsg.role === 'agent') {
+              lastMsg.resultId = resultId
+            }
+            return newMessages
+          })
+        } else if (line.startsWith('TIMING: ')) {
+          // Per-stage timing summary, sent as the last event when requested
+          try {
+            const timing = JSON.parse(line.substring(8))
+            console.log('Request timing:', timing)
             setMessages(prev => {
               const newMessages = [...prev]
               const lastMsg = newMessages[newMessages.length - 1]
               if (lastMsg.role === 'agent') {
-                lastMsg.link = link
+                lastMsg.timing = timing
               }
               return newMessages
             })
-          } else if (line.startsWith('SUGGESTION: ')) {
-            const suggestion = line.substring(12)
-            setMessages(prev => {
-              const newMessages = [...prev]
-              const lastMsg = newMessages[newMessages.length - 1]
-              if (lastMsg.role === 'agent') {
-                const currentSuggestions = lastMsg.suggestions || []
-                if (!currentSuggestions.includes(suggestion)) {
-                  lastMsg.suggestions = [...currentSuggestions, suggestion]
-                }
+          } catch (e) {
+            // Ignore malformed timing lines
+          }
+        } else if (line.startsWith('SUGGESTION: ')) {
+          const suggestion = line.substring(12)
+          setMessages(prev => {
+            const newMessages = [...prev]
+            const lastMsg = newMessages[newMessages.length - 1]
+            if (lastMsg.role === 'agent') {
+              const currentSuggestions = lastMsg.suggestions || []
+              if (!currentSuggestions.includes(suggestion)) {
+                lastMsg.suggestions = [...currentSuggestions, suggestion]
               }
-              return newMessages
-            })
-          } else {
-            // Assume it's data content
-            let contentLine = line;
-            if (line.startsWith('DATA: ')) {
-              contentLine = line.substring(6);
             }
+            return newMessages
+          })
+        } else {
+          // Assume it's data content
+          let contentLine = line;
+          if (line.startsWith('DATA: ')) {
+            contentLine = line.substring(6);
+          }
 
-            // Append with newline to preserve formatting
-            fullResponse += contentLine + '\n'
+          // Append with newline to preserve formatting
+          fullResponse += contentLine + '\n'
 
-            setMessages(prev => {
-              const newMessages = [...prev]
-              const lastMsg = newMessages[newMessages.length - 1]
-              if (lastMsg.role === 'agent') {
-                lastMsg.content = fullResponse
+          setMessages(prev => {
+            const newMessages = [...prev]
+            const lastMsg = newMessages[newMessages.length - 1]
+            if (lastMsg.role === 'agent') {
+              lastMsg.content = fullResponse
+            }
+            return newMessages
+          })
+        }
+      }
+
+      // Lines of the event being received. They are only applied once the
+      // event's ID arrives, so an event cut off by a dropped connection is
+      // dropped here and replayed whole on resume instead of shown twice.
+      let pendingLines = []
+      const completeEvent = (id) => {
+        pendingLines.forEach(handleLine)
+        pendingLines = []
+        lastEventId = id || lastEventId
+      }
+      const receiveLine = (line) => {
+        if (!runId) {
+          // Not resumable, so nothing is replayed
+          handleLine(line)
+        } else if (line.startsWith('ID: ')) {
+          completeEvent(Number(line.substring(4)))
+        } else {
+          pendingLines.push(line)
+        }
+      }
+
+      const readStream = async (streamResponse) => {
+        // Anything left over is the partial event of a dropped stream
+        pendingLines = []
+        const reader = streamResponse.body.getReader()
+        const decoder = new TextDecoder()
+        let buffer = ''
+        // The ASGI server streams the same lines wrapped in Server-Sent Events frames
+        const isEventStream = (streamResponse.headers.get('Content-Type') || '').includes('text/event-stream')
+
+        while (true) {
+          const { done, value } = await reader.read()
+          if (done) {
+            // Events without an ID (e.g. a replay gap notice) end with the stream
+            completeEvent(lastEventId)
+            break
+          }
+
+          buffer += decoder.decode(value, { stream: true })
+
+          if (isEventStream) {
+            // Process complete SSE frames; keep the trailing partial frame in the buffer
+            const frames = buffer.split('\n\n')
+            buffer = frames.pop() || ''
+
+            for (const frame of frames) {
+              const fields = frame.split('\n')
+              const dataLines = fields.filter(l => l.startsWith('data:'))
+              if (dataLines.length) {
+                const payload = dataLines
+                  .map(l => l.substring(l.startsWith('data: ') ? 6 : 5))
+                  .join('\n')
+                for (const line of payload.split('\n')) {
+                  if (runId) pendingLines.push(line)
+                  else handleLine(line)
+                }
               }
-              return newMessages
+              // Only an event's last frame carries its id
+              const idField = fields.find(l => l.startsWith('id:'))
+              if (idField) {
+                completeEvent(Number(idField.substring(3).trim()))
+              }
+            }
+            continue
+          }
+
+          // Process buffer line by line
+          const lines = buffer.split('\n')
+          // Keep the last partial line in the buffer
+          buffer = lines.pop() || ''
+
+          for (const line of lines) {
+            receiveLine(line)
+          }
+        }
+      }
+
+      // Reopens the run after the last event seen; retries while the network is down
+      let resumes = 0
+      const resumeRun = async (streamError) => {
+        while (runId && resumes < MAX_STREAM_RESUMES) {
+          resumes++
+          await new Promise(resolve => setTimeout(resolve, 500 * resumes))
+          try {
+            const resumed = await fetch(`${API_BASE_URL}/chat/runs/${runId}`, {
+              headers: {
+                'Last-Event-ID': String(lastEventId),
+                ...(accessToken ? { 'Authorization': `Bearer ${accessToken}` } : {}),
+                ...(accessToken && tokenExpiresAt ? { 'X-Access-Token-Expires-At': tokenExpiresAt } : {})
+              },
             })
+            // A 404 means the run expired (or isn't ours); nothing left to resume
+            if (!resumed.ok) break
+            return resumed
+          } catch (e) {
+            // Still offline; try again
           }
         }
+        throw streamError
+      }
+
+      let streamResponse = response
+      while (true) {
+        try {
+          await readStream(streamResponse)
+          break
+        } catch (streamError) {
+          console.warn(`Stream dropped after event ${lastEventId}, resuming run ${runId}`, streamError)
+          streamResponse = await resumeRun(streamError)
+        }
       }
 
       // Update debug panel with detailed parsing info
@@ -454,6 +758,9 @@ function App() {
       if (isChart) {
         try {
           const config = JSON.parse(String(children).replace(/\n$/, ''))
+          if (config.type && config.series && !config.data && config.result_id) {
+            return <StoredChart config={config} />
+          }
           if (config.type && config.data && config.series) {
             return <ChartRenderer config={config} />
           }
@@ -485,8 +792,17 @@ function App() {
   }).current
 
   const logout = () => {
+    if (accessToken) {
+      // Lets the server stop renewing this token; the client logs out either way
+      fetch(`${API_BASE_URL}/auth/logout`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${accessToken}` }
+      }).catch(() => {});
+    }
     setAccessToken(null);
+    setTokenExpiresAt(null);
     localStorage.removeItem('looker_access_token');
+    localStorage.removeItem('looker_token_expires_at');
   };
 
   if (!accessToken) {
@@ -551,6 +867,11 @@ function App() {
                     />
                   )}
 
+                  {/* Render live preview of the query while the answer is being written */}
+                  {msg.preview && !msg.content && index === messages.length - 1 && isLoading && (
+                    <PreviewPanel preview={msg.preview} />
+                  )}
+
                   <div className="message-text">
                     <ReactMarkdown
                       remarkPlugins={[remarkGfm]}
@@ -560,6 +881,13 @@ function App() {
                     </ReactMarkdown>
                   </div>
 
+                  {/* Render Full Result (large results are summarized for the model) */}
+                  {msg.resultId && (
+                    <ContentAccordion title="Full Result">
+                      <ResultRows resultId={msg.resultId} apiBaseUrl={API_BASE_URL} accessToken={accessToken} />
+                    </ContentAccordion>
+                  )}
+
                   {/* Render Explore Link */}
                   {msg.link && (
                     <div className="message-actions">
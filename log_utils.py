@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import time
+import logging
+
+# LOG_LEVEL controls what is emitted (DEBUG detail is skipped entirely in
+# production). LOG_FORMAT=json writes one JSON object per line, which Cloud
+# Logging parses into structured entries; it is the default on Cloud Run.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if os.getenv("K_SERVICE") else "text")
+
+# Longest payload representation written to a single record.
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+# Per-chunk records: the first LOG_CHUNK_HEAD chunks of a stream are logged,
+# then only every LOG_CHUNK_EVERY-th one.
+CHUNK_HEAD = int(os.getenv("LOG_CHUNK_HEAD", "5"))
+CHUNK_EVERY = int(os.getenv("LOG_CHUNK_EVERY", "50"))
+
+LOGGER_NAME = "ca_api"
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON with Cloud Logging's `severity` key."""
+
+    def format(self, record):
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "logger": record.name,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Attaches a stdout handler to the application logger (idempotent)."""
+    logger = logging.getLogger(LOGGER_NAME)
+    if getattr(logger, "_ca_api_configured", False):
+        return logger
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    logger._ca_api_configured = True
+    return logger
+
+
+def get_logger(name):
+    """Returns a child of the application logger, e.g. get_logger("agent")."""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class truncate:
+    """Lazily formatted, size-capped view of a payload for log arguments.
+
+    The payload is only converted to a string if the record is actually
+    emitted, e.g. `logger.debug("Schema: %s", truncate(schema))`.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = PAYLOAD_MAX_CHARS if limit is None else limit
+
+    def __str__(self):
+        text = str(self.value)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}... [{len(text) - self.limit} more chars]"
+        return text
+
+    __repr__ = __str__
+
+
+def should_log_chunk(index):
+    """Sampling decision for per-chunk records of a stream."""
+    return index < CHUNK_HEAD or (CHUNK_EVERY > 0 and index % CHUNK_EVERY == 0)
@@ -0,0 +1,236 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import ca_client
+import state
+
+load_dotenv()
+
+LOOKER_CLIENT_ID = os.getenv("LOOKER_CLIENT_ID")
+LOOKER_CLIENT_SECRET = os.getenv("LOOKER_CLIENT_SECRET")
+LOOKER_INSTANCE_URI = os.getenv("LOOKER_INSTANCE_URI")
+
+# Tokens are renewed with their refresh token once they are this close (in
+# seconds) to expiring, so a turn never starts with a token that dies mid-way.
+REFRESH_MARGIN = int(os.getenv("LOOKER_TOKEN_REFRESH_MARGIN", "300"))
+
+# Upper bound on the number of user tokens tracked server-side.
+TOKEN_CACHE_SIZE = int(os.getenv("LOOKER_TOKEN_CACHE_SIZE", "4096"))
+
+# With a shared STATE_BACKEND, each token's sign-in ID is kept in the shared
+# store until the token expires (or this many seconds if its expiry is
+# unknown), so every worker resolves it to the same owner.
+SIGNIN_TTL = float(os.getenv("LOOKER_SIGNIN_TTL", str(24 * 3600)))
+
+# Keep-alive connections kept open to the Looker instance.
+HTTP_POOL_SIZE = int(os.getenv("LOOKER_HTTP_POOL_SIZE", "16"))
+HTTP_TIMEOUT = float(os.getenv("LOOKER_HTTP_TIMEOUT", "30"))
+
+
+class TokenExpired(Exception):
+    """The caller's access token has expired and can't be renewed."""
+
+
+_http_lock = threading.Lock()
+_http = None
+
+
+def get_http_session():
+    """Returns the process-wide keep-alive `requests.Session` for Looker API calls."""
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http = session
+    return _http
+
+
+def _token_key(access_token):
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+class TokenRecord:
+    """A user's current Looker token, its expiry and refresh token.
+
+    `id` identifies the sign-in and survives refreshes, so whatever the user
+    owns stays theirs when their token is renewed.
+    """
+
+    def __init__(self, access_token, expires_at=None, refresh_token=None):
+        self.id = uuid.uuid4().hex
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.refresh_token = refresh_token
+        # Serializes refreshes so concurrent requests renew the token once
+        self.lock = threading.Lock()
+
+    def expires_within(self, seconds):
+        return self.expires_at is not None and self.expires_at - time.time() <= seconds
+
+
+_lock = threading.Lock()
+# Hash of every access token issued for a record (old ones included, so
+# clients still sending a refreshed-away token find the current one)
+_records = OrderedDict()
+
+
+def _store(access_token, record):
+    with _lock:
+        _records[_token_key(access_token)] = record
+        _records.move_to_end(_token_key(access_token))
+        while len(_records) > TOKEN_CACHE_SIZE:
+            _records.popitem(last=False)
+
+
+def _signin_key(token_key):
+    return state.key("signin", token_key)
+
+
+def _share(access_token, record):
+    # Lets the other workers map this token to the record's sign-in (see owner_key)
+    if not state.is_shared():
+        return
+    ttl = record.expires_at - time.time() + REFRESH_MARGIN if record.expires_at else SIGNIN_TTL
+    state.get_store().set(_signin_key(_token_key(access_token)), record.id, max(ttl, 1))
+
+
+def _lookup(access_token):
+    key = _token_key(access_token)
+    with _lock:
+        record = _records.get(key)
+        if record is not None:
+            _records.move_to_end(key)
+        return record
+
+
+def remember(token_response, issued_at=None):
+    """Tracks a token endpoint response (`access_token`, `expires_in`, `refresh_token`)."""
+    issued_at = issued_at or time.time()
+    expires_in = token_response.get("expires_in")
+    record = TokenRecord(
+        token_response["access_token"],
+        expires_at=issued_at + float(expires_in) if expires_in else None,
+        refresh_token=token_response.get("refresh_token"),
+    )
+    _store(record.access_token, record)
+    _share(record.access_token, record)
+    return record
+
+
+def _token_url():
+    return f"{(LOOKER_INSTANCE_URI or '').rstrip('/')}/api/token"
+
+
+def exchange_code(code, redirect_uri):
+    """Exchanges an OAuth authorization code for a token and tracks it."""
+    issued_at = time.time()
+    response = get_http_session().post(_token_url(), data={
+        "client_id": LOOKER_CLIENT_ID,
+        "client_secret": LOOKER_CLIENT_SECRET,
+        "code": code,
+        "grant_type": "authorization_code",
+        "redirect_uri": redirect_uri,
+    }, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    token = response.json()
+    remember(token, issued_at)
+    return token
+
+
+def _refresh(record):
+    issued_at = time.time()
+    response = get_http_session().post(_token_url(), data={
+        "client_id": LOOKER_CLIENT_ID,
+        "client_secret": LOOKER_CLIENT_SECRET,
+        "refresh_token": record.refresh_token,
+        "grant_type": "refresh_token",
+    }, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    token = response.json()
+    expires_in = token.get("expires_in")
+    record.access_token = token["access_token"]
+    record.expires_at = issued_at + float(expires_in) if expires_in else None
+    record.refresh_token = token.get("refresh_token") or record.refresh_token
+    _store(record.access_token, record)
+    _share(record.access_token, record)
+
+
+def resolve(access_token, expires_at=None):
+    """Returns (current access token, expires_at) for the token a caller sent.
+
+    Tokens issued through `exchange_code` are renewed with their refresh
+    token when they are within REFRESH_MARGIN of expiring. Other tokens are
+    passed through, with `expires_at` if the client reported one.
+
+    Raises:
+        TokenExpired: If the token is known to have expired and can't be renewed.
+    """
+    if not access_token:
+        return None, None
+    record = _lookup(access_token)
+    if record is None:
+        if expires_at is not None and expires_at <= time.time():
+            raise TokenExpired("Looker access token has expired; please sign in again.")
+        return access_token, expires_at
+
+    if record.expires_within(REFRESH_MARGIN) and record.refresh_token:
+        with record.lock:
+            # Another request may have refreshed it while we waited
+            if record.expires_within(REFRESH_MARGIN):
+                try:
+                    _refresh(record)
+                except requests.RequestException:
+                    if record.expires_within(0):
+                        forget(access_token)
+                        raise TokenExpired("Looker access token has expired and could not be refreshed.")
+                    # Still valid for now; try again on the next request
+    if record.expires_within(0):
+        # The user has to sign in again, which starts a new record
+        forget(access_token)
+        raise TokenExpired("Looker access token has expired; please sign in again.")
+    return record.access_token, record.expires_at
+
+
+def owner_key(access_token=None):
+    """Returns the identity that owns the caller's stored results and runs.
+
+    Tracked tokens map to their sign-in, so ownership survives refreshes;
+    with a shared STATE_BACKEND so do tokens tracked by another worker.
+    Other tokens fall back to `ca_client.credential_key`.
+    """
+    if not access_token:
+        return ca_client.credential_key(None)
+    record = _lookup(access_token)
+    if record is not None:
+        return ("login", record.id)
+    if state.is_shared():
+        signin = state.get_store().get(_signin_key(_token_key(access_token)))
+        if signin:
+            return ("login", signin)
+    return ca_client.credential_key(access_token)
+
+
+def forget(access_token):
+    """Stops tracking a token's sign-in (every token issued for it), e.g. on logout."""
+    if not access_token:
+        return
+    keys = [_token_key(access_token)]
+    with _lock:
+        record = _records.pop(keys[0], None)
+        if record is not None:
+            keys += [k for k, r in _records.items() if r is record]
+            for key in keys[1:]:
+                del _records[key]
+    if state.is_shared():
+        for key in keys:
+            state.get_store().delete(_signin_key(key))
@@ -0,0 +1,303 @@
+import os
+import time
+import threading
+import contextlib
+import contextvars
+
+# Emit a per-request timing summary as the last event of every /chat stream.
+# Clients can also ask for it per request with `"timing": true`.
+STREAM_TIMING = os.getenv("STREAM_TIMING", "0") == "1"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_number(value)}"
+
+
+class Gauge:
+    """Value that can go up and down, optionally split by labels."""
+
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            self._values[key] = value
+
+    def samples(self):
+        with _lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with _lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, ("le", _format_number(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_number(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+REQUESTS = Counter("ca_api_requests", "HTTP requests by route.", ["route"])
+ERRORS = Counter("ca_api_errors", "Failed requests by route.", ["route"])
+CACHE = Counter("ca_api_insights_cache", "get_insights cache lookups by outcome (hit, coalesced, miss).", ["result"])
+ROWS = Counter("ca_api_rows_returned", "Result rows received from the Conversational Analytics API.")
+STREAM_BYTES = Counter("ca_api_stream_bytes", "Bytes written to streamed responses by route.", ["route"])
+STAGE_SECONDS = Histogram(
+    "ca_api_stage_seconds",
+    "Latency of request stages (session, ca_first_chunk, ca_stream, insights, visualization, compaction, routing, chat).",
+    ["stage"],
+)
+LLM_SECONDS = Histogram("ca_api_llm_seconds", "Latency of LLM turns by agent.", ["agent"])
+PREFETCH = Counter(
+    "ca_api_prefetch",
+    "Suggestion prefetches by outcome (queued, done, failed, busy, budget, full, stale, cancelled).",
+    ["outcome"],
+)
+MODEL_ROUTE = Counter(
+    "ca_api_model_route",
+    "LLM calls by agent, chosen model and reason (question kind or escalation).",
+    ["agent", "model", "reason"],
+)
+HISTORY_COMPACTED = Counter(
+    "ca_api_history_compacted",
+    "Parts of earlier turns compacted before LLM calls by kind (tool_output, tool_call, text, turn).",
+    ["kind"],
+)
+ADMISSION_INFLIGHT = Gauge("ca_api_admission_inflight", "Admitted agent runs / insights requests in flight.")
+ADMISSION_QUEUED = Gauge("ca_api_admission_queued", "Requests waiting for admission by priority class.", ["priority"])
+ADMISSION_WAIT_SECONDS = Histogram(
+    "ca_api_admission_wait_seconds", "Time admitted requests waited in the queue by priority class.", ["priority"]
+)
+ADMISSION_REJECTED = Counter(
+    "ca_api_admission_rejected", "Requests rejected with 429 by reason (user_limit, queue_full, timeout).", ["reason"]
+)
+
+
+def render():
+    """Returns all metrics in the Prometheus text exposition format."""
+    out = []
+    for metric in _registry:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.type_name}")
+        out.extend(metric.samples())
+    return "\n".join(out) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestTimings:
+    """Per-request totals of the stages timed while serving it."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total, count = self._stages.get(stage, (0.0, 0))
+            self._stages[stage] = (total + seconds, count + 1)
+
+    def summary(self):
+        """Returns {"total_ms": ..., "stages": {stage: {"ms": ..., "count": ...}}}."""
+        with self._lock:
+            stages = {k: {"ms": round(t * 1000, 1), "count": c} for k, (t, c) in self._stages.items()}
+        return {"total_ms": round((time.perf_counter() - self.started) * 1000, 1), "stages": stages}
+
+
+# Timings of the request being served; like the event bus, ADK's runner
+# thread sees the timings of the run that invoked it.
+_current_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request():
+    """Binds a fresh RequestTimings to the current context and returns it."""
+    timings = RequestTimings()
+    _current_timings.set(timings)
+    return timings
+
+
+def bind_request(timings):
+    """Binds an existing RequestTimings to the current context (e.g. a worker thread)."""
+    _current_timings.set(timings)
+
+
+def record(stage, seconds):
+    """Records a stage duration in the histogram and the current request's timings."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`, e.g. `with metrics.span("session"): ...`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+# Start times of open LLM turns / agent runs, keyed by (kind, invocation, agent).
+# ADK's before and after callbacks get different context objects, so the start
+# time can't be kept on the context itself.
+_open_spans = {}
+
+# Open spans older than this (seconds) belong to runs that died without their
+# closing callback (ADK has no error callback for whole agent runs) and are dropped.
+OPEN_SPAN_MAX_AGE = float(os.getenv("METRICS_OPEN_SPAN_MAX_AGE", "900"))
+
+
+def _span_key(kind, callback_context):
+    return (kind, callback_context.invocation_id, callback_context.agent_name)
+
+
+def _open_span(key):
+    now = time.perf_counter()
+    with _lock:
+        stale = [k for k, started in _open_spans.items() if now - started > OPEN_SPAN_MAX_AGE]
+        for k in stale:
+            del _open_spans[k]
+        _open_spans[key] = now
+
+
+def _close_span(key):
+    """Removes an open span; returns its duration in seconds, or None if it wasn't open."""
+    with _lock:
+        start = _open_spans.pop(key, None)
+    return None if start is None else time.perf_counter() - start
+
+
+def _observe_llm(callback_context, seconds):
+    LLM_SECONDS.observe(seconds, agent=callback_context.agent_name)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(f"llm:{callback_context.agent_name}", seconds)
+
+
+def before_model_callback(callback_context, llm_request):
+    """ADK callback marking the start of an LLM turn."""
+    _open_span(_span_key("llm", callback_context))
+    return None
+
+
+def after_model_callback(callback_context, llm_response):
+    """ADK callback recording the duration of an LLM turn."""
+    if getattr(llm_response, "partial", False):
+        return None
+    seconds = _close_span(_span_key("llm", callback_context))
+    if seconds is not None:
+        _observe_llm(callback_context, seconds)
+    return None
+
+
+def on_model_error_callback(callback_context, llm_request, error):
+    """ADK callback closing the span of an LLM turn that failed; the error still propagates."""
+    seconds = _close_span(_span_key("llm", callback_context))
+    if seconds is not None:
+        _observe_llm(callback_context, seconds)
+    return None
+
+
+def agent_span_callbacks(stage):
+    """Returns (before_agent_callback, after_agent_callback) timing a whole agent run as `stage`."""
+
+    def before(callback_context):
+        _open_span(_span_key(stage, callback_context))
+        return None
+
+    def after(callback_context):
+        seconds = _close_span(_span_key(stage, callback_context))
+        if seconds is not None:
+            record(stage, seconds)
+        return None
+
+    return before, after
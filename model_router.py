@@ -0,0 +1,114 @@
+import os
+import re
+import time
+import metrics
+import log_utils
+
+logger = log_utils.get_logger("model_router")
+
+# Model of each agent; also the model simple turns escalate to.
+ROOT_AGENT_MODEL = os.getenv("ROOT_AGENT_MODEL", "gemini-2.5-pro")
+DATA_AGENT_MODEL = os.getenv("DATA_AGENT_MODEL", "gemini-2.5-pro")
+VISUALIZATION_AGENT_MODEL = os.getenv("VISUALIZATION_AGENT_MODEL", "gemini-2.5-pro")
+
+# Faster model used for simple turns. Set MODEL_ROUTING=0 (or FAST_MODEL to
+# an empty string) to always use the agents' own models.
+FAST_MODEL = os.getenv("FAST_MODEL", "gemini-2.5-flash")
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1" and bool(FAST_MODEL)
+
+# Question kinds answered by FAST_MODEL; the others go to the agent's model.
+FAST_KINDS = frozenset(k.strip() for k in os.getenv("MODEL_FAST_KINDS", "single_metric,breakdown,formatting").split(","))
+
+# A turn on FAST_MODEL escalates once it has taken this many model calls
+# (the fast model is going in circles) or a tool in it failed.
+ESCALATE_AFTER_CALLS = int(os.getenv("MODEL_ESCALATE_AFTER_CALLS", "3"))
+
+KINDS = ("single_metric", "breakdown", "trend", "complex")
+
+_complex = re.compile(
+    r"\b(why|compare[ds]?|comparison|versus|vs\.?|correlat\w*|forecast\w*|predict\w*|explain\w*|"
+    r"differences? between|ratio|share of|percentage of|growth|cohort\w*|retention|anomal\w*|outliers?)\b"
+)
+_trend = re.compile(
+    r"\b(trend\w*|over time|time series|history|historical|daily|weekly|monthly|quarterly|yearly|"
+    r"(by|per|each|every) (hour|day|week|month|quarter|year)|over the (last|past)|since)\b"
+)
+_breakdown = re.compile(
+    r"\b(by|per|each|breakdown|broken down|split|grouped|distribution|top \d+|top|bottom|rank\w*|which|list)\b"
+)
+_word = re.compile(r"\w+")
+
+
+def classify(question):
+    """Classifies a question as "single_metric", "breakdown", "trend" or "complex".
+
+    Keyword rules, checked from the most to the least demanding kind; long or
+    multi-part questions count as complex.
+    """
+    text = (question or "").lower()
+    if _complex.search(text) or len(_word.findall(text)) > 30 or text.count("?") > 1:
+        return "complex"
+    if _trend.search(text):
+        return "trend"
+    if _breakdown.search(text):
+        return "breakdown"
+    return "single_metric"
+
+
+def _current_turn(contents):
+    # The latest user message and everything after it
+    for i in range(len(contents) - 1, -1, -1):
+        content = contents[i]
+        if content.role == "user" and any(p.text for p in content.parts or ()):
+            return content, contents[i + 1:]
+    return None, contents
+
+
+def _failed(response):
+    return isinstance(response, dict) and ("error" in response or response.get("status") not in (None, "success"))
+
+
+def choose_model(kind, model, turn):
+    """Returns (model, reason) for an LLM call of a turn of the given kind.
+
+    Args:
+        kind: The turn's question kind (see `classify`) or "formatting".
+        model: The agent's own model.
+        turn: The contents of the turn so far, after the user's message.
+    """
+    if kind not in FAST_KINDS:
+        return model, kind
+    calls = sum(1 for c in turn if c.role == "model")
+    if calls >= ESCALATE_AFTER_CALLS:
+        return model, "escalated:calls"
+    for content in turn:
+        for part in content.parts or ():
+            if part.function_response is not None and _failed(part.function_response.response):
+                return model, "escalated:tool_error"
+    return FAST_MODEL, kind
+
+
+def routing_callback(kind=None):
+    """Returns an ADK before_model_callback that picks the model of each LLM call.
+
+    With `kind` unset the turn's question is classified; agents doing pure
+    formatting work pass kind="formatting". The decision and the time it
+    took are recorded in metrics.
+    """
+
+    def before_model_callback(callback_context, llm_request):
+        if not MODEL_ROUTING or not llm_request.contents:
+            return None
+        started = time.perf_counter()
+        message, turn = _current_turn(llm_request.contents)
+        turn_kind = kind
+        if turn_kind is None:
+            turn_kind = classify(" ".join(p.text for p in message.parts if p.text)) if message else "complex"
+        model, reason = choose_model(turn_kind, llm_request.model, turn)
+        llm_request.model = model
+        metrics.record("routing", time.perf_counter() - started)
+        metrics.MODEL_ROUTE.inc(agent=callback_context.agent_name, model=model, reason=reason)
+        logger.debug("Routed %s call to %s (%s)", callback_context.agent_name, model, reason)
+        return None
+
+    return before_model_callback
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import agent
+import metrics
+import log_utils
+import rate_limit
+import result_cache
+
+logger = log_utils.get_logger("prefetch")
+
+# Prefetch the answers to a turn's SUGGESTION: lines after it finishes. Off by
+# default; clients can also opt in per request with `"prefetch": true`.
+PREFETCH_SUGGESTIONS = os.getenv("PREFETCH_SUGGESTIONS", "0") == "1"
+
+# Background threads running prefetches; this bounds the extra CA API load.
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+
+# Suggestions prefetched per turn, and prefetches allowed to wait for a worker.
+PREFETCH_PER_TURN = int(os.getenv("PREFETCH_PER_TURN", "3"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "16"))
+
+# Budget: prefetches started per second across all users (bursts up to
+# PREFETCH_BURST). PREFETCH_RATE=0 turns prefetching off.
+PREFETCH_RATE = float(os.getenv("PREFETCH_RATE", "0.5"))
+PREFETCH_BURST = float(os.getenv("PREFETCH_BURST", "6"))
+
+# Prefetches are skipped while interactive requests are queued or admission
+# slots are more than this fraction full.
+PREFETCH_MAX_LOAD = float(os.getenv("PREFETCH_MAX_LOAD", "0.5"))
+
+# Prefetches that waited longer than this (seconds) for a worker are dropped.
+PREFETCH_MAX_AGE = float(os.getenv("PREFETCH_MAX_AGE", "30"))
+
+SUGGESTION_PREFIX = "SUGGESTION: "
+
+
+def parse_suggestions(text, limit=PREFETCH_PER_TURN):
+    """Returns the distinct `SUGGESTION:` questions in an agent response, in order."""
+    suggestions = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(SUGGESTION_PREFIX):
+            question = line[len(SUGGESTION_PREFIX):].strip()
+            if question and question not in suggestions:
+                suggestions.append(question)
+    return suggestions[:limit]
+
+
+class Prefetcher:
+    """Runs suggested follow-up questions through `agent.query_insights` in the background.
+
+    Results land in the insights cache under the user's credentials, so when
+    the user picks a suggestion the agent's get_insights call is a cache hit
+    (or joins the prefetch still in flight). Prefetching never competes with
+    interactive traffic: it runs on its own small pool, spends from a global
+    token bucket, backs off while `controller` (the AdmissionController) is
+    loaded, and pending prefetches are cancelled once the user asks something
+    else.
+    """
+
+    def __init__(self, controller=None, workers=PREFETCH_WORKERS, max_pending=PREFETCH_MAX_PENDING,
+                 rate=PREFETCH_RATE, burst=PREFETCH_BURST, max_load=PREFETCH_MAX_LOAD, max_age=PREFETCH_MAX_AGE):
+        self.controller = controller
+        self.max_pending = max_pending
+        self.max_load = max_load
+        self.max_age = max_age
+        # No budget means prefetching is off
+        self.budget = rate_limit.TokenBucket(rate, burst) if rate > 0 else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        # session key -> [(question, future)] not yet finished
+        self._pending = {}
+        self._pending_count = 0
+
+    def _busy(self):
+        if self.controller is None or not self.controller.enabled:
+            return False
+        inflight, queued = self.controller.load()
+        return queued > 0 or inflight >= self.controller.max_inflight * self.max_load
+
+    def _run(self, session_key, question, access_token, expires_at, queued_at):
+        try:
+            if time.monotonic() - queued_at > self.max_age:
+                metrics.PREFETCH.inc(outcome="stale")
+                return
+            if self._busy():
+                metrics.PREFETCH.inc(outcome="busy")
+                return
+            if not self.budget.try_acquire():
+                metrics.PREFETCH.inc(outcome="budget")
+                return
+            # Pool threads are shared, so always bind this user's token
+            agent.set_access_token(access_token, expires_at)
+            try:
+                agent.query_insights(question)
+                metrics.PREFETCH.inc(outcome="done")
+            except Exception as e:
+                metrics.PREFETCH.inc(outcome="failed")
+                logger.info("Prefetch of %r failed: %s", question, e)
+        finally:
+            with self._lock:
+                self._pending_count -= 1
+                entries = self._pending.get(session_key)
+                if entries is not None:
+                    entries[:] = [e for e in entries if e[0] != question]
+                    if not entries:
+                        del self._pending[session_key]
+
+    def submit(self, session_key, suggestions, access_token=None, expires_at=None):
+        """Queues prefetches of `suggestions` for the session; returns how many were queued."""
+        if self.budget is None:
+            return 0
+        queued = 0
+        now = time.monotonic()
+        with self._lock:
+            entries = self._pending.setdefault(session_key, [])
+            for question in suggestions:
+                if any(q == question for q, _ in entries):
+                    continue
+                if self._pending_count >= self.max_pending:
+                    metrics.PREFETCH.inc(outcome="full")
+                    continue
+                self._pending_count += 1
+                future = self._executor.submit(self._run, session_key, question, access_token, expires_at, now)
+                entries.append((question, future))
+                queued += 1
+                metrics.PREFETCH.inc(outcome="queued")
+            if not entries:
+                self._pending.pop(session_key, None)
+        return queued
+
+    def cancel(self, session_key, keep=None):
+        """Cancels the session's prefetches that haven't started, except the one for `keep`.
+
+        Called when the user sends their next message: suggestions they didn't
+        pick are no longer worth the CA API call.
+        """
+        keep = result_cache.normalize_question(keep) if keep else None
+        with self._lock:
+            entries = self._pending.get(session_key, ())
+            for question, future in entries:
+                if result_cache.normalize_question(question) != keep and future.cancel():
+                    # Cancelled futures never run _run, so account for them here
+                    self._pending_count -= 1
+                    metrics.PREFETCH.inc(outcome="cancelled")
+            remaining = [e for e in entries if not e[1].cancelled()]
+            if remaining:
+                self._pending[session_key] = remaining
+            else:
+                self._pending.pop(session_key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"pending": self._pending_count, "sessions": len(self._pending)}
@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# Seconds a cached get_insights result stays fresh. 0 disables caching (identical
+# in-flight questions are still coalesced).
+CACHE_TTL = float(os.getenv("INSIGHTS_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("INSIGHTS_CACHE_MAX_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(os.getenv("INSIGHTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Normalizes a question so trivially different phrasings share a cache entry.
+
+    Only whitespace and trailing punctuation are normalized. Case is kept:
+    filter values (e.g. 'US' vs 'us') and product names may be case-sensitive
+    and produce different SQL.
+    """
+    return _whitespace.sub(" ", question.strip()).rstrip(" ?.!")
+
+
+def make_key(question, lookml_model, explore, credential_key):
+    """Builds the cache key for a question asked against an explore by a caller."""
+    return (normalize_question(question), lookml_model, explore, credential_key)
+
+
+def estimate_size(value):
+    """Approximates the in-memory footprint of a result by its JSON length.
+
+    Objects providing `estimate_size()` (e.g. ColumnarResult) report their own
+    size instead of being serialized.
+    """
+    sizes = []
+
+    def default(obj):
+        if hasattr(obj, 'estimate_size'):
+            sizes.append(obj.estimate_size())
+            return None
+        return str(obj)
+
+    try:
+        return len(json.dumps(value, default=default)) + sum(sizes)
+    except Exception:
+        return 0
+
+
+class _InFlight:
+    """A computation that other callers with the same key can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResultCache:
+    """TTL + LRU cache with single-flight deduplication of concurrent misses."""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._in_flight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None if missing or expired."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove_locked(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _remove_locked(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def put(self, key, value):
+        """Stores `value` under `key`, evicting least recently used entries to fit."""
+        if self.ttl <= 0:
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, should_cache=None):
+        """Returns the cached value for `key`, or runs `compute` exactly once.
+
+        Concurrent callers asking for the same key while `compute` is running
+        wait for it and receive the same result (or exception) instead of
+        starting their own upstream call.
+
+        Args:
+            key: Cache key from `make_key`.
+            compute: Zero-argument callable producing the value.
+            should_cache: Optional predicate deciding whether a computed value
+                may be stored (e.g. to skip partial or error results).
+
+        Returns:
+            A (value, source) tuple where source is "hit", "coalesced" or "miss".
+        """
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value, "hit"
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._in_flight[key] = _InFlight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, "coalesced"
+
+        try:
+            flight.result = compute()
+            if should_cache is None or should_cache(flight.result):
+                self.put(key, flight.result)
+            return flight.result, "miss"
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
+
+    def clear(self):
+        """Drops every cached entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns hit/miss counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "in_flight": len(self._in_flight),
+                "ttl_seconds": self.ttl,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
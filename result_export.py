@@ -0,0 +1,144 @@
+import os
+import io
+import csv
+import json
+import importlib.util
+
+# Default and maximum page size of GET /api/results/<id>/rows.
+ROWS_PAGE_SIZE = int(os.getenv("RESULT_ROWS_PAGE_SIZE", "500"))
+ROWS_PAGE_MAX = int(os.getenv("RESULT_ROWS_PAGE_MAX", "10000"))
+
+# Rows serialized per chunk when streaming CSV / Arrow; bounds the memory an
+# export needs on top of the stored result.
+EXPORT_CHUNK_ROWS = int(os.getenv("RESULT_EXPORT_CHUNK_ROWS", "5000"))
+
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def arrow_available():
+    """Whether the optional pyarrow dependency is installed."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def parse_page(args):
+    """Returns (start, limit, error message) from `cursor` and `limit` query parameters.
+
+    Cursors are opaque to clients; they are the offset of the next row.
+    """
+    try:
+        start = int(args.get("cursor") or 0)
+        limit = int(args.get("limit") or ROWS_PAGE_SIZE)
+    except ValueError:
+        return None, None, "cursor and limit must be integers"
+    if start < 0 or limit <= 0:
+        return None, None, "cursor must be >= 0 and limit > 0"
+    return start, min(limit, ROWS_PAGE_MAX), None
+
+
+def page(result, start, limit, columnar=False):
+    """Returns one page of a ColumnarResult with the cursor of the next page (None at the end)."""
+    stop = min(start + limit, result.num_rows)
+    out = {"num_rows": result.num_rows, "start": start}
+    if start == 0:
+        out["schema"] = result.schema_dict()
+    if columnar:
+        out["columns"] = {name: column[start:stop] for name, column in result.columns.items()}
+    else:
+        out["rows"] = list(result.rows(start=start, stop=stop))
+    out["next_cursor"] = str(stop) if stop < result.num_rows else None
+    return out
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def iter_csv(result, start=0, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yields a CSV export (labelled header row, then rows from `start`) in chunks of `chunk_rows` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    labels = result.labels()
+    names = list(result.columns)
+    writer.writerow([labels[n] for n in names])
+    cols = [result.columns[n] for n in names]
+    for chunk_start in range(start, result.num_rows, chunk_rows):
+        chunk_stop = min(chunk_start + chunk_rows, result.num_rows)
+        writer.writerows([_csv_value(c[i]) for c in cols] for i in range(chunk_start, chunk_stop))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _arrow_type(pa, column):
+    # One type per column for the whole stream, inferred without copying the column
+    kinds = set()
+    for value in column:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add("bool")
+        elif isinstance(value, int):
+            kinds.add("int")
+        elif isinstance(value, float):
+            kinds.add("float")
+        else:
+            return pa.string()
+        if len(kinds) > 1 and not kinds <= {"int", "float"}:
+            return pa.string()
+    if kinds == {"bool"}:
+        return pa.bool_()
+    if kinds == {"int"}:
+        return pa.int64()
+    if kinds:
+        return pa.float64()
+    return pa.string()
+
+
+def _arrow_value(value, is_string):
+    if value is None or not is_string or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def iter_arrow(result, start=0, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yields an Arrow IPC stream of the rows from `start`, one record batch per chunk.
+
+    Requires pyarrow; check `arrow_available()` first.
+    """
+    import pyarrow as pa
+
+    names = list(result.columns)
+    labels = result.labels()
+    cols = [result.columns[n] for n in names]
+    types = [_arrow_type(pa, c) for c in cols]
+    schema = pa.schema([
+        pa.field(n, t, metadata={"label": str(labels[n])}) for n, t in zip(names, types)
+    ])
+
+    sink = io.BytesIO()
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for chunk_start in range(start, result.num_rows, chunk_rows):
+            chunk_stop = min(chunk_start + chunk_rows, result.num_rows)
+            arrays = [
+                pa.array([_arrow_value(v, pa.types.is_string(t)) for v in c[chunk_start:chunk_stop]], type=t)
+                for c, t in zip(cols, types)
+            ]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield drain()
+    # End-of-stream marker written on close
+    yield drain()
@@ -0,0 +1,58 @@
+import os
+import json
+import uuid
+import result_cache
+import results
+import state
+
+# Full query results are kept server-side under a result ID so large results
+# can be handed to the model as a summary and fetched by the frontend directly.
+STORE_TTL = float(os.getenv("RESULT_STORE_TTL", "3600"))
+STORE_MAX_ENTRIES = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "1024"))
+STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# With a shared STATE_BACKEND, results are also written there so any worker
+# can serve them; this process's copies stay in `_store` for fast reads.
+_store = result_cache.ResultCache(ttl=STORE_TTL, max_entries=STORE_MAX_ENTRIES, max_bytes=STORE_MAX_BYTES)
+
+
+def put(result, owner):
+    """Stores a ColumnarResult for the caller identified by `owner` and returns its ID."""
+    result_id = uuid.uuid4().hex
+    _store.put(result_id, (owner, result))
+    if state.is_shared():
+        state.get_store().set(
+            state.key("result", result_id),
+            json.dumps({"owner": owner, "result": result.to_columnar_dict()}, default=str),
+            STORE_TTL,
+        )
+    return result_id
+
+
+def _load_shared(result_id):
+    raw = state.get_store().get(state.key("result", result_id))
+    if raw is None:
+        return None
+    data = json.loads(raw)
+    # Owners are credential-key tuples, which JSON turns into lists
+    entry = (tuple(data["owner"]), results.ColumnarResult.from_columnar_dict(data["result"]))
+    _store.put(result_id, entry)
+    return entry
+
+
+def get(result_id, owner):
+    """Returns the stored result, or None if it is unknown, expired or owned by someone else."""
+    entry = _store.get(result_id)
+    if entry is None and state.is_shared():
+        entry = _load_shared(result_id)
+    if entry is None:
+        return None
+    stored_owner, result = entry
+    if stored_owner != owner:
+        return None
+    return result
+
+
+def stats():
+    """Returns occupancy of the result store."""
+    return _store.stats()
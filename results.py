@@ -0,0 +1,273 @@
+import json
+import proto
+from google.protobuf import json_format
+
+
+def field_label(field):
+    """Returns the display label of a schema field."""
+    # Looker API usually provides 'title' or 'label_short' or 'label'
+    return (field.get('label_short') or field.get('label') or field.get('display_name')
+            or field.get('title') or field.get('name'))
+
+
+def _value_to_python(value):
+    """Converts a protobuf Value to the equivalent plain Python value."""
+    kind = value.WhichOneof("kind")
+    if kind == "number_value":
+        return value.number_value
+    if kind == "string_value":
+        return value.string_value
+    if kind == "bool_value":
+        return value.bool_value
+    if kind in ("struct_value", "list_value"):
+        return json_format.MessageToDict(getattr(value, kind))
+    return None
+
+
+class ColumnarResult:
+    """A query result stored as a schema plus one array per column.
+
+    Labels are resolved once on the schema fields; row dictionaries are only
+    produced on demand via `rows()` / `to_rows()`.
+    """
+
+    def __init__(self, fields, columns, num_rows, name="", schema=None, extras=None):
+        self.fields = fields
+        self.columns = columns
+        self.num_rows = num_rows
+        self.name = name
+        # Schema attributes other than `fields` (description, filters, ...)
+        self.schema = schema or {}
+        # Keys attached to the result after the fact, e.g. `explore_url`
+        self.extras = extras or {}
+
+    @classmethod
+    def from_proto(cls, result):
+        """Builds a ColumnarResult from a `DataResult`, reading rows straight from the protobuf."""
+        schema = type(result.schema).to_dict(result.schema)
+        fields = schema.pop('fields', [])
+        for f in fields:
+            f['label'] = field_label(f)
+
+        columns = {f['name']: [] for f in fields if f.get('name')}
+        num_rows = 0
+        for row in result._pb.data:
+            for name, value in row.fields.items():
+                column = columns.get(name)
+                if column is None:
+                    # Row key missing from the schema; backfill earlier rows
+                    column = columns[name] = [None] * num_rows
+                column.append(_value_to_python(value))
+            num_rows += 1
+            for column in columns.values():
+                if len(column) < num_rows:
+                    column.append(None)
+
+        return cls(fields, columns, num_rows, name=result.name, schema=schema)
+
+    @classmethod
+    def from_rows(cls, fields, rows, name=""):
+        """Builds a ColumnarResult from a schema field list and row dictionaries."""
+        fields = [dict(f, label=field_label(f)) for f in fields]
+        names = [f['name'] for f in fields if f.get('name')]
+        for row in rows:
+            for k in row:
+                if k not in names:
+                    names.append(k)
+        columns = {n: [row.get(n) for row in rows] for n in names}
+        return cls(fields, columns, len(rows), name=name)
+
+    def labels(self):
+        """Maps column names to display labels."""
+        label_map = {f['name']: f['label'] for f in self.fields if f.get('name')}
+        return {n: label_map.get(n, n) for n in self.columns}
+
+    def row_keys(self, labeled=False):
+        """Maps column names to row dictionary keys: names, or labels if `labeled`.
+
+        Columns sharing a label keep their name, so no column is lost.
+        """
+        if not labeled:
+            return {n: n for n in self.columns}
+        labels = self.labels()
+        counts = {}
+        for label in labels.values():
+            counts[label] = counts.get(label, 0) + 1
+        return {n: label if counts[label] == 1 else n for n, label in labels.items()}
+
+    def rows(self, labeled=False, start=0, stop=None):
+        """Yields row dictionaries, keyed by field name (or label if `labeled`)."""
+        names = list(self.columns)
+        row_keys = self.row_keys(labeled)
+        keys = [row_keys[n] for n in names]
+        cols = [self.columns[n] for n in names]
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        for i in range(start, stop):
+            yield {k: c[i] for k, c in zip(keys, cols)}
+
+    def to_rows(self, labeled=False):
+        """Returns all rows as a list of dictionaries."""
+        return list(self.rows(labeled=labeled))
+
+    def estimate_size(self):
+        """Approximates the serialized size from a sample of each column."""
+        total = 0
+        for name, column in self.columns.items():
+            sample = column[:100]
+            if sample:
+                per_value = sum(len(str(v)) + 2 for v in sample) / len(sample)
+                total += int(per_value * len(column)) + len(name)
+        return total
+
+    def column_stats(self, top_values=5, max_distinct=10000):
+        """Summary statistics per column.
+
+        Numeric columns get min/max/mean/sum; other columns get a distinct
+        count (capped at `max_distinct`) and their most frequent values.
+        """
+        stats = {}
+        for name, column in self.columns.items():
+            values = [v for v in column if v is not None]
+            entry = {'null_count': len(column) - len(values)}
+            if values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                total = sum(values)
+                entry.update(min=min(values), max=max(values), sum=total, mean=total / len(values))
+            else:
+                counts = {}
+                for v in values:
+                    key = v if isinstance(v, (str, int, float, bool)) else str(v)
+                    if key in counts:
+                        counts[key] += 1
+                    elif len(counts) < max_distinct:
+                        counts[key] = 1
+                entry['distinct_count'] = len(counts)
+                entry['top_values'] = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:top_values]
+            stats[name] = entry
+        return stats
+
+    def to_summary_dict(self, sample_rows=20, labeled=False):
+        """Bounded view for the model: schema, row count, column stats and the first rows.
+
+        The full result stays server-side and is referenced by `result_id`
+        (set in `extras` when the result is stored). With `labeled`, rows
+        and stats are keyed by display label.
+        """
+        row_keys = self.row_keys(labeled)
+        out = {
+            'name': self.name,
+            'schema': self.schema_dict(),
+            'row_count': self.num_rows,
+            'truncated': True,
+            'stats': {row_keys[n]: entry for n, entry in self.column_stats().items()},
+            'data': list(self.rows(labeled=labeled, stop=sample_rows)),
+        }
+        out.update(self.extras)
+        return out
+
+    def schema_dict(self):
+        """Returns the schema with its (labelled) fields."""
+        return dict(self.schema, fields=self.fields)
+
+    def to_dict(self, labeled=False):
+        """Row-oriented view matching the CA API `result` shape (`schema` + `data`)."""
+        out = {'name': self.name, 'schema': self.schema_dict(), 'data': self.to_rows(labeled=labeled)}
+        out.update(self.extras)
+        return out
+
+    def to_columnar_dict(self):
+        """Compact view: `schema`, per-column arrays in `columns` and `num_rows`."""
+        out = {'name': self.name, 'schema': self.schema_dict(), 'columns': self.columns, 'num_rows': self.num_rows}
+        out.update(self.extras)
+        return out
+
+    @classmethod
+    def from_columnar_dict(cls, data):
+        """Rebuilds a ColumnarResult from its `to_columnar_dict` view."""
+        schema = dict(data.get('schema') or {})
+        fields = schema.pop('fields', [])
+        extras = {k: v for k, v in data.items() if k not in ('name', 'schema', 'columns', 'num_rows')}
+        return cls(fields, data['columns'], data['num_rows'], name=data.get('name', ''), schema=schema, extras=extras)
+
+
+def data_message_to_dict(data_message):
+    """Converts a `DataMessage` to a dict whose `result` is a ColumnarResult.
+
+    Everything except the result rows goes through the regular proto-plus
+    `to_dict`. `formatted_data` (a second, string-formatted copy of every row)
+    is not carried over.
+    """
+    out = {}
+    for field, _ in data_message._pb.ListFields():
+        if field.name == 'result':
+            out['result'] = ColumnarResult.from_proto(data_message.result)
+            continue
+        value = getattr(data_message, field.name)
+        out[field.name] = type(value).to_dict(value) if isinstance(value, proto.Message) else value
+    return out
+
+
+def materialize(response, columnar=False, handoff_rows=0, sample_rows=20, labeled=False):
+    """Returns a JSON-ready copy of a get_insights response.
+
+    ColumnarResults inside `data_insights` are expanded to rows, or to the
+    compact columnar shape if `columnar` is set. Other values are shared, not
+    copied.
+
+    Args:
+        response: The response built by get_insights.
+        columnar: Return per-column arrays instead of row dictionaries.
+        handoff_rows: If > 0, results with more rows than this are replaced
+            by `to_summary_dict(sample_rows)`, and the `chart` built from
+            them loses its `data` in favour of the `result_id`.
+        sample_rows: Rows included in a summarized result.
+        labeled: Key rows by display label rather than field name, as the
+            model should show them.
+    """
+    insights = response.get('data_insights')
+    if not insights:
+        return response
+    out = dict(response)
+    out['data_insights'] = []
+    handed_off = None
+    for insight in insights:
+        result = insight.get('result')
+        if isinstance(result, ColumnarResult):
+            if handoff_rows > 0 and result.num_rows > handoff_rows:
+                view = result.to_summary_dict(sample_rows, labeled=labeled)
+                handed_off = result
+            elif columnar:
+                view = result.to_columnar_dict()
+            else:
+                view = result.to_dict(labeled=labeled)
+            insight = dict(insight, result=view)
+        out['data_insights'].append(insight)
+    chart = out.get('chart')
+    if chart and handed_off is not None and handed_off.extras.get('result_id'):
+        # Like the rows, the chart's series stays server-side: the model gets
+        # the config without `data`, and the frontend loads the full chart
+        # from /api/results/<result_id>/chart
+        out['chart'] = {k: v for k, v in chart.items() if k != 'data'}
+        out['chart']['result_id'] = handed_off.extras['result_id']
+    return out
+
+
+def _encode(obj):
+    if isinstance(obj, ColumnarResult):
+        return {'__columnar__': obj.to_columnar_dict()}
+    return str(obj)
+
+
+def _decode(obj):
+    if '__columnar__' in obj:
+        return ColumnarResult.from_columnar_dict(obj['__columnar__'])
+    return obj
+
+
+def dumps_response(response):
+    """Serializes a get_insights response (with its ColumnarResults) to JSON."""
+    return json.dumps(response, default=_encode)
+
+
+def loads_response(text):
+    """Inverse of `dumps_response`."""
+    return json.loads(text, object_hook=_decode)
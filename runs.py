@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict, deque
+import state
+
+# Events kept per run for replay; older events of very long runs are dropped.
+RUN_REPLAY_EVENTS = int(os.getenv("RUN_REPLAY_EVENTS", "2000"))
+
+# Seconds a finished run stays available for resuming.
+RUN_REPLAY_TTL = float(os.getenv("RUN_REPLAY_TTL", "300"))
+
+# Upper bound on the number of runs tracked at once.
+RUN_REPLAY_MAX_RUNS = int(os.getenv("RUN_REPLAY_MAX_RUNS", "1000"))
+
+# Seconds between polls of the shared store when following a run that
+# executes in another worker (see RemoteRun).
+RUN_REPLAY_POLL = float(os.getenv("RUN_REPLAY_POLL", "0.1"))
+
+REPLAY_GAP_MESSAGE = "Part of this response is no longer available; please ask again."
+
+
+class Run:
+    """One /chat agent run: an event bus whose events are numbered and kept for replay.
+
+    The agent publishes into the run exactly like into an EventBus; any number
+    of readers (the original request and later reconnects) follow it from a
+    given event ID, so resuming never re-executes the run. With a shared
+    `store` (see state.py), events are also written there so reconnects that
+    land on another worker can follow the run as a RemoteRun.
+    """
+
+    def __init__(self, run_id, owner, max_events=RUN_REPLAY_EVENTS, store=None, ttl=RUN_REPLAY_TTL):
+        self.run_id = run_id
+        self.owner = owner
+        self.done = False
+        self.finished_at = None
+        self._events = deque(maxlen=max_events)
+        self._next_id = 1
+        self._cond = threading.Condition()
+        # (loop, asyncio.Event) of async readers waiting for the next event
+        self._waiters = set()
+        self._store = store
+        self._ttl = ttl
+        self._meta_written = 0.0
+        if store is not None:
+            self._write_meta()
+
+    def _write_meta(self):
+        self._meta_written = time.monotonic()
+        self._store.set(_meta_key(self.run_id), json.dumps({"owner": self.owner, "done": self.done}), self._ttl)
+
+    def publish(self, kind, payload=None):
+        with self._cond:
+            event_id = self._next_id
+            self._events.append((event_id, kind, payload))
+            self._next_id += 1
+            if self._store is not None:
+                # Under the lock, so the shared list stays in event ID order
+                self._store.append(_events_key(self.run_id), json.dumps([event_id, kind, payload], default=str),
+                                   self._ttl)
+                if time.monotonic() - self._meta_written > self._ttl / 4:
+                    self._write_meta()
+            self._cond.notify_all()
+            waiters = list(self._waiters)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def close(self):
+        """Marks the run finished; readers stop once they have seen every event."""
+        with self._cond:
+            self.done = True
+            self.finished_at = time.monotonic()
+            if self._store is not None:
+                self._write_meta()
+            self._cond.notify_all()
+            waiters = list(self._waiters)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def _after(self, last_id):
+        # Returns (events after last_id, whether some were already dropped); caller holds the lock
+        if not self._events:
+            return [], False
+        first_id = self._events[0][0]
+        if last_id < first_id - 1:
+            return [], True
+        return list(itertools.islice(self._events, last_id - first_id + 1, None)), False
+
+    def follow(self, last_id=0):
+        """Yields (event_id, kind, payload) after `last_id`, blocking until the run finishes."""
+        while True:
+            with self._cond:
+                while True:
+                    batch, gap = self._after(last_id)
+                    if batch or gap or self.done:
+                        break
+                    self._cond.wait()
+            if gap:
+                yield None, "error", REPLAY_GAP_MESSAGE
+                return
+            if not batch:
+                return
+            for item in batch:
+                last_id = item[0]
+                yield item
+
+    async def afollow(self, last_id=0):
+        """Async variant of `follow` for readers on an event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = asyncio.Event()
+            with self._cond:
+                batch, gap = self._after(last_id)
+                idle = not (batch or gap or self.done)
+                if idle:
+                    self._waiters.add((loop, waiter))
+            if idle:
+                try:
+                    await waiter.wait()
+                finally:
+                    with self._cond:
+                        self._waiters.discard((loop, waiter))
+                continue
+            if gap:
+                yield None, "error", REPLAY_GAP_MESSAGE
+                return
+            if not batch:
+                return
+            for item in batch:
+                last_id = item[0]
+                yield item
+
+
+def _meta_key(run_id):
+    return state.key("run", run_id)
+
+
+def _events_key(run_id):
+    return state.key("run_events", run_id)
+
+
+class RemoteRun:
+    """A run executing in another worker, followed by polling the shared store."""
+
+    def __init__(self, run_id, owner, store, poll=RUN_REPLAY_POLL):
+        self.run_id = run_id
+        self.owner = owner
+        self._store = store
+        self._poll = poll
+
+    def _read(self, last_id):
+        # Returns (events after last_id, whether the run is over); event N is list index N-1
+        meta = self._store.get(_meta_key(self.run_id))
+        batch = [tuple(json.loads(raw)) for raw in self._store.range(_events_key(self.run_id), last_id)]
+        if meta is None:
+            # Expired, or its worker died before finishing
+            return batch, None
+        return batch, json.loads(meta)["done"]
+
+    def follow(self, last_id=0):
+        """Yields (event_id, kind, payload) after `last_id` until the run finishes."""
+        while True:
+            batch, done = self._read(last_id)
+            for item in batch:
+                last_id = item[0]
+                yield item
+            if done is None and not batch:
+                yield None, "error", REPLAY_GAP_MESSAGE
+                return
+            if done and not batch:
+                return
+            if not batch:
+                time.sleep(self._poll)
+
+    async def afollow(self, last_id=0):
+        """Async variant of `follow`; store reads run off the event loop."""
+        while True:
+            batch, done = await asyncio.to_thread(self._read, last_id)
+            for item in batch:
+                last_id = item[0]
+                yield item
+            if done is None and not batch:
+                yield None, "error", REPLAY_GAP_MESSAGE
+                return
+            if done and not batch:
+                return
+            if not batch:
+                await asyncio.sleep(self._poll)
+
+
+class RunRegistry:
+    """Runs by ID, kept until RUN_REPLAY_TTL seconds after they finish.
+
+    With a shared `store`, runs started by other workers are found there too.
+    """
+
+    def __init__(self, ttl=RUN_REPLAY_TTL, max_runs=RUN_REPLAY_MAX_RUNS, max_events=RUN_REPLAY_EVENTS, store=None):
+        self.ttl = ttl
+        self.max_runs = max_runs
+        self.max_events = max_events
+        self.store = store
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [run_id for run_id, run in self._runs.items()
+                   if run.finished_at is not None and now - run.finished_at > self.ttl]
+        for run_id in expired:
+            del self._runs[run_id]
+
+    def start(self, owner):
+        """Registers a new run for `owner` (the caller's credential key)."""
+        run = Run(uuid.uuid4().hex, owner, self.max_events, self.store, self.ttl)
+        with self._lock:
+            self._prune()
+            self._runs[run.run_id] = run
+            while len(self._runs) > self.max_runs:
+                # Evicted runs keep running; they just can't be resumed
+                self._runs.popitem(last=False)
+        return run
+
+    def get(self, run_id, owner):
+        """Returns the run if it is still available to `owner`, else None."""
+        with self._lock:
+            self._prune()
+            run = self._runs.get(run_id)
+        if run is None and self.store is not None:
+            run = self._get_remote(run_id)
+        if run is None or run.owner != owner:
+            return None
+        return run
+
+    def _get_remote(self, run_id):
+        meta = self.store.get(_meta_key(run_id))
+        if meta is None:
+            return None
+        # Owners are credential-key tuples, which JSON turns into lists
+        return RemoteRun(run_id, tuple(json.loads(meta)["owner"]), self.store)
+
+    def stats(self):
+        with self._lock:
+            self._prune()
+            active = sum(1 for run in self._runs.values() if not run.done)
+            return {"runs": len(self._runs), "active": active}
@@ -1,35 +1,198 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-from agent import app as agent_app, PROJECT_ID, LOCATION
-import vertexai
+from agent import PROJECT_ID, LOCATION
+import os
+import time
 import threading
-import queue
 import agent
-import requests
+import events
+import metrics
+import sessions
+import runs
+import state
+import admission
+import prefetch
+import batch
+import looker_auth
+import json
+import log_utils
+import static_files
+import result_export
 import urllib.parse
-agent.thought_queue = queue.Queue()
 
-# Initialize Vertex AI for local execution
-vertexai.init(
-    project=PROJECT_ID,
-    location=LOCATION,
-    staging_bucket="gs://ca_api",
-)
+logger = log_utils.get_logger("server")
 
-app = Flask(__name__, static_folder='frontend/dist', static_url_path='')
-CORS(app, resources={r"/*": {"origins": "*"}})
+# Build the agent on a background thread at startup so the first request
+# doesn't wait for it. With WARMUP=0 it is built on the first request instead.
+WARMUP = os.getenv("WARMUP", "1") != "0"
 
-@app.route('/')
-def serve_frontend():
-    return app.send_static_file('index.html')
+# The AdkApp, created by get_agent_app() (tests and benchmarks may assign a
+# stand-in before the first request)
+agent_app = None
+_agent_app_lock = threading.Lock()
+started_at = time.monotonic()
+warmup_status = {'state': 'pending' if WARMUP else 'disabled', 'seconds': None, 'error': None}
+
+def get_agent_app():
+    """Returns the AdkApp, initializing Vertex AI and building the agents on first use."""
+    global agent_app
+    if agent_app is None:
+        with _agent_app_lock:
+            if agent_app is None:
+                import vertexai
+
+                # Initialize Vertex AI for local execution
+                vertexai.init(
+                    project=PROJECT_ID,
+                    location=LOCATION,
+                    staging_bucket="gs://ca_api",
+                )
+                agent_app = agent.get_app()
+    return agent_app
+
+def warm_up():
+    """Builds the agent, opens a CA API client and loads the explore index ahead of the first request."""
+    started = time.monotonic()
+    warmup_status['state'] = 'running'
+    try:
+        get_agent_app()
+        warmup_status['state'] = 'done'
+    except Exception as e:
+        warmup_status.update(state='failed', error=str(e))
+        logger.warning("Warm-up failed: %s", e)
+    try:
+        agent.ca_client.get_client()
+    except Exception as e:
+        # Not fatal: the client is created again on the first question
+        logger.warning("Could not create the CA API client during warm-up: %s", e)
+    # Loads the explore index (from the Looker API or EXPLORE_INDEX_PATH); never raises
+    agent.explore_index.get_index()
+    warmup_status['seconds'] = round(time.monotonic() - started, 3)
+    logger.info("Warm-up %s in %.2fs", warmup_status['state'], warmup_status['seconds'])
+
+if WARMUP:
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+# Response header carrying a renewed Looker token; clients should use it from then on
+RENEWED_TOKEN_HEADER = 'X-Looker-Access-Token'
+# Response header naming the /chat run, for resuming it via /chat/runs/<id>
+RUN_ID_HEADER = 'X-Run-Id'
+
+# The built frontend, indexed once at startup and served from memory
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend', 'dist')
+static_manifest = static_files.StaticManifest(STATIC_FOLDER)
+
+app = Flask(__name__, static_folder=None)
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=[RENEWED_TOKEN_HEADER, RUN_ID_HEADER])
+
+def get_bearer_token():
+    """Returns the Looker access token from the Authorization header, if any."""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+    return None
+
+# Remembers which sessions exist so established sessions skip the session service
+session_manager = sessions.SessionManager(get_agent_app)
+
+# Recent /chat runs, replayable by ID after a dropped connection (from any
+# worker when STATE_BACKEND is shared)
+chat_runs = runs.RunRegistry(store=state.get_store() if state.is_shared() else None)
+
+# Caps agent runs globally and per user; excess requests wait briefly in a
+# priority queue (/chat first) or are turned away with a 429
+admission_controller = admission.AdmissionController()
+
+# Answers a turn's suggested follow-ups in the background when enabled
+prefetcher = prefetch.Prefetcher(admission_controller)
+
+def get_looker_token():
+    """Returns (access_token, expires_at) for the caller, renewing a tracked token close to expiry.
+
+    Clients may report their token's expiry (epoch seconds) in the
+    X-Access-Token-Expires-At header so expired tokens are rejected up front.
+    """
+    sent = get_bearer_token()
+    try:
+        expires_at = float(request.headers.get('X-Access-Token-Expires-At') or 0) or None
+    except ValueError:
+        expires_at = None
+    access_token, expires_at = looker_auth.resolve(sent, expires_at)
+    if access_token != sent:
+        g.renewed_token = access_token
+    return access_token, expires_at
+
+@app.errorhandler(looker_auth.TokenExpired)
+def token_expired(e):
+    return jsonify({'error': str(e), 'reauth': True}), 401
 
+@app.errorhandler(admission.Rejected)
+def admission_rejected(e):
+    response = jsonify({'error': str(e), 'reason': e.reason, 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def admission_user(access_token, forwarded_for, remote_addr):
+    """Identifies the caller for per-user limits: their Looker sign-in, else their address."""
+    if access_token:
+        return looker_auth.owner_key(access_token)
+    # The last X-Forwarded-For hop is the one added by our own load balancer
+    return ('addr', (forwarded_for or remote_addr or '').split(',')[-1].strip())
+
+def admit(access_token, priority, slot=True):
+    """Waits for an admission slot for the caller; raises admission.Rejected when saturated.
+
+    With slot=False only the caller's per-user limit is checked and charged.
+    """
+    user = admission_user(access_token, request.headers.get('X-Forwarded-For'), request.remote_addr)
+    return admission_controller.acquire(user, priority, slot=slot)
+
+@app.after_request
+def add_renewed_token(response):
+    renewed = g.get('renewed_token')
+    if renewed:
+        response.headers[RENEWED_TOKEN_HEADER] = renewed
+    return response
+
+def ensure_session(user_id, session_id):
+    """Makes sure the ADK session exists, creating it if needed."""
+    outcome = session_manager.ensure(user_id, session_id)
+    if outcome != "known":
+        logger.info("Session %s: %s", session_id, outcome)
+    return outcome
+
+def forget_session_on_error(user_id, session_id, error):
+    """Drops a cached session the runner no longer finds, so the next turn recreates it."""
+    if "session not found" in str(error).lower():
+        session_manager.forget(user_id, session_id)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Health probe that answers immediately, also while the agent is still warming up.
+
+    With `?ready=1` it returns 503 until the agent has been built.
+    """
+    ready = agent_app is not None
+    body = {
+        'status': 'ok',
+        'ready': ready,
+        'warmup': warmup_status,
+        'uptime_s': round(time.monotonic() - started_at, 3),
+    }
+    if request.args.get('ready') and not ready:
+        return jsonify(body), 503
+    return jsonify(body)
+
+@app.route('/')
 @app.route('/<path:path>')
-def serve_static(path):
-    import os
-    if os.path.exists(app.static_folder + '/' + path):
-        return app.send_static_file(path)
-    else:
-        return app.send_static_file('index.html')
+def serve_static(path=''):
+    """Serves the frontend from the in-memory manifest, with index.html as the SPA fallback."""
+    entry = static_manifest.lookup(path)
+    if entry is None:
+        return jsonify({'error': 'Not found'}), 404
+    status, headers, body = entry.respond(request.headers.get('Accept-Encoding', ''),
+                                          request.headers.get('If-None-Match', ''))
+    return app.response_class(body, status=status, headers=headers)
 
 
 @app.route('/chat', methods=['POST', 'OPTIONS'])
@@ -37,7 +200,7 @@ def chat():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
         
-    print(f"Received request: {request.json}") # Debug log
+    logger.debug("Received request: %s", log_utils.truncate(request.json))
     data = request.json
     user_input = data.get('message')
     user_id = data.get('user_id', 'web_user')
@@ -45,98 +208,117 @@ def chat():
     
     if not user_input:
         return jsonify({'error': 'No message provided'}), 400
+
+    metrics.REQUESTS.inc(route="chat")
+    timings = metrics.start_request()
+    send_timing = metrics.STREAM_TIMING or bool(data.get('timing'))
+    prefetch_suggestions = prefetch.PREFETCH_SUGGESTIONS or bool(data.get('prefetch'))
+    # Resolved before the turn starts, so an expired token fails fast with a 401
+    access_token, expires_at = get_looker_token()
+    # Suggestions from the previous turn that the user didn't pick are stale now
+    prefetch_key = (looker_auth.owner_key(access_token), session_id)
+    prefetcher.cancel(prefetch_key, keep=user_input)
+    # Waits for a free slot, or fails fast with a 429 when saturated
+    ticket = admit(access_token, admission.INTERACTIVE)
     
     try:
-        # Check if session exists, if not create it
-        try:
-            # Try to get the session. Note: get_session requires user_id as well.
-            agent_app.get_session(session_id=session_id, user_id=user_id)
-        except Exception:
-            # If get_session fails, it likely means the session doesn't exist.
-            # So we try to create it.
-            print(f"Session {session_id} not found (or get failed). Creating new session...")
-            try:
-                agent_app.create_session(session_id=session_id, user_id=user_id)
-            except Exception as create_error:
-                 # If creation fails because it already exists, that's fine, we can proceed.
-                 if "already exists" in str(create_error):
-                     print(f"Session {session_id} already exists (race condition?), proceeding.")
-                 else:
-                     print(f"Failed to create session: {create_error}")
-                     raise create_error
-
         # Pass session_id to maintain conversation history, and user_id as required
-        # Queue for agent response chunks
-        response_queue = queue.Queue()
+        # Request-scoped channel for both thoughts and agent response chunks; it
+        # keeps numbered events so a dropped client can resume via /chat/runs/<id>
+        bus = chat_runs.start(looker_auth.owner_key(access_token))
         
-        # Extract token
-        auth_header = request.headers.get('Authorization')
-        access_token = None
-        if auth_header and auth_header.startswith('Bearer '):
-            access_token = auth_header.split(' ')[1]
-
         def run_agent():
-            # Set token for this thread
-            if access_token:
-                agent.set_access_token(access_token)
+            # Bind token and event bus to this run; ADK's runner thread inherits them
+            agent.set_access_token(access_token, expires_at)
+            events.set_current_bus(bus)
+            metrics.bind_request(timings)
 
             try:
-                stream = agent_app.stream_query(message=user_input, user_id=user_id, session_id=session_id)
-                for chunk in stream:
-                    response_queue.put(("chunk", chunk))
-                response_queue.put(("done", None))
+                # Unknown sessions are created here, after the response has started
+                with metrics.span("session"):
+                    ensure_session(user_id, session_id)
+                texts = []
+                with metrics.span("chat"):
+                    stream = get_agent_app().stream_query(message=user_input, user_id=user_id, session_id=session_id)
+                    for chunk in stream:
+                        bus.publish("chunk", chunk)
+                        if prefetch_suggestions:
+                            texts.extend(events.chunk_texts(chunk))
+                if prefetch_suggestions:
+                    prefetcher.submit(prefetch_key, prefetch.parse_suggestions("\n".join(texts)), access_token, expires_at)
             except Exception as e:
-                response_queue.put(("error", e))
+                metrics.ERRORS.inc(route="chat")
+                forget_session_on_error(user_id, session_id, e)
+                bus.publish("error", e)
+            finally:
+                ticket.release()
+                if send_timing:
+                    bus.publish("timing", timings.summary())
+                bus.close()
 
         # Start agent in a separate thread
-        agent_thread = threading.Thread(target=run_agent)
+        agent_thread = threading.Thread(target=run_agent, daemon=True)
         agent_thread.start()
         
-        def generate():
-            while True:
-                # Check for thoughts
-                try:
-                    while True:
-                        thought = agent.thought_queue.get_nowait()
-                        yield f"THOUGHT: {thought}\n"
-                except queue.Empty:
-                    pass
-
-                # Check for agent response
-                try:
-                    # Wait a short time for response to allow thought loop to run frequently
-                    # But not too short to busy-wait excessively
-                    item = response_queue.get(timeout=0.1)
-                    type_, data = item
-                    
-                    if type_ == "chunk":
-                        chunk = data
-                        if isinstance(chunk, dict) and "content" in chunk:
-                            content = chunk["content"]
-                            if "parts" in content:
-                                for part in content["parts"]:
-                                    if "text" in part:
-                                        yield f"DATA: {part['text']}\n"
-                    elif type_ == "done":
-                        break
-                    elif type_ == "error":
-                        yield f"ERROR: {str(data)}\n"
-                        break
-                except queue.Empty:
-                    # If agent is still running, continue loop to check thoughts again
-                    if not agent_thread.is_alive() and response_queue.empty() and agent.thought_queue.empty():
-                         break
-                    continue
-        
-        return app.response_class(generate(), mimetype='text/plain')
+        return stream_run(bus, route="chat")
 
     except Exception as e:
-        print(f"Server Error: {e}") # Log the full error to the console
-        import traceback
-        traceback.print_exc() # Print stack trace
+        ticket.release()
+        metrics.ERRORS.inc(route="chat")
+        logger.exception("Server Error: %s", e) # Logs the stack trace too
         return jsonify({'error': str(e)}), 500
 
 
+def stream_run(run, route, last_id=0):
+    """Streams a run's events after `last_id` in the line protocol, each followed by its ID."""
+    def generate():
+        # Blocks until the next event arrives; ends when the run closes
+        sent = 0
+        try:
+            for event_id, type_, data in run.follow(last_id):
+                for line in events.to_lines(type_, data, event_id):
+                    sent += len(line.encode())
+                    yield line
+                if type_ == "error":
+                    break
+        finally:
+            metrics.STREAM_BYTES.inc(sent, route=route)
+
+    return app.response_class(generate(), mimetype='text/plain', headers={RUN_ID_HEADER: run.run_id})
+
+def parse_last_event_id(value):
+    try:
+        return max(int(value or 0), 0)
+    except ValueError:
+        return 0
+
+@app.route('/chat/runs/<run_id>', methods=['GET'])
+def resume_chat(run_id):
+    """Resumes a /chat stream after the event in Last-Event-ID, without re-running the agent."""
+    owner = looker_auth.owner_key(get_looker_token()[0])
+    run = chat_runs.get(run_id, owner)
+    if run is None:
+        return jsonify({'error': 'Run not found or expired'}), 404
+    metrics.REQUESTS.inc(route="chat_resume")
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    return stream_run(run, route="chat_resume", last_id=last_id)
+
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Creates (or confirms) a chat session ahead of its first message."""
+    data = request.json or {}
+    session_id = data.get('session_id')
+    if not session_id:
+        return jsonify({'error': 'No session_id provided'}), 400
+    user_id = data.get('user_id', 'web_user')
+    try:
+        status = ensure_session(user_id, session_id)
+        return jsonify({'session_id': session_id, 'user_id': user_id, 'status': status})
+    except Exception as e:
+        logger.error("Session Error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/insights', methods=['POST'])
 def insights():
     """Direct API endpoint for the get_insights tool."""
@@ -144,77 +326,182 @@ def insights():
     question = data.get('question')
     if not question:
         return jsonify({'error': 'No question provided'}), 400
-    
-    try:
-        # Extract token
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            agent.set_access_token(auth_header.split(' ')[1])
 
-        # Call the tool directly
-        result = agent.get_insights(question)
+    metrics.REQUESTS.inc(route="insights")
+    access_token, expires_at = get_looker_token()
+    ticket = admit(access_token, admission.BATCH)
+    # Always set the token so a pooled thread never reuses a previous caller's
+    agent.set_access_token(access_token, expires_at)
+    try:
+        # Call the tool directly; "format": "columnar" returns per-column arrays
+        result = agent.query_insights(question, columnar=data.get('format') == 'columnar')
         return jsonify(result)
     except Exception as e:
-        print(f"Insights Error: {e}")
+        metrics.ERRORS.inc(route="insights")
+        logger.error("Insights Error: %s", e)
         return jsonify({'error': str(e)}), 500
+    finally:
+        ticket.release()
 
-@app.route('/auth/login_url', methods=['GET'])
-def login_url():
-    """Returns the Looker OAuth authorization URL."""
+@app.route('/api/insights/batch', methods=['POST'])
+def insights_batch():
+    """Answers several questions concurrently, streaming NDJSON items in completion order."""
+    data = request.json or {}
+    questions, error = batch.validate(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    metrics.REQUESTS.inc(route="insights_batch")
+    access_token, expires_at = get_looker_token()
+    # The batch counts once against the caller's limit; each of its CA API
+    # streams then takes its own global slot in run_batch
+    ticket = admit(access_token, admission.BATCH, slot=False)
+
+    def generate():
+        items = batch.run_batch(
+            questions,
+            access_token=access_token,
+            expires_at=expires_at,
+            columnar=data.get('format') == 'columnar',
+            deadline=data.get('deadline'),
+            controller=admission_controller,
+            user=ticket.user,
+        )
+        for item in items:
+            if item['status'] != 'ok':
+                metrics.ERRORS.inc(route="insights_batch")
+            yield json.dumps(item, default=str) + "\n"
+
+    response = app.response_class(generate(), mimetype='application/x-ndjson')
+    # Runs however the response ends, even if the generator never started
+    response.call_on_close(ticket.release)
+    return response
+
+@app.route('/api/results/<result_id>', methods=['GET'])
+def get_result(result_id):
+    """Returns a stored query result (columnar) by the ID handed out by get_insights."""
+    owner = looker_auth.owner_key(get_looker_token()[0])
+    result = agent.result_store.get(result_id, owner)
+    if result is None:
+        return jsonify({'error': 'Result not found or expired'}), 404
+    return jsonify(result.to_columnar_dict())
+
+@app.route('/api/results/<result_id>/chart', methods=['GET'])
+def get_result_chart(result_id):
+    """Returns the rule-based chart of a stored result, whose series the model only saw without its data."""
+    owner = looker_auth.owner_key(get_looker_token()[0])
+    result = agent.result_store.get(result_id, owner)
+    if result is None:
+        return jsonify({'error': 'Result not found or expired'}), 404
+    chart = agent.charts.build_chart(result)
+    if chart is None:
+        return jsonify({'error': 'No chart for this result'}), 404
+    return jsonify(chart)
+
+@app.route('/api/results/<result_id>/rows', methods=['GET'])
+def get_result_rows(result_id):
+    """Pages through a stored result, or streams it as CSV / Arrow IPC with `format`.
+
+    JSON pages (`format` json or columnar) are selected with `cursor` and
+    `limit` and carry the `next_cursor`; CSV and Arrow stream every row from
+    `cursor` on in bounded chunks.
+    """
+    owner = looker_auth.owner_key(get_looker_token()[0])
+    result = agent.result_store.get(result_id, owner)
+    if result is None:
+        return jsonify({'error': 'Result not found or expired'}), 404
+    start, limit, error = result_export.parse_page(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    fmt = request.args.get('format', 'json')
+    metrics.REQUESTS.inc(route="result_rows")
+    if fmt == 'csv':
+        return app.response_class(result_export.iter_csv(result, start), content_type=result_export.CSV_CONTENT_TYPE,
+                                  headers={'Content-Disposition': f'attachment; filename="{result_id}.csv"'})
+    if fmt == 'arrow':
+        if not result_export.arrow_available():
+            return jsonify({'error': 'Arrow export requires pyarrow on the server'}), 501
+        return app.response_class(result_export.iter_arrow(result, start), content_type=result_export.ARROW_CONTENT_TYPE,
+                                  headers={'Content-Disposition': f'attachment; filename="{result_id}.arrows"'})
+    if fmt not in ('json', 'columnar'):
+        return jsonify({'error': 'format must be json, columnar, csv or arrow'}), 400
+    return jsonify(result_export.page(result, start, limit, columnar=fmt == 'columnar'))
+
+@app.route('/api/insights/cache', methods=['GET'])
+def insights_cache_stats():
+    """Returns hit/miss counters for the get_insights result cache."""
+    return jsonify(agent.insights_cache.stats())
+
+@app.route('/api/admission', methods=['GET'])
+def admission_stats():
+    """Returns in-flight and queued requests, limits and rejection counts."""
+    return jsonify(dict(admission_controller.stats(), prefetch=prefetcher.stats()))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (stage latencies, LLM turns, request/error/cache counters)."""
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+DEFAULT_REDIRECT_URI = 'http://localhost:5173/auth/callback'
+
+def build_login_url(redirect_uri):
+    """Returns the Looker OAuth authorization URL for `redirect_uri`."""
     base_uri = agent.LOOKER_INSTANCE_URI.rstrip('/')
-    client_id = agent.LOOKER_CLIENT_ID
-    redirect_uri = request.args.get('redirect_uri', 'http://localhost:5173/auth/callback')
-    
     params = {
-        'client_id': client_id,
+        'client_id': agent.LOOKER_CLIENT_ID,
         'redirect_uri': redirect_uri,
         'response_type': 'code',
         'scope': 'api'
     }
-    url = f"{base_uri}/auth/authorize?{urllib.parse.urlencode(params)}"
-    return jsonify({'url': url})
+    return f"{base_uri}/auth/authorize?{urllib.parse.urlencode(params)}"
+
+def log_exchange_error(e):
+    logger.error("Token Exchange Error: %s", e)
+    if hasattr(e, 'response') and e.response is not None:
+         logger.error("Response: %s", log_utils.truncate(e.response.text))
+
+def start_reauth():
+    """Starts `gcloud auth application-default login` in the background."""
+    # Note: This will open a browser window on the server machine (your laptop)
+    import subprocess
+    logger.info("Starting re-authentication...")
+    subprocess.Popen(['gcloud', 'auth', 'application-default', 'login'])
+
+@app.route('/auth/login_url', methods=['GET'])
+def login_url():
+    """Returns the Looker OAuth authorization URL."""
+    return jsonify({'url': build_login_url(request.args.get('redirect_uri', DEFAULT_REDIRECT_URI))})
 
 @app.route('/auth/exchange', methods=['POST'])
 def exchange_token():
     """Exchanges authorization code for access token."""
     code = request.json.get('code')
-    redirect_uri = request.json.get('redirect_uri', 'http://localhost:5173/auth/callback')
+    redirect_uri = request.json.get('redirect_uri', DEFAULT_REDIRECT_URI)
     
     if not code:
         return jsonify({'error': 'No code provided'}), 400
         
-    base_uri = agent.LOOKER_INSTANCE_URI.rstrip('/')
-    token_url = f"{base_uri}/api/token"
-    
-    data = {
-        'client_id': agent.LOOKER_CLIENT_ID,
-        'client_secret': agent.LOOKER_CLIENT_SECRET,
-        'code': code,
-        'grant_type': 'authorization_code',
-        'redirect_uri': redirect_uri
-    }
-    
     try:
-        response = requests.post(token_url, data=data)
-        response.raise_for_status()
-        return jsonify(response.json())
+        # Pooled keep-alive session; the token is tracked so it can be renewed before it expires
+        return jsonify(looker_auth.exchange_code(code, redirect_uri))
     except Exception as e:
-        print(f"Token Exchange Error: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-             print(f"Response: {e.response.text}")
+        log_exchange_error(e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/auth/logout', methods=['POST'])
+def logout():
+    """Stops tracking the caller's token, so it is no longer renewed."""
+    looker_auth.forget(get_bearer_token())
+    return jsonify({'status': 'logged out'})
+
 @app.route('/reauth', methods=['POST'])
 def reauth():
     try:
-        # Run gcloud auth application-default login in a subprocess
-        # Note: This will open a browser window on the server machine (your laptop)
-        import subprocess
-        print("Starting re-authentication...")
-        subprocess.Popen(['gcloud', 'auth', 'application-default', 'login'])
+        start_reauth()
         return jsonify({'status': 'Authentication process started. Please check your browser.'})
     except Exception as e:
-        print(f"Reauth Error: {e}")
+        logger.error("Reauth Error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
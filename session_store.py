@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import uuid
+from typing import Any, Optional
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+import state
+
+# Seconds an idle session is kept in the shared store.
+SESSION_TTL = float(os.getenv("STATE_SESSION_TTL", str(7 * 24 * 3600)))
+
+
+class StoreSessionService(BaseSessionService):
+    """ADK session service on a `state` store, so every worker sees every session.
+
+    A session is a small record (state, last update) plus an append-only list
+    of its events, so appending an event is one list push rather than a
+    rewrite of the whole history. State prefixes (app:, user:) are kept in
+    the session's own state; the agents here don't share state across
+    sessions.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def _keys(app_name, user_id, session_id):
+        return (state.key("session", app_name, user_id, session_id),
+                state.key("session_events", app_name, user_id, session_id))
+
+    def _index_key(self, app_name, user_id):
+        return state.key("sessions", app_name, user_id)
+
+    def _load_index(self, app_name, user_id):
+        raw = self.store.get(self._index_key(app_name, user_id))
+        return json.loads(raw) if raw else []
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session_id = session_id.strip() if session_id else uuid.uuid4().hex
+        record_key, _ = self._keys(app_name, user_id, session_id)
+        if self.store.get(record_key) is not None:
+            raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+        now = time.time()
+        self.store.set(record_key, json.dumps({"state": state or {}, "last_update_time": now}), SESSION_TTL)
+        index = self._load_index(app_name, user_id)
+        if session_id not in index:
+            self.store.set(self._index_key(app_name, user_id), json.dumps(index + [session_id]), SESSION_TTL)
+        return Session(app_name=app_name, user_id=user_id, id=session_id, state=state or {}, last_update_time=now)
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        record_key, events_key = self._keys(app_name, user_id, session_id)
+        raw = self.store.get(record_key)
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        events = [Event.model_validate_json(e) for e in self.store.range(events_key)]
+        if config:
+            if config.num_recent_events is not None:
+                events = events[-config.num_recent_events:] if config.num_recent_events else []
+            if config.after_timestamp:
+                events = [e for e in events if e.timestamp >= config.after_timestamp]
+        return Session(app_name=app_name, user_id=user_id, id=session_id, state=record["state"],
+                       events=events, last_update_time=record["last_update_time"])
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        if user_id is None:
+            # Sessions are only indexed per user
+            return ListSessionsResponse()
+        sessions = []
+        for session_id in self._load_index(app_name, user_id):
+            raw = self.store.get(self._keys(app_name, user_id, session_id)[0])
+            if raw is not None:
+                record = json.loads(raw)
+                sessions.append(Session(app_name=app_name, user_id=user_id, id=session_id,
+                                        state=record["state"], last_update_time=record["last_update_time"]))
+        sessions.sort(key=lambda s: s.last_update_time)
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        record_key, events_key = self._keys(app_name, user_id, session_id)
+        self.store.delete(record_key)
+        self.store.delete(events_key)
+        index = [s for s in self._load_index(app_name, user_id) if s != session_id]
+        self.store.set(self._index_key(app_name, user_id), json.dumps(index), SESSION_TTL)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session, event)
+        if event.partial:
+            return event
+        record_key, events_key = self._keys(session.app_name, session.user_id, session.id)
+        self.store.append(events_key, event.model_dump_json(exclude_none=True), SESSION_TTL)
+        session.last_update_time = event.timestamp
+        persisted = {k: v for k, v in session.state.items() if not k.startswith("temp:")}
+        self.store.set(record_key, json.dumps({"state": persisted, "last_update_time": event.timestamp},
+                                              default=str), SESSION_TTL)
+        return event
@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# How long a (user_id, session_id) pair is trusted to exist without asking the
+# session service again. The in-memory session service never expires sessions;
+# with a remote one, keep this below its session lifetime.
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "1800"))
+
+# Upper bound on the number of known sessions kept in memory.
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "10000"))
+
+
+def _is_already_exists(error):
+    return type(error).__name__ == "AlreadyExistsError" or "already exists" in str(error)
+
+
+class SessionManager:
+    """Creates ADK sessions on demand and remembers which ones exist.
+
+    Known sessions are served from memory, so a turn in an established
+    session does no session-service round trip at all. Unknown sessions are
+    created directly (an "already exists" answer counts as success), and
+    concurrent requests for the same session share one creation.
+    """
+
+    def __init__(self, get_app, ttl=SESSION_CACHE_TTL, max_entries=SESSION_CACHE_MAX):
+        # Called for the AdkApp when a session has to be created, so the app
+        # can be built lazily
+        self.get_app = get_app
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._known = OrderedDict()  # (user_id, session_id) -> expires_at
+        self._pending = {}  # (user_id, session_id) -> threading.Lock
+        self._hits = 0
+        self._misses = 0
+
+    def is_known(self, user_id, session_id):
+        """True if the session was created or confirmed within the TTL."""
+        key = (user_id, session_id)
+        with self._lock:
+            expires_at = self._known.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._known[key]
+                return False
+            self._known.move_to_end(key)
+            return True
+
+    def ensure(self, user_id, session_id):
+        """Makes sure the session exists.
+
+        Returns "known" if it was answered from memory, otherwise "created" or
+        "existing" depending on what the session service reported.
+        """
+        if self.is_known(user_id, session_id):
+            self._count_hit()
+            return "known"
+
+        key = (user_id, session_id)
+        with self._lock:
+            pending = self._pending.setdefault(key, threading.Lock())
+        with pending:
+            # Another request may have created it while we waited
+            if self.is_known(user_id, session_id):
+                self._count_hit()
+                return "known"
+            try:
+                outcome = self._create(user_id, session_id)
+                self._remember(key)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+        with self._lock:
+            self._misses += 1
+        return outcome
+
+    def _count_hit(self):
+        with self._lock:
+            self._hits += 1
+
+    def _create(self, user_id, session_id):
+        agent_app = self.get_app()
+        try:
+            agent_app.create_session(user_id=user_id, session_id=session_id)
+            return "created"
+        except Exception as create_error:
+            if _is_already_exists(create_error):
+                return "existing"
+            # Some session services don't accept caller-chosen IDs on create;
+            # the session may still exist, so confirm before giving up.
+            try:
+                if agent_app.get_session(user_id=user_id, session_id=session_id):
+                    return "existing"
+            except Exception:
+                pass
+            raise create_error
+
+    def _remember(self, key):
+        with self._lock:
+            self._known[key] = time.monotonic() + self.ttl
+            self._known.move_to_end(key)
+            while len(self._known) > self.max_entries:
+                self._known.popitem(last=False)
+
+    def forget(self, user_id, session_id):
+        """Drops a session from the cache, e.g. after the runner reported it missing."""
+        with self._lock:
+            self._known.pop((user_id, session_id), None)
+
+    def stats(self):
+        """Returns cache size and hit/miss counters."""
+        with self._lock:
+            return {"size": len(self._known), "hits": self._hits, "misses": self._misses}
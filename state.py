@@ -0,0 +1,219 @@
+import os
+import time
+import sqlite3
+import threading
+
+# Where state shared between server processes lives:
+#   memory - in this process only (the default; run a single worker)
+#   sqlite - a SQLite file, shared by the workers of one instance
+#   redis  - a Redis-protocol server (Redis, Valkey, Memorystore), shared by
+#            workers and instances
+# Sessions, stored results and chat replay buffers go to the shared store, so
+# any worker can continue a conversation, serve a result or resume a stream.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "/tmp/ca_api_state.db")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+
+# Prefix of every key, so several deployments can share one Redis.
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "ca_api:")
+
+
+class InProcessStore:
+    """Key/value and list store in this process's memory.
+
+    The reference implementation of the store interface: string values,
+    optional TTLs in seconds, and append-only lists read from an index on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}  # key -> (value, expires_at)
+        self._lists = {}  # key -> ([values], expires_at)
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    @staticmethod
+    def _live(entry):
+        return entry is not None and (entry[1] is None or entry[1] > time.time())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            return entry[0] if self._live(entry) else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, self._expires(ttl))
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+            self._lists.pop(key, None)
+
+    def append(self, key, value, ttl=None):
+        """Appends to the list at `key`, (re)setting its TTL."""
+        with self._lock:
+            entry = self._lists.get(key)
+            items = entry[0] if self._live(entry) else []
+            items.append(value)
+            self._lists[key] = (items, self._expires(ttl))
+
+    def range(self, key, start=0):
+        """Returns the list items at `key` from index `start` on."""
+        with self._lock:
+            entry = self._lists.get(key)
+            return list(entry[0][start:]) if self._live(entry) else []
+
+
+class SQLiteStore:
+    """Store in a SQLite file, for several worker processes on one host.
+
+    Each thread gets its own connection; WAL mode lets readers proceed while
+    a writer commits.
+    """
+
+    # Expired rows are deleted every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path=STATE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS lists (key TEXT, idx INTEGER, value TEXT, PRIMARY KEY (key, idx))")
+            # One expiry per list, so appending doesn't touch earlier items
+            conn.execute("CREATE TABLE IF NOT EXISTS list_ttl (key TEXT PRIMARY KEY, expires_at REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def _wrote(self, conn):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            now = time.time()
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+            conn.execute("DELETE FROM lists WHERE key IN (SELECT key FROM list_ttl WHERE expires_at < ?)", (now,))
+            conn.execute("DELETE FROM list_ttl WHERE expires_at < ?", (now,))
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, self._expires(ttl)))
+        self._wrote(conn)
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        conn.execute("DELETE FROM lists WHERE key = ?", (key,))
+        conn.execute("DELETE FROM list_ttl WHERE key = ?", (key,))
+
+    def append(self, key, value, ttl=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO lists SELECT ?, COALESCE(MAX(idx) + 1, 0), ? FROM lists WHERE key = ?", (key, value, key)
+            )
+            conn.execute("INSERT OR REPLACE INTO list_ttl VALUES (?, ?)", (key, self._expires(ttl)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._wrote(conn)
+
+    def range(self, key, start=0):
+        rows = self._conn().execute(
+            "SELECT value FROM lists WHERE key = ? AND idx >= ? AND NOT EXISTS "
+            "(SELECT 1 FROM list_ttl WHERE list_ttl.key = lists.key AND expires_at <= ?) ORDER BY idx",
+            (key, start, time.time()),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+class RedisStore:
+    """Store on a Redis-protocol server, shared by every worker and instance."""
+
+    def __init__(self, url=STATE_REDIS_URL):
+        # Optional dependency, only needed with STATE_BACKEND=redis
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key):
+        return self._redis.get(key)
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(key, value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+    def append(self, key, value, ttl=None):
+        pipe = self._redis.pipeline()
+        pipe.rpush(key, value)
+        if ttl:
+            pipe.expire(key, int(ttl))
+        pipe.execute()
+
+    def range(self, key, start=0):
+        return self._redis.lrange(key, start, -1)
+
+
+BACKENDS = {"memory": InProcessStore, "sqlite": SQLiteStore, "redis": RedisStore}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the store of the configured STATE_BACKEND, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if STATE_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}; expected one of {sorted(BACKENDS)}")
+                _store = BACKENDS[STATE_BACKEND]()
+    return _store
+
+
+def key(*parts):
+    """Builds a store key from its parts, e.g. key("result", result_id)."""
+    return STATE_KEY_PREFIX + ":".join(str(p) for p in parts)
+
+
+def is_shared():
+    """True if state is shared with other processes (any backend but memory)."""
+    return STATE_BACKEND != "memory"
+
+
+def session_service_builder():
+    """Returns the AdkApp session_service_builder for the configured backend.
+
+    None keeps ADK's default in-memory sessions.
+    """
+    if not is_shared():
+        return None
+
+    def build():
+        import session_store
+        return session_store.StoreSessionService(get_store())
+
+    return build
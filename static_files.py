@@ -0,0 +1,157 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Vite emits content-hashed file names under assets/, e.g. index-B3x9_kQz.js;
+# these never change and can be cached forever.
+HASHED_ASSET = re.compile(r"(^|/)assets/.+[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# index.html must always be revalidated so new deploys are picked up
+REVALIDATE_CACHE = "no-cache"
+DEFAULT_CACHE = "public, max-age=3600"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+MIN_COMPRESS_SIZE = 1024
+
+# Files larger than this are read from disk per request instead of being held in memory
+MAX_MEMORY_FILE_SIZE = int(os.getenv("STATIC_MAX_MEMORY_FILE_SIZE", str(4 * 1024 * 1024)))
+
+
+class StaticFile:
+    """A file of the built frontend with its headers and compressed variants."""
+
+    def __init__(self, path, rel_path):
+        self.path = path
+        self.rel_path = rel_path
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+        with open(path, "rb") as f:
+            data = f.read()
+        self.size = len(data)
+        self.etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+        self.data = data if self.size <= MAX_MEMORY_FILE_SIZE else None
+        if HASHED_ASSET.search(rel_path):
+            self.cache_control = IMMUTABLE_CACHE
+        elif rel_path == "index.html":
+            self.cache_control = REVALIDATE_CACHE
+        else:
+            self.cache_control = DEFAULT_CACHE
+        self.compressible = self.content_type.startswith(COMPRESSIBLE_TYPES) and self.size >= MIN_COMPRESS_SIZE
+        self._variants = {}
+        self._lock = threading.Lock()
+        # Variants produced at build time (e.g. by a compression plugin) are used as-is
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if os.path.isfile(path + suffix):
+                with open(path + suffix, "rb") as f:
+                    self._variants[encoding] = f.read()
+
+    def read(self):
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def variant(self, encoding):
+        """Returns the body compressed with `encoding`, compressing on first use."""
+        body = self._variants.get(encoding)
+        if body is None and self.compressible and self.data is not None:
+            with self._lock:
+                body = self._variants.get(encoding)
+                if body is None:
+                    if encoding == "br" and brotli is not None:
+                        body = brotli.compress(self.data)
+                    elif encoding == "gzip":
+                        body = gzip.compress(self.data, compresslevel=9, mtime=0)
+                    if body is not None:
+                        self._variants[encoding] = body
+        return body
+
+    def respond(self, accept_encoding="", if_none_match=""):
+        """Returns (status, headers, body) for a GET with the given request headers."""
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if if_none_match and (if_none_match.strip() == "*" or self.etag in [t.strip() for t in if_none_match.split(",")]):
+            return 304, headers, b""
+        headers["Content-Type"] = self.content_type
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted:
+                body = self.variant(encoding)
+                if body is not None and len(body) < self.size:
+                    headers["Content-Encoding"] = encoding
+                    return 200, headers, body
+        return 200, headers, self.read()
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticManifest:
+    """In-memory index of the built frontend (`frontend/dist`), made once at startup.
+
+    Lookups are dictionary hits; the SPA fallback serves index.html for any
+    path that isn't a file.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        if os.path.isdir(root):
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    if name.endswith((".gz", ".br")) and os.path.isfile(os.path.join(dirpath, name[:-3])):
+                        continue
+                    full_path = os.path.join(dirpath, name)
+                    rel_path = os.path.relpath(full_path, root).replace(os.sep, "/")
+                    self.files[rel_path] = StaticFile(full_path, rel_path)
+        self.index = self.files.get("index.html")
+
+    def lookup(self, path):
+        """Returns the StaticFile for a request path, the index for unknown paths, or None."""
+        entry = self.files.get(path.lstrip("/"))
+        if entry is not None:
+            return entry
+        # Missing hashed assets are real 404s, not SPA routes
+        if HASHED_ASSET.search(path):
+            return None
+        return self.index
+
+
+def precompress(root):
+    """Writes .gz (and .br, if brotli is installed) next to every compressible file under `root`.
+
+    Run at image build time so the first request for each asset doesn't pay
+    for compression: `python -m static_files frontend/dist`.
+    """
+    written = 0
+    for entry in StaticManifest(root).files.values():
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+            body = entry.variant(encoding)
+            if body is not None and len(body) < entry.size and not os.path.isfile(entry.path + suffix):
+                with open(entry.path + suffix, "wb") as f:
+                    f.write(body)
+                written += 1
+    return written
+
+
+if __name__ == "__main__":
+    import sys
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join("frontend", "dist")
+    print(f"Wrote {precompress(folder)} precompressed files under {folder}")
@@ -1,6 +1,21 @@
+"""Regression run of the agent over a question bank.
+
+Questions run concurrently (bounded by --concurrency) and are paced by a
+token bucket (--rate questions per second, bursts of --burst) instead of a
+fixed sleep. Each answer is checked against the expected result shape and
+the results are written to a JSON report.
+
+Usage:
+    python test_agent.py --concurrency 8 --rate 2 --report report.json
+    python test_agent.py --questions nightly_questions.json
+"""
 from agent import app, PROJECT_ID, LOCATION
 import vertexai
 import time
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import rate_limit
 
 # Initialize Vertex AI for local execution
 vertexai.init(
@@ -9,56 +24,159 @@ vertexai.init(
     staging_bucket="gs://ca_api",
 )
 
+# Expected result shapes: `max_rows: 1` for single-value answers, `min_rows: 2`
+# plus `chart` for breakdowns and trends.
+SINGLE_VALUE = {"min_rows": 1, "max_rows": 1}
+BREAKDOWN = {"min_rows": 2, "chart": True}
+
 test_questions = [
-    "What is the average session length for players on Android?",
-    "Show me the lifetime revenue for users we acquired from Vungle.",
-    "What is the D7 retention rate for users who installed the app from 'ironsource'?",
-    "How many users are considered 'Whale' in terms of lifetime spend?",
-    "What is the average number of days played by users?",
-    "What is the total ad revenue generated from sessions in 'Lookerwood Farm' last month?",
-    "How many sessions had a highest level reached greater than 10?",
-    "What is the average number of events per session?",
-    "How many sessions were the first session for a user?",
-    "How many 'iap_purchase' events happened yesterday for 'Lookerwood Farm'?",
-    "What was the total ad revenue from players in Germany last week?",
-    "What is the total IAP revenue for the game 'Lookup Battle Royale' for users who installed from 'organic' sources?",
-    "How many 'Level_Up' events occurred on iOS devices?",
-    "What is the average revenue per user (ARPU) for users who triggered the 'Ad_Watched' event?",
-    "Show me the trend of daily active users for the last 7 days.",
-    "What is the total revenue by country for the last month?",
-    "Break down the number of sessions by device type for the last week.",
-    "Show me user acquisition by source over the last 30 days."
+    {"question": "What is the average session length for players on Android?", "expect": SINGLE_VALUE},
+    {"question": "Show me the lifetime revenue for users we acquired from Vungle.", "expect": SINGLE_VALUE},
+    {"question": "What is the D7 retention rate for users who installed the app from 'ironsource'?", "expect": SINGLE_VALUE},
+    {"question": "How many users are considered 'Whale' in terms of lifetime spend?", "expect": SINGLE_VALUE},
+    {"question": "What is the average number of days played by users?", "expect": SINGLE_VALUE},
+    {"question": "What is the total ad revenue generated from sessions in 'Lookerwood Farm' last month?", "expect": SINGLE_VALUE},
+    {"question": "How many sessions had a highest level reached greater than 10?", "expect": SINGLE_VALUE},
+    {"question": "What is the average number of events per session?", "expect": SINGLE_VALUE},
+    {"question": "How many sessions were the first session for a user?", "expect": SINGLE_VALUE},
+    {"question": "How many 'iap_purchase' events happened yesterday for 'Lookerwood Farm'?", "expect": SINGLE_VALUE},
+    {"question": "What was the total ad revenue from players in Germany last week?", "expect": SINGLE_VALUE},
+    {"question": "What is the total IAP revenue for the game 'Lookup Battle Royale' for users who installed from 'organic' sources?", "expect": SINGLE_VALUE},
+    {"question": "How many 'Level_Up' events occurred on iOS devices?", "expect": SINGLE_VALUE},
+    {"question": "What is the average revenue per user (ARPU) for users who triggered the 'Ad_Watched' event?", "expect": SINGLE_VALUE},
+    {"question": "Show me the trend of daily active users for the last 7 days.", "expect": BREAKDOWN},
+    {"question": "What is the total revenue by country for the last month?", "expect": BREAKDOWN},
+    {"question": "Break down the number of sessions by device type for the last week.", "expect": BREAKDOWN},
+    {"question": "Show me user acquisition by source over the last 30 days.", "expect": BREAKDOWN},
 ]
 
-def run_tests():
-    print(f"Running {len(test_questions)} test questions...\n")
-    
-    for i, question in enumerate(test_questions):
-        print(f"--- Question {i+1}: {question} ---")
-        try:
-            # Use a unique user_id for each test to avoid context pollution if desired, 
-            # or keep it same to test conversational ability. 
-            # Here we use a new session for each question to test them independently.
-            response_stream = app.stream_query(message=question, user_id=f"test_user_{i}")
-            
-            print("Agent: ", end="", flush=True)
-            full_response = ""
-            for chunk in response_stream:
-                if isinstance(chunk, dict) and "content" in chunk:
-                    content = chunk["content"]
-                    if "parts" in content:
-                        for part in content["parts"]:
-                            if "text" in part:
-                                text = part["text"]
-                                print(text, end="", flush=True)
-                                full_response += text
-            print("\n")
-            
-        except Exception as e:
-            print(f"\nError: {e}\n")
-        
-        # Small delay to avoid hitting rate limits too hard
-        time.sleep(2)
+
+def load_questions(path):
+    """Loads a question bank: a JSON list of strings or {"question", "expect"} objects."""
+    with open(path) as f:
+        items = json.load(f)
+    return [item if isinstance(item, dict) else {"question": item} for item in items]
+
+
+def _result_rows(response):
+    """Row count of a get_insights function response (full count if it was summarized)."""
+    for insight in response.get("data_insights") or []:
+        result = insight.get("result") or {}
+        if "row_count" in result:
+            return result["row_count"]
+        if "num_rows" in result:
+            return result["num_rows"]
+        return len(result.get("data") or [])
+    return None
+
+
+def ask(question, user_id):
+    """Runs one question through the agent and collects its answer and usage."""
+    record = {"question": question, "answer": "", "rows": None, "tool_calls": [],
+              "prompt_tokens": 0, "output_tokens": 0, "error": None}
+    started = time.perf_counter()
+    try:
+        for chunk in app.stream_query(message=question, user_id=user_id):
+            if not isinstance(chunk, dict):
+                continue
+            usage = chunk.get("usage_metadata") or {}
+            record["prompt_tokens"] += usage.get("prompt_token_count") or 0
+            record["output_tokens"] += usage.get("candidates_token_count") or 0
+            for part in (chunk.get("content") or {}).get("parts") or []:
+                if "text" in part:
+                    record["answer"] += part["text"]
+                elif "function_call" in part:
+                    record["tool_calls"].append(part["function_call"].get("name"))
+                elif "function_response" in part:
+                    response = part["function_response"].get("response") or {}
+                    if part["function_response"].get("name") == "get_insights":
+                        record["rows"] = _result_rows(response)
+    except Exception as e:
+        record["error"] = str(e)
+    record["latency_s"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def check(record, expect):
+    """Returns the reasons `record` doesn't match the expected shape (empty if it passes)."""
+    failures = []
+    if record["error"]:
+        return [f"error: {record['error']}"]
+    if not record["answer"].strip():
+        failures.append("empty answer")
+    rows = record["rows"]
+    if expect.get("table", True) and "|" not in record["answer"]:
+        failures.append("no data table")
+    if "min_rows" in expect and (rows is None or rows < expect["min_rows"]):
+        failures.append(f"rows {rows} < {expect['min_rows']}")
+    if "max_rows" in expect and rows is not None and rows > expect["max_rows"]:
+        failures.append(f"rows {rows} > {expect['max_rows']}")
+    if expect.get("chart") and "json-chart" not in record["answer"]:
+        failures.append("no chart")
+    return failures
+
+
+def run_tests(questions=None, concurrency=4, rate=1.0, burst=None, report_path=None):
+    questions = questions or test_questions
+    bucket = rate_limit.TokenBucket(rate, burst)
+    print(f"Running {len(questions)} test questions (concurrency {concurrency}, {rate}/s)...\n")
+
+    def run(i, item):
+        bucket.acquire()
+        # A new user (and so a new session) per question keeps them independent
+        record = ask(item["question"], user_id=f"test_user_{i}")
+        record["index"] = i
+        record["failures"] = check(record, item.get("expect", {}))
+        record["passed"] = not record["failures"]
+        return record
+
+    started = time.perf_counter()
+    records = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run, i, item) for i, item in enumerate(questions)]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            status = "PASS" if record["passed"] else "FAIL"
+            print(f"[{status}] Q{record['index'] + 1} {record['latency_s']:.1f}s rows={record['rows']} "
+                  f"tokens={record['prompt_tokens']}+{record['output_tokens']} {record['question']}")
+            for reason in record["failures"]:
+                print(f"       - {reason}")
+    elapsed = time.perf_counter() - started
+
+    records.sort(key=lambda r: r["index"])
+    latencies = sorted(r["latency_s"] for r in records)
+    report = {
+        "total": len(records),
+        "passed": sum(r["passed"] for r in records),
+        "failed": sum(not r["passed"] for r in records),
+        "elapsed_s": round(elapsed, 3),
+        "latency_p50_s": latencies[len(latencies) // 2] if latencies else 0,
+        "latency_max_s": latencies[-1] if latencies else 0,
+        "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+        "output_tokens": sum(r["output_tokens"] for r in records),
+        "results": records,
+    }
+    print(f"\n{report['passed']}/{report['total']} passed in {report['elapsed_s']}s")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {report_path}")
+    return report
+
 
 if __name__ == "__main__":
-    run_tests()
+    parser = argparse.ArgumentParser(description="Run the agent over a question bank.")
+    parser.add_argument("--questions", help="JSON file with the question bank (defaults to the built-in list).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight at once.")
+    parser.add_argument("--rate", type=float, default=1.0, help="Questions started per second.")
+    parser.add_argument("--burst", type=float, default=None, help="Questions that may start at once (default: rate).")
+    parser.add_argument("--report", default="test_report.json", help="Where to write the JSON report.")
+    args = parser.parse_args()
+    run_tests(
+        questions=load_questions(args.questions) if args.questions else None,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+        report_path=args.report,
+    )
@@ -0,0 +1,107 @@
+"""History compaction on real ADK `LlmRequest`s with get_insights call/response pairs."""
+import types as pytypes
+import pytest
+from google.adk.models import LlmRequest
+from google.genai import types
+import compaction
+import model_router
+
+AGENT_MODEL = "gemini-2.5-pro"
+
+
+def _turn(i, rows):
+    call_id = f"call-{i}"
+    data = [{"game": f"game {n}", "players": n * 10} for n in range(rows)]
+    return [
+        types.Content(role="user", parts=[types.Part(text=f"How many players did game {i} have?")]),
+        types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+            id=call_id, name="get_insights", args={"question": f"How many players did game {i} have?"},
+        ))]),
+        types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+            id=call_id, name="get_insights", response={
+                "status": "success",
+                "data_insights": [{"result": {
+                    "schema": {"fields": [{"name": "game"}, {"name": "players"}]},
+                    "data": data,
+                    "row_count": rows,
+                    "result_id": f"result-{i}",
+                }}],
+            },
+        ))]),
+        types.Content(role="model", parts=[types.Part(text=f"Game {i} had {i * 10} players.")]),
+    ]
+
+
+def _request(earlier_turns, rows):
+    contents = []
+    for i in range(earlier_turns):
+        contents.extend(_turn(i, rows))
+    # The current turn, up to the tool result the model is about to read
+    contents.extend(_turn(earlier_turns, rows)[:3])
+    return LlmRequest(model=AGENT_MODEL, contents=contents)
+
+
+def _context():
+    return pytypes.SimpleNamespace(agent_name="root_agent")
+
+
+def _assert_valid_for_adk(llm_request):
+    # Survives ADK's own (pydantic) request schema unchanged
+    assert LlmRequest.model_validate_json(llm_request.model_dump_json()).contents == llm_request.contents
+    contents = llm_request.contents
+    # History still starts with a user message, not an orphaned tool result
+    assert contents[0].role == "user" and contents[0].parts[0].text
+    # Every call is answered by the next content, under the same id and name
+    for i, content in enumerate(contents):
+        for part in content.parts:
+            if part.function_call is not None:
+                answer = contents[i + 1]
+                assert answer.role == "user"
+                responses = [p.function_response for p in answer.parts if p.function_response is not None]
+                assert [(r.id, r.name) for r in responses] == [(part.function_call.id, part.function_call.name)]
+                assert isinstance(responses[0].response, dict)
+
+
+def test_compacts_earlier_tool_outputs_and_keeps_pairs():
+    llm_request = _request(earlier_turns=3, rows=20)
+    current = list(llm_request.contents[-3:])
+    llm_request.contents = compaction.compact_history(llm_request.contents, budget=100_000)
+
+    _assert_valid_for_adk(llm_request)
+    assert len(llm_request.contents) == 3 * 4 + 3
+    for content in llm_request.contents[:-3]:
+        for part in content.parts:
+            if part.function_response is not None:
+                summary = part.function_response.response
+                assert summary["compacted"] is True
+                assert summary["results"][0]["result_id"].startswith("result-")
+    # The current turn is passed through untouched
+    assert all(new is old for new, old in zip(llm_request.contents[-3:], current))
+
+
+def test_dropping_turns_never_splits_a_pair():
+    # Compacted turns are ~150 tokens, so this is well over the default budget
+    llm_request = _request(earlier_turns=80, rows=20)
+    compaction.before_model_callback(_context(), llm_request)
+
+    _assert_valid_for_adk(llm_request)
+    assert 3 < len(llm_request.contents) < 80 * 4 + 3
+
+
+@pytest.mark.skipif(not model_router.MODEL_ROUTING, reason="model routing is disabled")
+def test_budget_follows_the_routed_model():
+    assert compaction.budget_for(model_router.FAST_MODEL) < compaction.budget_for(AGENT_MODEL)
+
+    routed = _request(earlier_turns=80, rows=5)
+    # Routing runs first, as in agent._build_agents
+    model_router.routing_callback()(_context(), routed)
+    assert routed.model == model_router.FAST_MODEL
+    compaction.before_model_callback(_context(), routed)
+
+    unrouted = _request(earlier_turns=80, rows=5)
+    compaction.before_model_callback(_context(), unrouted)
+
+    _assert_valid_for_adk(routed)
+    _assert_valid_for_adk(unrouted)
+    assert 3 < len(routed.contents) < len(unrouted.contents)
+    assert sum(compaction.estimate_tokens(c) for c in routed.contents[:-3]) <= compaction.budget_for(routed.model)
@@ -0,0 +1,57 @@
+"""Ownership of results and runs across token refreshes and workers."""
+import pytest
+import looker_auth
+import result_store
+import results
+import runs
+import state
+
+
+@pytest.fixture
+def shared_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(state, "STATE_BACKEND", "sqlite")
+    monkeypatch.setattr(state, "_store", state.SQLiteStore(str(tmp_path / "state.db")))
+    yield state.get_store()
+
+
+def _other_worker(monkeypatch):
+    # A second process has none of this one's in-memory state
+    monkeypatch.setattr(looker_auth, "_records", type(looker_auth._records)())
+    result_store._store.clear()
+
+
+def _result():
+    return results.ColumnarResult.from_rows([{"name": "players"}], [{"players": 1}])
+
+
+def test_owner_survives_a_refresh():
+    record = looker_auth.remember({"access_token": "first", "expires_in": 3600, "refresh_token": "r"})
+    owner = looker_auth.owner_key("first")
+    # What _refresh does with the token endpoint's response
+    record.access_token = "second"
+    looker_auth._store("second", record)
+
+    assert looker_auth.owner_key("second") == owner
+    looker_auth.forget("second")
+    assert looker_auth.owner_key("second") != owner
+
+
+def test_other_workers_resolve_the_same_owner(shared_store, monkeypatch):
+    looker_auth.remember({"access_token": "token", "expires_in": 3600, "refresh_token": "r"})
+    owner = looker_auth.owner_key("token")
+    result_id = result_store.put(_result(), owner)
+    run = runs.RunRegistry(store=shared_store).start(owner)
+
+    _other_worker(monkeypatch)
+    assert looker_auth.owner_key("token") == owner
+    assert result_store.get(result_id, looker_auth.owner_key("token")) is not None
+    assert runs.RunRegistry(store=shared_store).get(run.run_id, looker_auth.owner_key("token")) is not None
+
+
+def test_logout_on_another_worker_ends_the_sign_in(shared_store, monkeypatch):
+    looker_auth.remember({"access_token": "token", "expires_in": 3600})
+    owner = looker_auth.owner_key("token")
+
+    _other_worker(monkeypatch)
+    looker_auth.forget("token")
+    assert looker_auth.owner_key("token") != owner
@@ -0,0 +1,79 @@
+"""Prefetched suggestions are served from the insights cache when the user picks them.
+
+Runs server.py against the offline fakes in bench/fakes.py, which pass the
+user's message to get_insights verbatim, as ROOT_AGENT_INSTRUCTION asks the
+root agent to.
+"""
+import time
+import pytest
+from bench import fakes
+
+SUGGESTION = "Break this down by country?"
+
+
+@pytest.fixture
+def client():
+    fake_client, fake_app = fakes.install(fakes.StreamProfile(rows=5, chunks=1), fakes.StreamProfile(chunks=1))
+    import agent
+    import server
+    agent.insights_cache.clear()
+    # The questions the agent passes to the get_insights tool
+    questions = []
+
+    def get_insights(question):
+        questions.append(question)
+        return agent.get_insights(question)
+
+    fake_app.get_insights = get_insights
+    yield server.app.test_client(), fake_client, server.prefetcher, questions
+
+
+def _chat(test_client, message, **extra):
+    response = test_client.post('/chat', json=dict(message=message, user_id="u", session_id="s", **extra))
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def _wait_for_prefetches(prefetcher, timeout=10):
+    deadline = time.monotonic() + timeout
+    while prefetcher.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not prefetcher.stats()["pending"]
+
+
+def test_clicked_suggestion_hits_prefetched_entry(client):
+    test_client, fake_client, prefetcher, questions = client
+    body = _chat(test_client, "How many players do we have?", prefetch=True)
+    assert f"SUGGESTION: {SUGGESTION}" in body
+    _wait_for_prefetches(prefetcher)
+    # The turn itself and the prefetched suggestion
+    assert fake_client.calls == 2
+
+    body = _chat(test_client, SUGGESTION)
+    assert "DATA:" in body
+    assert questions[-1] == SUGGESTION
+    assert fake_client.calls == 2
+
+
+def test_suggestion_differing_in_whitespace_and_punctuation_still_hits(client):
+    test_client, fake_client, prefetcher, questions = client
+    _chat(test_client, "How many players do we have?", prefetch=True)
+    _wait_for_prefetches(prefetcher)
+    calls = fake_client.calls
+
+    _chat(test_client, "  Break this  down by country ")
+    assert fake_client.calls == calls
+
+
+def test_questions_differing_in_case_are_cached_apart(client):
+    test_client, fake_client, _, _ = client
+    _chat(test_client, "Revenue for country 'US'")
+    _chat(test_client, "Revenue for country 'us'")
+    assert fake_client.calls == 2
+
+
+def test_zero_rate_turns_prefetching_off():
+    import prefetch
+    prefetcher = prefetch.Prefetcher(rate=0)
+    assert prefetcher.submit(("user", "u"), [SUGGESTION]) == 0
+    assert prefetcher.stats()["pending"] == 0
@@ -0,0 +1,80 @@
+"""What the model sees of large results, and what the frontend loads instead."""
+import pytest
+from bench import fakes
+import charts
+import results
+
+FIELDS = [
+    {"name": "events.event_date", "display_name": "Event Date", "type": "DATE"},
+    {"name": "events.revenue", "display_name": "Revenue", "category": "MEASURE"},
+]
+
+
+def _series(n):
+    rows = [{"events.event_date": f"2024-01-{i:04d}", "events.revenue": i} for i in range(n)]
+    return results.ColumnarResult.from_rows(FIELDS, rows)
+
+
+def _response(result):
+    return {"status": "success", "data_insights": [{"result": result}], "chart": charts.build_chart(result)}
+
+
+def test_handed_off_result_leaves_chart_data_server_side():
+    result = _series(500)
+    result.extras["result_id"] = "r1"
+
+    out = results.materialize(_response(result), handoff_rows=100, sample_rows=20)
+    assert out["data_insights"][0]["result"]["truncated"] is True
+    assert "data" not in out["chart"]
+    assert out["chart"]["result_id"] == "r1"
+    assert out["chart"]["type"] == "line"
+
+
+def test_small_result_keeps_its_chart_inline():
+    result = _series(50)
+    result.extras["result_id"] = "r2"
+
+    out = results.materialize(_response(result), handoff_rows=100)
+    assert len(out["chart"]["data"]) == 50
+    assert "result_id" not in out["chart"]
+
+
+@pytest.fixture
+def stored():
+    fakes.install(fakes.StreamProfile(), fakes.StreamProfile())
+    import agent
+    import looker_auth
+    import server
+    result = _series(500)
+    result_id = agent.result_store.put(result, looker_auth.owner_key(None))
+    return server.app.test_client(), result_id
+
+
+def test_frontend_loads_the_full_chart_by_result_id(stored):
+    test_client, result_id = stored
+    response = test_client.get(f"/api/results/{result_id}/chart")
+    assert response.status_code == 200
+    assert len(response.json["data"]) == charts.MAX_POINTS
+    assert test_client.get("/api/results/unknown/chart").status_code == 404
+
+
+def test_model_facing_rows_carry_display_labels():
+    result = _series(500)
+    result.extras["result_id"] = "r3"
+    labels = result.labels()
+    assert set(labels.values()) == {"Event Date", "Revenue"}
+
+    summary = results.materialize(_response(result), handoff_rows=100, labeled=True)["data_insights"][0]["result"]
+    assert set(summary["data"][0]) == set(labels.values())
+    assert set(summary["stats"]) == set(labels.values())
+    small = results.materialize(_response(_series(5)), handoff_rows=100, labeled=True)["data_insights"][0]["result"]
+    assert set(small["data"][0]) == set(labels.values())
+    # The API keeps field names
+    raw = results.materialize(_response(_series(5)))["data_insights"][0]["result"]
+    assert set(raw["data"][0]) == set(labels)
+
+
+def test_columns_sharing_a_label_keep_their_names():
+    fields = [{"name": "a.revenue", "label": "Revenue"}, {"name": "b.revenue", "label": "Revenue"}]
+    result = results.ColumnarResult.from_rows(fields, [{"a.revenue": 1, "b.revenue": 2}])
+    assert list(result.rows(labeled=True)) == [{"a.revenue": 1, "b.revenue": 2}]